@@ -1,7 +1,10 @@
 # config/settings.py
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
+import importlib.util
 import os
+import tempfile
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +40,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'payments.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Static files uchun
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -68,12 +72,117 @@ TEMPLATES = [
 WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
-DATABASES = {
+# DB_PROFILE:
+# - sqlite (default): WAL, synchronous=NORMAL, busy timeout, mmap va BEGIN IMMEDIATE -
+#   parallel yozuvlar "database is locked" o'rniga navbat kutadi
+# - sqlite-default: Django standart SQLite sozlamalari (benchmarkda solishtirish uchun)
+# - postgresql: doimiy ulanishlar (CONN_MAX_AGE + health check) yoki DB_POOL=True
+#   bilan psycopg pool (requirements.txt dagi psycopg[binary,pool])
+# Eski DB_ENGINE=django.db.backends.postgresql ham postgresql profilini tanlaydi.
+DB_ENGINE = config('DB_ENGINE', default='django.db.backends.sqlite3')
+DB_PROFILE = config('DB_PROFILE', default='postgresql' if DB_ENGINE == 'django.db.backends.postgresql' else 'sqlite')
+DB_PROFILES = ['sqlite', 'sqlite-default', 'postgresql']
+if DB_PROFILE not in DB_PROFILES:
+    raise ImproperlyConfigured(f"DB_PROFILE: {', '.join(DB_PROFILES)}")
+
+# ASGI da Django doimiy ulanishlari tavsiya etilmaydi (PostgreSQL da DB_POOL ishlating)
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=0 if config('SERVER_MODE', default='wsgi') == 'asgi' else 60,
+                         cast=int)
+
+if DB_PROFILE == 'postgresql':
+    if not (importlib.util.find_spec('psycopg') or importlib.util.find_spec('psycopg2')):
+        raise ImproperlyConfigured("DB_PROFILE=postgresql uchun psycopg kerak: pip install -r requirements.txt")
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='sebmarket'),
+            'USER': config('DB_USER', default='postgres'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+            },
+        }
+    }
+    if config('DB_POOL', default=False, cast=bool):
+        if not (importlib.util.find_spec('psycopg') and importlib.util.find_spec('psycopg_pool')):
+            raise ImproperlyConfigured("DB_POOL=True uchun psycopg 3 va psycopg_pool kerak: pip install 'psycopg[pool]'")
+        # Pool ulanishlarni o'zi saqlaydi - Django doimiy ulanishlari bilan birga ishlamaydi
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / config('DB_NAME', default='db.sqlite3'),
+            # Testlar fayl bazada: parallel callback testlari har biri o'z ulanishini ochadi
+            # (in-memory shared cache da yozuvlar busy timeout siz "table is locked" beradi)
+            'TEST': {'NAME': os.path.join(tempfile.gettempdir(), 'sebmarket-test.sqlite3')},
+        }
+    }
+    if DB_PROFILE == 'sqlite':
+        DATABASES['default'].update({
+            # Ulanish har so'rovda ochilmaydi (PRAGMA lar ham bir marta)
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # busy timeout (sekund): qulf bo'shashini shuncha kutadi
+                'timeout': config('DB_SQLITE_BUSY_TIMEOUT', default=20, cast=int),
+                # Tranzaksiya boshidanoq yozish qulfi: DEFERRED da o'qib, keyin yozmoqchi
+                # bo'lgan tranzaksiya kutmasdan "database is locked" oladi
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={config('DB_SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int)};"
+                ),
+            },
+        })
+
+# O'qish replikalari (payments/replicas.py): DB_REPLICAS - vergul bilan; SQLite da fayl
+# nomlari, PostgreSQL da host yoki host:port (qolgan sozlamalar default dan).
+# Yozuvdan keyin foydalanuvchi REPLICA_STICKY_SECONDS davomida primary dan o'qiydi -
+# replikatsiya kechikishidan katta bo'lishi kerak (manage.py check_replicas).
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, config('DB_REPLICAS', default='').split(',')), 1):
+    alias = f'replica{index}'
+    DATABASES[alias] = dict(DATABASES['default'], OPTIONS=dict(DATABASES['default'].get('OPTIONS', {})),
+                            TEST={'MIRROR': 'default'})
+    if DB_PROFILE == 'postgresql':
+        host, _, port = replica.strip().partition(':')
+        DATABASES[alias].update(HOST=host, PORT=port or DATABASES['default']['PORT'])
+    else:
+        DATABASES[alias]['NAME'] = BASE_DIR / replica.strip()
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['payments.replicas.ReplicaRouter'] if DATABASE_REPLICAS else []
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+# Cache
+# Bir nechta gunicorn worker (va sidecar) bo'lsa umumiy backend kerak - docker-compose
+# Redis beradi (CACHE_BACKEND=django.core.cache.backends.redis.RedisCache,
+# CACHE_LOCATION=redis://redis:6379/0). LocMem faqat shu process ichida.
+CACHES = {
     'default': {
-        'ENGINE': config('DB_ENGINE', default='django.db.backends.sqlite3'),
-        'NAME': BASE_DIR / config('DB_NAME', default='db.sqlite3'),
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='sebmarket'),
     }
 }
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+SHARED_CACHE = CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+# Tarif katalogi versiyasi: umumiy cache'da muddatsiz; process ichidagi cache'da
+# shuncha sekund (boshqa workerdagi tarif o'zgarishi shu vaqt ichida ko'rinadi)
+TARIFF_VERSION_TTL = config('TARIFF_VERSION_TTL', default=5, cast=int)
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -114,6 +223,79 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Async API (ASGI rejimi)
+# True bo'lsa get_tariffs, create_user, get_balance, check_payment_status va
+# payme callback async view'lar orqali ishlaydi (SERVER_MODE=asgi bilan ishlating)
+API_ASYNC = config('API_ASYNC', default=False, cast=bool)
+
+# Web workerlar soni (entrypoint.sh eksport qiladi) - process ichidagi keshlar
+# faqat bitta worker bilan to'g'ri
+GUNICORN_WORKERS = config('GUNICORN_WORKERS', default=1, cast=int)
+
+# get_balance keshi: CACHES dagi alias (umumiy cache bo'lsa 'default'),
+# 'lru' - process ichida (faqat bitta worker), 'off' - keshsiz
+BALANCE_CACHE_BACKEND = config(
+    'BALANCE_CACHE_BACKEND',
+    default='default' if SHARED_CACHE else 'lru' if GUNICORN_WORKERS <= 1 else 'off',
+)
+BALANCE_CACHE_SIZE = config('BALANCE_CACHE_SIZE', default=10000, cast=int)
+BALANCE_CACHE_TIMEOUT = config('BALANCE_CACHE_TIMEOUT', default=300, cast=int)
+if GUNICORN_WORKERS > 1 and (
+    BALANCE_CACHE_BACKEND == 'lru'
+    or BALANCE_CACHE_BACKEND in CACHES and CACHES[BALANCE_CACHE_BACKEND]['BACKEND'] in PROCESS_LOCAL_CACHES
+):
+    # Boshqa workerdagi commit bu keshni yaroqsiz qila olmaydi - eskirgan balans
+    raise ImproperlyConfigured(
+        f"BALANCE_CACHE_BACKEND={BALANCE_CACHE_BACKEND} process ichida, GUNICORN_WORKERS={GUNICORN_WORKERS}: "
+        "umumiy cache (CACHE_BACKEND=...RedisCache) yoki BALANCE_CACHE_BACKEND=off ishlating"
+    )
+
+# To'lov holatini kutish: long-poll va SSE uchun maksimal vaqt (sekund)
+PAYMENT_WAIT_TIMEOUT = config('PAYMENT_WAIT_TIMEOUT', default=25, cast=int)
+PAYMENT_EVENTS_TIMEOUT = config('PAYMENT_EVENTS_TIMEOUT', default=300, cast=int)
+# WSGI (API_ASYNC=False): kutish o'rniga mijozga qayta so'rash oralig'i (sekund)
+PAYMENT_POLL_INTERVAL = config('PAYMENT_POLL_INTERVAL', default=2, cast=int)
+# Kutuvchilarni boshqa processdan uyg'otish (payments/payment_events.py): 'redis' (PUBLISH),
+# 'postgres' (LISTEN/NOTIFY) yoki '' - faqat zaxira polling
+PAYMENT_EVENTS_BROKER = config(
+    'PAYMENT_EVENTS_BROKER',
+    default='redis' if CACHES['default']['BACKEND'] == 'django.core.cache.backends.redis.RedisCache'
+    else 'postgres' if DB_PROFILE == 'postgresql' else '',
+)
+if PAYMENT_EVENTS_BROKER not in ('', 'redis', 'postgres'):
+    raise ImproperlyConfigured("PAYMENT_EVENTS_BROKER: redis, postgres yoki bo'sh")
+PAYMENT_EVENTS_REDIS_URL = config('PAYMENT_EVENTS_REDIS_URL',
+                                  default=CACHES['default']['LOCATION'] if PAYMENT_EVENTS_BROKER == 'redis' else '')
+
+# create_payment Idempotency-Key saqlanish muddati (sekund)
+IDEMPOTENCY_TTL = config('IDEMPOTENCY_TTL', default=24 * 60 * 60, cast=int)
+
+# Outbox: to'lov hodisalarini botga yetkazish (python manage.py dispatch_outbox --loop)
+BOT_NOTIFY_URL = config('BOT_NOTIFY_URL', default='')
+BOT_NOTIFY_TOKEN = config('BOT_NOTIFY_TOKEN', default='')
+BOT_NOTIFY_TIMEOUT = config('BOT_NOTIFY_TIMEOUT', default=5, cast=float)
+OUTBOX_HTTP_POOL_SIZE = config('OUTBOX_HTTP_POOL_SIZE', default=10, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=10, cast=int)
+OUTBOX_LEASE_SECONDS = config('OUTBOX_LEASE_SECONDS', default=60, cast=int)
+OUTBOX_BACKOFF_BASE = config('OUTBOX_BACKOFF_BASE', default=2, cast=float)
+OUTBOX_BACKOFF_MAX = config('OUTBOX_BACKOFF_MAX', default=600, cast=float)
+
+# Eskirgan buyurtmalar (python manage.py reap_stale_orders --loop): shundan eski STATE_CREATED
+# to'lovlar bekor qilinadi (reason 4). Payme tranzaksiya muddati - 12 soat
+PAYMENT_ORDER_TIMEOUT = config('PAYMENT_ORDER_TIMEOUT', default=12 * 60 * 60, cast=int)
+
+# PricingHistory arxivi: oxirgi N oy live jadvalda, eskilari siqilgan fayllarda
+HISTORY_ARCHIVE_DIR = config('HISTORY_ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+PRICING_HISTORY_LIVE_MONTHS = config('PRICING_HISTORY_LIVE_MONTHS', default=3, cast=int)
+
+# Rolluplar (python manage.py update_rollups --loop): shundan yangi qatorlar keyingi yugurishda
+ROLLUP_SAFETY_LAG = config('ROLLUP_SAFETY_LAG', default=60, cast=int)
+
+# Metrikalar (Prometheus): har bir worker METRICS_DIR ga o'z faylini yozadi
+METRICS_DIR = config('METRICS_DIR', default=os.path.join(tempfile.gettempdir(), 'sebmarket-metrics'))
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=2, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # bo'sh bo'lmasa Bearer token, bo'sh - faqat ichki tarmoq
+
 # Payme Settings
 PAYME_SETTINGS = {
     'MERCHANT_ID': config('PAYME_MERCHANT_ID', default=''),
@@ -125,6 +307,12 @@ PAYME_SETTINGS = {
 }
 
 # Logging
+# Barcha loggerlar 'queue' handlerga yozadi: request thread faqat navbatga qo'yadi,
+# console/file ga yozish fon threadida (config/log.py)
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOG_FORMAT = config('LOG_FORMAT', default='json')  # json | verbose
+LOG_SAMPLE_RATES = config('LOG_SAMPLE_RATES', default='payme=0.1')  # faqat WARNING dan past yozuvlar
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -133,33 +321,58 @@ LOGGING = {
             'format': '{levelname} {asctime} {module} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'config.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'redact': {
+            '()': 'config.log.RedactSecretsFilter',
+            'secrets': [PAYME_SETTINGS['SECRET_KEY'], BOT_NOTIFY_TOKEN],
+        },
+        'sample': {
+            '()': 'config.log.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
     },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
+            'filters': ['redact'],
         },
         'file': {
             'class': 'logging.handlers.RotatingFileHandler',
             'filename': BASE_DIR / 'logs' / 'django.log',
             'maxBytes': 1024 * 1024 * 5,  # 5 MB
             'backupCount': 5,
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
+            'filters': ['redact'],
+        },
+        'queue': {
+            '()': 'config.log.QueueListenerHandler',
+            'handlers': ['cfg://handlers.console', 'cfg://handlers.file'],
+            'filters': ['sample'],
         },
     },
     'root': {
-        'handlers': ['console', 'file'],
+        'handlers': ['queue'],
         'level': 'INFO',
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
         'payments': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        'payme': {
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
             'propagate': False,
         },
     },
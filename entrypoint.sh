@@ -1,16 +1,43 @@
 #!/bin/sh
 set -e
 
-echo "==> Migrationlarni ishga tushiramiz..."
-python manage.py migrate --noinput
+# RUN_SETUP=0: migrate/collectstatic ni web bajaradi (masalan `events` servisi)
+if [ "${RUN_SETUP:-1}" = "1" ]; then
+    echo "==> Migrationlarni ishga tushiramiz..."
+    python manage.py migrate --noinput
 
-echo "==> Static fayllarni yig'amiz..."
-python manage.py collectstatic --noinput --clear
+    echo "==> Qidiruv indeksi (bo'sh bo'lsa to'ldiriladi)..."
+    python manage.py rebuild_search_index --if-empty
+
+    echo "==> Static fayllarni yig'amiz..."
+    python manage.py collectstatic --noinput --clear
+fi
+
+# settings.py ham o'qiydi: process ichidagi keshlar bir nechta workerda ishlatilmaydi
+export GUNICORN_WORKERS=${GUNICORN_WORKERS:-3}
+
+# Oldingi ishga tushirishdan qolgan worker metrikalari
+export METRICS_DIR=${METRICS_DIR:-/tmp/sebmarket-metrics}
+rm -rf "$METRICS_DIR"
+
+if [ "$SERVER_MODE" = "asgi" ]; then
+    # ASGI: uvicorn workerlar, API_ASYNC=True bilan async view'lar
+    echo "==> Gunicorn (ASGI, uvicorn worker) ishga tushirilmoqda..."
+    export API_ASYNC=${API_ASYNC:-True}
+    exec gunicorn \
+        --bind 0.0.0.0:8000 \
+        --workers "$GUNICORN_WORKERS" \
+        --worker-class uvicorn_worker.UvicornWorker \
+        --timeout 120 \
+        --access-logfile - \
+        --error-logfile - \
+        config.asgi:application
+fi
 
 echo "==> Gunicorn ishga tushirilmoqda..."
 exec gunicorn \
     --bind 0.0.0.0:8000 \
-    --workers 3 \
+    --workers "$GUNICORN_WORKERS" \
     --timeout 120 \
     --access-logfile - \
     --error-logfile - \
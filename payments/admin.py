@@ -1,9 +1,53 @@
 # payments/admin.py - FIXED: TypeError in format_html
 
-from django.contrib import admin
+import io
+import itertools
+from datetime import datetime
+
+from django import forms
+from django.contrib import admin, messages
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe  # ✅ ADDED
-from .models import PricingTariff, BotUser, Payment, PricingHistory
+from . import balance_grants, exports, history_archive, rollups
+from .admin_pagination import ScalableAdminMixin
+from .models import (
+    PricingTariff, BotUser, Payment, PricingHistory, HistoryArchive, DailyUserUsage, DailyTariffRevenue,
+    BalanceGrant, BalanceGrantBatch,
+)
+
+
+class ExportActionsMixin:
+    """
+    Tanlangan (yoki "hammasini tanlash" bilan filtrlangan) qatorlarni oqim bilan
+    eksport qilish (exports.py). export_columns / export_rows ni admin beradi.
+    """
+    actions = ['export_csv', 'export_csv_gzip', 'export_jsonl']
+    export_columns = ()
+    export_name = 'export'
+
+    def export_rows(self, queryset):
+        return exports.iter_rows(queryset, self.export_columns)
+
+    def _export(self, queryset, fmt, compress=False):
+        name = f"{self.export_name}-{timezone.localtime():%Y%m%d-%H%M}"
+        return exports.streaming_response(self.export_rows(queryset), self.export_columns, fmt, compress, name)
+
+    @admin.action(description="Eksport: CSV", permissions=['view'])
+    def export_csv(self, request, queryset):
+        return self._export(queryset, exports.CSV)
+
+    @admin.action(description="Eksport: CSV (gzip)", permissions=['view'])
+    def export_csv_gzip(self, request, queryset):
+        return self._export(queryset, exports.CSV, compress=True)
+
+    @admin.action(description="Eksport: JSONL", permissions=['view'])
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, exports.JSONL)
 
 
 @admin.register(PricingTariff)
@@ -25,10 +69,13 @@ class PricingTariffAdmin(admin.ModelAdmin):
 
 
 @admin.register(BotUser)
-class BotUserAdmin(admin.ModelAdmin):
+class BotUserAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['telegram_id', 'full_name', 'username', 'balance', 'is_active', 'created_at']
     list_filter = ['is_active', 'created_at']
-    search_fields = ['telegram_id', 'full_name', 'username']
+    search_fields = ['telegram_id', 'full_name', 'username', 'phone']
+    search_int_fields = ['telegram_id']
+    search_index_kind = 'user'
+    search_prefix_fields = ['username', 'full_name']
     readonly_fields = ['telegram_id', 'created_at', 'updated_at']
     ordering = ['-created_at']
 
@@ -50,7 +97,7 @@ class BotUserAdmin(admin.ModelAdmin):
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ExportActionsMixin, ScalableAdminMixin, admin.ModelAdmin):
     """
     ✅ BARCHA MUAMMOLAR YECHILDI:
     - order_id qo'shildi
@@ -72,15 +119,20 @@ class PaymentAdmin(admin.ModelAdmin):
     ]
 
     list_filter = ['state', 'created_at']
+    list_select_related = ['user', 'tariff']
 
+    # Qidiruv indeksli maydonlar bo'yicha (ScalableAdminMixin.get_search_results)
     search_fields = [
         'id',
         'order_id',
         'payme_transaction_id',
         'user__telegram_id',
-        'user__full_name',
-        'user__username'
     ]
+    search_int_fields = ['id', 'user__telegram_id']
+    search_exact_fields = ['order_id', 'payme_transaction_id']
+    search_index_kind = 'payment'
+    export_columns = exports.PAYMENT_COLUMNS
+    export_name = 'payments'
 
     readonly_fields = [
         'id',
@@ -178,7 +230,7 @@ class PaymentAdmin(admin.ModelAdmin):
             '<a href="/admin/payments/botuser/{}/change/" '
             'style="text-decoration: none; color: #417690; font-weight: 500;">'
             '👤 {}</a>',
-            obj.user.id,
+            obj.user_id,
             obj.user.full_name
         )
 
@@ -225,12 +277,76 @@ class PaymentAdmin(admin.ModelAdmin):
 
 
 @admin.register(PricingHistory)
-class PricingHistoryAdmin(admin.ModelAdmin):
+class PricingHistoryAdmin(ExportActionsMixin, ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['user_link', 'phone_model', 'formatted_price', 'created_at']
     list_filter = ['created_at']
-    search_fields = ['user__telegram_id', 'user__full_name', 'phone_model']
+    list_select_related = ['user']
+    search_fields = ['user__telegram_id', 'phone_model']
+    search_int_fields = ['user__telegram_id']
+    search_index_kind = 'phone_model'
+    search_prefix_fields = ['phone_model']
+    export_columns = exports.HISTORY_COLUMNS
+    export_name = 'pricing-history'
     readonly_fields = ['user', 'phone_model', 'price', 'created_at']
     ordering = ['-created_at']
+    change_list_template = 'admin/payments/pricinghistory/change_list.html'
+
+    ARCHIVE_PAGE_SIZE = 100
+
+    def get_urls(self):
+        return [
+            path('all/', self.admin_site.admin_view(self.all_history_view), name='payments_pricinghistory_all'),
+        ] + super().get_urls()
+
+    def all_history_view(self, request):
+        """
+        Live + arxivlangan tarix (history_archive.iter_history): telegram_id va oy
+        bo'yicha filtr, (created_at, id) keyset sahifalash.
+        """
+        telegram_id = request.GET.get('telegram_id', '').strip()
+        month = request.GET.get('month', '').strip()
+        user_id, start, end, before = None, None, None, None
+        error = None
+
+        if telegram_id:
+            user_id = BotUser.objects.filter(telegram_id=telegram_id if telegram_id.isdigit() else 0) \
+                .values_list('id', flat=True).first()
+            if user_id is None:
+                error = "Foydalanuvchi topilmadi"
+        if month:
+            try:
+                start = history_archive.month_start(datetime.strptime(month, '%Y-%m'))
+                end = history_archive.add_months(start, 1)
+            except ValueError:
+                error = "Oy formati: YYYY-MM"
+        cursor_at, cursor_id = request.GET.get('before_at'), request.GET.get('before_id', '')
+        if cursor_at and cursor_id.isdigit():
+            before = (parse_datetime(cursor_at), int(cursor_id))
+
+        rows = []
+        if error is None:
+            rows = list(itertools.islice(
+                history_archive.iter_history(user_id=user_id, before=before, start=start, end=end),
+                self.ARCHIVE_PAGE_SIZE + 1,
+            ))
+        next_cursor = None
+        if len(rows) > self.ARCHIVE_PAGE_SIZE:
+            rows = rows[:self.ARCHIVE_PAGE_SIZE]
+            next_cursor = {'before_at': rows[-1]['created_at'].isoformat(), 'before_id': rows[-1]['id']}
+
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title="Narxlash tarixi (live + arxiv)",
+            rows=rows,
+            error=error,
+            telegram_id=telegram_id,
+            month=month,
+            next_cursor=next_cursor,
+            archives=HistoryArchive.objects.all()[:24],
+            live_since=history_archive.archive_cutoff(timezone.now()),
+        )
+        return TemplateResponse(request, 'admin/payments/pricinghistory/all_history.html', context)
 
     def user_link(self, obj):
         """
@@ -248,7 +364,7 @@ class PricingHistoryAdmin(admin.ModelAdmin):
             '<a href="/admin/payments/botuser/{}/change/" '
             'style="text-decoration: none; color: #417690; font-weight: 500;">'
             '👤 {}</a>',
-            obj.user.id,
+            obj.user_id,
             obj.user.full_name
         )
 
@@ -265,4 +381,197 @@ class PricingHistoryAdmin(admin.ModelAdmin):
 
     def has_change_permission(self, request, obj=None):
         """O'zgartirish taqiqlangan"""
-        return False
\ No newline at end of file
+        return False
+
+
+@admin.register(HistoryArchive)
+class HistoryArchiveAdmin(admin.ModelAdmin):
+    list_display = ['month', 'rows', 'total_price', 'size_bytes', 'per_user', 'path', 'created_at']
+    readonly_fields = ['month', 'path', 'rows', 'total_price', 'size_bytes', 'sha256', 'per_user', 'created_at']
+    ordering = ['-month']
+
+    def has_add_permission(self, request):
+        """Arxivlar faqat archive_pricing_history orqali yaratiladi"""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+
+@admin.register(DailyUserUsage)
+class DailyUserUsageAdmin(admin.ModelAdmin):
+    list_display = ['day', 'user', 'pricing_count', 'price_sum']
+    list_filter = ['day']
+    list_select_related = ['user']
+    search_fields = ['user__telegram_id']
+    ordering = ['-day']
+
+    def has_add_permission(self, request):
+        """Rolluplar faqat update_rollups orqali yoziladi"""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailyTariffRevenue)
+class DailyTariffRevenueAdmin(admin.ModelAdmin):
+    list_display = ['day', 'tariff_ref', 'payments_count', 'revenue']
+    list_filter = ['day']
+    ordering = ['-day']
+    change_list_template = 'admin/payments/dailytariffrevenue/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='payments_rollup_dashboard'),
+        ] + super().get_urls()
+
+    def dashboard_view(self, request):
+        """Oxirgi N kun: narxlashlar va tushum - faqat rollup jadvallaridan"""
+        days = request.GET.get('days', '30')
+        days = min(int(days), 366) if days.isdigit() and int(days) > 0 else 30
+        start, end = rollups.report_range(days=days)
+
+        usage, usage_total = rollups.usage_report(start, end)
+        revenue, tariffs = rollups.revenue_report(start, end)
+
+        by_day = {row['day']: {'day': row['day'], 'pricing_count': row['pricing_count'],
+                               'price_sum': row['price_sum'], 'users': row['users'],
+                               'payments_count': 0, 'revenue': 0} for row in usage}
+        for row in revenue:
+            item = by_day.setdefault(row['day'], {'day': row['day'], 'pricing_count': 0, 'price_sum': 0,
+                                                  'users': 0, 'payments_count': 0, 'revenue': 0})
+            item['payments_count'] += row['payments_count']
+            item['revenue'] += row['revenue']
+
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title=f"Statistika: oxirgi {days} kun",
+            days=days,
+            rows=sorted(by_day.values(), key=lambda item: item['day'], reverse=True),
+            usage_total=usage_total,
+            tariffs=tariffs,
+            revenue_total=sum(t['revenue'] for t in tariffs),
+            freshness=rollups.freshness(),
+        )
+        return TemplateResponse(request, 'admin/payments/dailytariffrevenue/dashboard.html', context)
+
+    def has_add_permission(self, request):
+        """Rolluplar faqat update_rollups orqali yoziladi"""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class BalanceGrantForm(forms.Form):
+    reason = forms.CharField(label="Sabab", max_length=255)
+    delta = forms.IntegerField(label="O'zgarish", help_text="Har bir userga; manfiy - olish (0 dan pastga tushmaydi)")
+    csv_file = forms.FileField(label="CSV fayl", required=False,
+                               help_text="telegram_id ustuni (yoki birinchi ustun). Berilsa filtr ishlatilmaydi")
+    is_active = forms.BooleanField(label="Faqat faol userlar", required=False)
+    created_before = forms.DateField(label="Ro'yxatdan o'tgan (gacha)", required=False,
+                                     widget=forms.DateInput(attrs={'type': 'date'}))
+    created_after = forms.DateField(label="Ro'yxatdan o'tgan (dan)", required=False,
+                                    widget=forms.DateInput(attrs={'type': 'date'}))
+    all_users = forms.BooleanField(label="Barcha userlar", required=False,
+                                   help_text="CSV va filtr bo'lmasa - aniq tasdiq")
+
+    def clean(self):
+        data = super().clean()
+        if data.get('delta') == 0:
+            self.add_error('delta', "0 bo'lmasligi kerak")
+        has_filter = data.get('is_active') or data.get('created_before') or data.get('created_after')
+        if data.get('csv_file') and has_filter:
+            raise forms.ValidationError("CSV va filtr birga ishlatilmaydi")
+        if not data.get('csv_file') and not has_filter and not data.get('all_users'):
+            raise forms.ValidationError("CSV fayl, filtr yoki \"Barcha userlar\" kerak")
+        return data
+
+
+class BalanceGrantBatchInline(admin.TabularInline):
+    model = BalanceGrantBatch
+    fields = ['number', 'first_target_id', 'last_target_id', 'users', 'balance_change', 'created_at']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BalanceGrant)
+class BalanceGrantAdmin(admin.ModelAdmin):
+    """
+    Ommaviy balans ishlari: yaratish (CSV yoki filtr) shu so'rovda bajariladi -
+    100k user bir necha soniya. Uzilgan ish "Davom ettirish" actioni yoki
+    grant_balance --resume bilan tugatiladi.
+    """
+    list_display = ['id', 'reason', 'delta', 'source', 'status', 'progress', 'balance_change', 'created_by',
+                    'created_at', 'finished_at']
+    list_filter = ['status', 'source']
+    readonly_fields = ['reason', 'delta', 'source', 'criteria', 'status', 'total_users', 'processed_users',
+                       'updated_users', 'balance_change', 'batches', 'last_target_id', 'created_by', 'last_error',
+                       'created_at', 'started_at', 'finished_at']
+    inlines = [BalanceGrantBatchInline]
+    actions = ['resume']
+
+    def progress(self, obj):
+        if not obj.total_users:
+            return '-'
+        return f"{obj.processed_users}/{obj.total_users} ({obj.processed_users * 100 // obj.total_users}%)"
+
+    progress.short_description = 'Jarayon'
+
+    def add_view(self, request, form_url='', extra_context=None):
+        form = BalanceGrantForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            data = form.cleaned_data
+            user = request.user.get_username()
+            if data['csv_file']:
+                lines = io.TextIOWrapper(data['csv_file'].file, encoding='utf-8-sig', newline='')
+                grant = balance_grants.create_from_csv(lines, data['delta'], data['reason'], created_by=user,
+                                                       filename=data['csv_file'].name)
+            else:
+                grant = balance_grants.create_from_filter(
+                    data['delta'], data['reason'], is_active=True if data['is_active'] else None,
+                    created_before=balance_grants.day_start(data['created_before']),
+                    created_after=balance_grants.day_start(data['created_after']),
+                    created_by=user,
+                )
+            self._run(request, grant)
+            return HttpResponseRedirect(reverse('admin:payments_balancegrant_change', args=[grant.pk]))
+
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title="Ommaviy balans: yangi ish",
+            form=form,
+            batch_size=balance_grants.BATCH_SIZE,
+        )
+        return TemplateResponse(request, 'admin/payments/balancegrant/add.html', context)
+
+    def _run(self, request, grant):
+        try:
+            grant = balance_grants.run(grant)
+        except Exception as e:
+            self.message_user(request, f"Ish #{grant.pk} to'xtadi: {e}. \"Davom ettirish\" bilan tugating",
+                              messages.ERROR)
+            return
+        self.message_user(request, f"Ish #{grant.pk}: {grant.updated_users} user yangilandi, "
+                                   f"jami {grant.balance_change:+d} ({grant.batches} partiya)")
+
+    @admin.action(description="Davom ettirish (tugallanmaganlar)", permissions=['add'])
+    def resume(self, request, queryset):
+        for grant in queryset.exclude(status=BalanceGrant.STATUS_COMPLETED):
+            self._run(request, grant)
+
+    def has_change_permission(self, request, obj=None):
+        """Ish faqat yaratiladi va bajariladi - qo'lda tahrirlanmaydi"""
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        """Audit saqlanadi"""
+        return False
@@ -0,0 +1,160 @@
+# payments/admin_pagination.py - Katta jadvallar uchun admin changelist: taxminiy COUNT va keyset sahifalash
+"""
+ScalableAdminMixin:
+- EstimatedCountPaginator: filtrsiz ro'yxatda COUNT(*) o'rniga statistikadan
+  taxminiy son (PostgreSQL pg_class.reltuples, SQLite max(id)-min(id)+1),
+  filtrlanganda COUNT_LIMIT bilan cheklangan COUNT.
+- KeysetChangeList: ?cursor=<created_at>,<id> - (created_at, id) bo'yicha
+  keyingi sahifa (OFFSET siz). Standart tartibda (?o= yo'q) ishlaydi.
+- get_search_results: icontains o'rniga indeksdan foydalanadigan qidiruv -
+  raqam bo'lsa aniq id/telegram_id, aniq kalitlar va to'liq matnli indeks
+  (search_index, search_index_kind); indeks uchun qisqa so'rovda prefiks.
+"""
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from . import search_index
+
+CURSOR_VAR = 'cursor'
+
+ESTIMATE_THRESHOLD = 100_000
+COUNT_LIMIT = 10_000
+
+
+def estimated_count(model, using='default'):
+    """Jadvaldagi qatorlar soni taxminan (arzon). Aniqlab bo'lmasa None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            estimate = row[0] if row else -1
+            if estimate is None or estimate <= 0:
+                # Partitionlangan jadval (pricing_history): bo'laklar yig'indisi
+                cursor.execute(
+                    "SELECT sum(c.reltuples) FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                    "WHERE i.inhparent = %s::regclass AND c.reltuples > 0", [table]
+                )
+                estimate = cursor.fetchone()[0]
+        return int(estimate) if estimate and estimate > 0 else None
+    if connection.vendor == 'sqlite':
+        bounds = model._base_manager.using(using).aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['high'] is None:
+            return 0
+        return bounds['high'] - bounds['low'] + 1
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """count - katta jadvalda taxminiy yoki cheklangan; count_is_estimate shuni bildiradi"""
+
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+                self.count_is_estimate = True
+                return estimate
+            return queryset.count()
+
+        count = queryset[:COUNT_LIMIT + 1].count()
+        if count > COUNT_LIMIT:
+            self.count_is_estimate = True
+        return count
+
+
+def _parse_cursor(value):
+    created_at, _, pk = (value or '').rpartition(',')
+    created_at = parse_datetime(created_at) if created_at else None
+    if created_at is None or not pk.isdigit():
+        return None
+    return created_at, int(pk)
+
+
+class KeysetChangeList(ChangeList):
+    """Standart tartib (-keyset_field, -pk) bo'lsa ?cursor= bilan OFFSET siz keyingi sahifa"""
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    @property
+    def keyset_active(self):
+        return ORDER_VAR not in self.params and not self.show_all
+
+    @property
+    def cursor(self):
+        return _parse_cursor(self.params.get(CURSOR_VAR)) if self.keyset_active else None
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        cursor = self.cursor
+        if cursor is not None and exclude_parameters is None:
+            field = self.model_admin.keyset_field
+            created_at, pk = cursor
+            queryset = queryset.filter(Q(**{f'{field}__lt': created_at}) | Q(**{field: created_at, 'pk__lt': pk}))
+        return queryset
+
+    def get_results(self, request):
+        if self.cursor is not None:
+            self.page_num = 1
+        super().get_results(request)
+        # Sahifa bir marta o'qiladi (template va kursor uchun)
+        self.result_list = list(self.result_list)
+
+        self.next_cursor_url = None
+        if self.keyset_active and self.multi_page and len(self.result_list) == self.list_per_page:
+            last = self.result_list[-1]
+            value = getattr(last, self.model_admin.keyset_field)
+            if value is not None:
+                self.next_cursor_url = self.get_query_string({CURSOR_VAR: f'{value.isoformat()},{last.pk}'})
+        self.first_page_url = self.get_query_string(remove=[CURSOR_VAR, PAGE_VAR])
+
+
+class ScalableAdminMixin:
+    """
+    Katta jadvallar uchun ModelAdmin mixin. list_select_related ni har bir
+    admin o'zi beradi; bu yerda sahifalash, COUNT va qidiruv.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    keyset_field = 'created_at'
+
+    # Qidiruv: raqamli aniq maydonlar, satr aniq maydonlar, to'liq matnli indeks turi
+    # (search_index.KINDS) va so'rov indeks uchun qisqa bo'lsa prefiks (istartswith) maydonlar
+    search_int_fields = ()
+    search_exact_fields = ()
+    search_index_kind = None
+    search_prefix_fields = ()
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+
+        query = Q()
+        if term.isdigit():
+            for field in self.search_int_fields:
+                query |= Q(**{field: int(term)})
+        for field in self.search_exact_fields:
+            query |= Q(**{field: term})
+        if self.search_index_kind and search_index.is_searchable(term):
+            query |= search_index.lookup(self.search_index_kind, term)
+        elif not term.isdigit():
+            for field in self.search_prefix_fields:
+                query |= Q(**{f'{field}__istartswith': term})
+        if not query:
+            return queryset.none(), False
+        return queryset.filter(query), False
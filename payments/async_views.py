@@ -0,0 +1,228 @@
+# payments/async_views.py - ASGI rejimi uchun async endpointlar (API_ASYNC=True)
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from . import balance_cache, payme_dispatch, payment_events, replicas, tariff_cache
+from .models import BotUser, Payment
+from .payme_utils import stream_jsonrpc_result
+from .views import (
+    SSE_KEEPALIVE,
+    _jsonrpc_response,
+    _load_balance_data,
+    _parse_payme_request,
+    _payment_status_data,
+    _sse_event,
+    _sse_response,
+    _tariffs_response,
+    _user_data,
+    _wait_params,
+)
+
+logger = logging.getLogger(__name__)
+
+# DRF JSONRenderer bilan bir xil format
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params=JSON_PARAMS)
+
+
+async def _aiter_sync(iterator):
+    """Sync iteratorni (DB cursor) bitta sync threadda bo'laklab o'qish"""
+    sentinel = object()
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(iterator, sentinel)
+        if chunk is sentinel:
+            break
+        yield chunk
+
+
+# ============= BOT UCHUN API ENDPOINTLAR =============
+
+@require_http_methods(["GET"])
+async def get_tariffs(request):
+    """Barcha faol tariflarni olish (keshdan, ETag / 304 bilan)"""
+    try:
+        body, etag = await tariff_cache.aget_catalog()
+        return _tariffs_response(request, body, etag)
+    except Exception as e:
+        logger.error(f"Get tariffs error: {e}", exc_info=True)
+        return _json({'success': False, 'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def create_user(request):
+    """Foydalanuvchi yaratish yoki yangilash"""
+    try:
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError
+    except ValueError:
+        return _json({'success': False, 'error': 'JSON body noto\'g\'ri'}, status=400)
+
+    telegram_id = data.get('telegram_id')
+    full_name = data.get('full_name', '')
+    username = data.get('username', '')
+
+    if not telegram_id:
+        return _json({'success': False, 'error': 'telegram_id majburiy'}, status=400)
+
+    try:
+        user, created = await BotUser.objects.aget_or_create(
+            telegram_id=telegram_id,
+            defaults={'full_name': full_name, 'username': username}
+        )
+
+        if not created:
+            # Mavjud userni yangilash
+            if full_name:
+                user.full_name = full_name
+            if username is not None:
+                user.username = username
+            await user.asave()
+
+        return _json(_user_data(user, created))
+    except Exception as e:
+        logger.error(f"Create user error: {e}", exc_info=True)
+        return _json({'success': False, 'error': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+async def get_balance(request, telegram_id):
+    """Foydalanuvchi balansini olish"""
+    try:
+        data = await sync_to_async(balance_cache.get_or_load)(
+            telegram_id, lambda: _load_balance_data(telegram_id)
+        )
+        if data is None:
+            raise BotUser.DoesNotExist
+        return _json(data)
+    except BotUser.DoesNotExist:
+        return _json({'success': False, 'error': 'Foydalanuvchi topilmadi'}, status=404)
+    except Exception as e:
+        logger.error(f"Get balance error: {e}", exc_info=True)
+        return _json({'success': False, 'error': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+async def check_payment_status(request, order_id):
+    """To'lov holatini tekshirish ORDER_ID orqali (replikadan)"""
+    try:
+        with replicas.reading(replicas.order_scope(order_id)) as reads:
+            payment = await _afetch_payment(order_id)
+        if not payment and reads.used_replica:
+            payment = await _afetch_payment(order_id)
+
+        if not payment:
+            return _json({'success': False, 'error': 'Payment not found', 'has_payment': False}, status=404)
+
+        return _json(_payment_status_data(payment))
+    except Exception as e:
+        logger.error(f"Check payment status error: {e}", exc_info=True)
+        return _json({'success': False, 'error': str(e), 'has_payment': False}, status=500)
+
+
+async def _afetch_payment(order_id):
+    return await Payment.objects.select_related('user', 'tariff').filter(order_id=order_id).afirst()
+
+
+@require_http_methods(["GET"])
+async def wait_payment_status(request, order_id):
+    """Long-poll (async): kutish event loopni bloklamaydi"""
+    try:
+        payment = await _afetch_payment(order_id)
+        if not payment:
+            return _json({'success': False, 'error': 'Payment not found', 'has_payment': False}, status=404)
+
+        try:
+            known_state, timeout = _wait_params(request, payment, settings.PAYMENT_WAIT_TIMEOUT)
+        except ValueError:
+            return _json({'success': False, 'error': 'state/timeout noto\'g\'ri'}, status=400)
+
+        changed = payment.state != known_state
+        if not changed and await payment_events.await_change(str(payment.order_id), known_state, timeout):
+            payment = await _afetch_payment(order_id)
+            changed = payment.state != known_state
+
+        return _json(dict(_payment_status_data(payment), changed=changed))
+    except Exception as e:
+        logger.error(f"Wait payment status error: {e}", exc_info=True)
+        return _json({'success': False, 'error': str(e), 'has_payment': False}, status=500)
+
+
+async def _apayment_event_stream(payment, timeout):
+    yield _sse_event(_payment_status_data(payment))
+
+    order_id = str(payment.order_id)
+    state = payment.state
+    deadline = time.monotonic() + timeout
+    while state == Payment.STATE_CREATED:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if await payment_events.await_change(order_id, state, min(SSE_KEEPALIVE, remaining)):
+            payment = await _afetch_payment(order_id)
+            if payment.state != state:
+                state = payment.state
+                yield _sse_event(_payment_status_data(payment))
+        else:
+            yield b': keepalive\n\n'
+
+
+@require_http_methods(["GET"])
+async def payment_status_events(request, order_id):
+    """SSE (async): to'lov holati o'zgarishlarini push qilish"""
+    payment = await _afetch_payment(order_id)
+    if not payment:
+        return _json({'success': False, 'error': 'Payment not found', 'has_payment': False}, status=404)
+
+    try:
+        _, timeout = _wait_params(request, payment, settings.PAYMENT_EVENTS_TIMEOUT)
+    except ValueError:
+        return _json({'success': False, 'error': 'timeout noto\'g\'ri'}, status=400)
+
+    return _sse_response(_apayment_event_stream(payment, timeout))
+
+
+# ============= PAYME CALLBACK =============
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def payme_callback(request):
+    """
+    Payme Merchant API callback handler (async)
+    Handlerlar tranzaksiyali sync kod - bitta sync threadda bajariladi.
+    """
+    request_id = None
+
+    try:
+        request_id, method, params, error_response = _parse_payme_request(request)
+        if error_response is not None:
+            return error_response
+
+        result = await sync_to_async(payme_dispatch.dispatch)(method, params)
+
+        if method == "GetStatement" and "error" not in result:
+            # Birinchi batch (DB so'rovi) javobdan oldin o'qiladi - xato bo'lsa pastda -32400
+            chunks = await sync_to_async(stream_jsonrpc_result)(request_id, "transactions", result["transactions"])
+            return StreamingHttpResponse(
+                _aiter_sync(chunks),
+                content_type="application/json",
+                status=200
+            )
+
+        return _jsonrpc_response(request_id, result)
+
+    except Exception:
+        logger.exception("❌ PAYME CALLBACK FATAL ERROR")
+        return _jsonrpc_response(request_id, payme_dispatch.error(payme_dispatch.ERROR_INTERNAL, "Internal error"))
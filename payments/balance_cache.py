@@ -0,0 +1,227 @@
+# payments/balance_cache.py - get_balance uchun balans keshi (telegram_id bo'yicha)
+"""
+Har bir kalit uchun "generation" tokeni saqlanadi. Yozuv (balance, token)
+faqat token joriy bo'lsa yaroqli. Balans o'zgarganda token yozuvdan OLDIN
+(change_balance UPDATE dan oldin, tranzaksiya ichida - commit'gacha) va commit'dan
+keyin yangilanadi - eski yozuvlar o'z-o'zidan yaroqsiz bo'ladi. O'quvchi
+tokenni DB dan OLDIN o'qiydi, shuning uchun yozuv va commit oralig'ida eski
+qiymatni keshlagan o'quvchi yozuvi commit'dagi token bilan yaroqsiz bo'ladi -
+eskirgan qiymat keshga "yopishib" qolmaydi.
+
+Backend: BALANCE_CACHE_BACKEND = Django cache alias (masalan 'default') -
+umumiy cache bo'lsa standart; 'lru' - process ichida, faqat bitta worker
+uchun; 'off' - keshsiz (process ichidagi cache va bir nechta worker). Process
+ichidagi keshni boshqa process (worker, grant_balance) yozuvi yaroqsiz qila
+olmaydi - bunday yozuvdan keyin eskirish BALANCE_CACHE_TIMEOUT bilan chegaralangan.
+"""
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from . import metrics, replicas
+
+VALUE_PREFIX = 'payments:balance:v:'
+GEN_PREFIX = 'payments:balance:g:'
+
+_counter = itertools.count()
+
+
+def _new_token():
+    return f"{time.time_ns()}-{next(_counter)}"
+
+
+class LRUBackend:
+    """Process ichidagi LRU (thread-safe), timeout - Django cache kabi sekundlarda"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()  # key -> (value, expires_at | None)
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        """Muddati o'tgan yozuv o'chiriladi. Lock ostida chaqiriladi"""
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] <= now:
+            del self._data[key]
+            return None
+        return item
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for key in keys:
+                item = self._live(key, now)
+                if item is not None:
+                    self._data.move_to_end(key)
+                    result[key] = item[0]
+            return result
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def set_many(self, data, timeout=None):
+        for key, value in data.items():
+            self.set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if self._live(key, time.monotonic()) is not None:
+                return False
+        self.set(key, value, timeout)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class NullBackend:
+    """'off': hech narsa saqlanmaydi - har bir o'qish DB dan"""
+
+    def get_many(self, keys):
+        return {}
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def set_many(self, data, timeout=None):
+        pass
+
+    def add(self, key, value, timeout=None):
+        return False
+
+
+class BalanceCache:
+
+    def __init__(self, backend, timeout=None):
+        self.backend = backend
+        self.timeout = timeout
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+        metrics.inc('cache_requests_total', amount, cache='balance', result=name)
+
+    def get_or_load(self, telegram_id, loader):
+        """
+        Keshdan olish, bo'lmasa loader() orqali DB dan o'qib saqlash.
+        loader None qaytarsa (user yo'q) - keshlanmaydi.
+        """
+        value_key, gen_key = VALUE_PREFIX + str(telegram_id), GEN_PREFIX + str(telegram_id)
+        found = self.backend.get_many([value_key, gen_key])
+        gen = found.get(gen_key)
+        entry = found.get(value_key)
+
+        if gen is not None and entry is not None and entry[1] == gen:
+            self._count('hits')
+            return entry[0]
+
+        self._count('misses')
+        if gen is None:
+            self.backend.add(gen_key, _new_token(), timeout=None)
+            gen = self.backend.get_many([gen_key]).get(gen_key)
+
+        value = loader()
+        if value is not None and gen is not None:
+            self.backend.set(value_key, (value, gen), timeout=self.timeout)
+        return value
+
+    def invalidate(self, telegram_id):
+        """Tokenni yangilash - mavjud yozuv yaroqsiz bo'ladi"""
+        self.backend.set(GEN_PREFIX + str(telegram_id), _new_token(), timeout=None)
+        self._count('invalidations')
+
+    def invalidate_on_commit(self, telegram_id):
+        """
+        Hozir (yozuv ko'rinmasidan oldin) va commit'dan keyin. Oraliqda eski
+        qiymatni o'qib keshga yozgan o'quvchi yozuvi ikkinchi token bilan yaroqsiz
+        """
+        self.invalidate(telegram_id)
+        transaction.on_commit(lambda: self.invalidate(telegram_id))
+
+    def invalidate_many(self, telegram_ids):
+        """Ommaviy o'zgarish (balance_grants): barcha tokenlar bitta set_many bilan"""
+        token = _new_token()
+        self.backend.set_many({GEN_PREFIX + str(telegram_id): token for telegram_id in telegram_ids}, timeout=None)
+        self._count('invalidations', len(telegram_ids))
+
+    def stats(self):
+        total = self.hits + self.misses
+        data = {
+            'backend': settings.BALANCE_CACHE_BACKEND,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+        }
+        if isinstance(self.backend, LRUBackend):
+            data['size'] = len(self.backend)
+        return data
+
+
+def _build():
+    alias = settings.BALANCE_CACHE_BACKEND
+    if alias == 'off':
+        return BalanceCache(NullBackend())
+    if alias == 'lru':
+        return BalanceCache(LRUBackend(settings.BALANCE_CACHE_SIZE), timeout=settings.BALANCE_CACHE_TIMEOUT)
+
+    from django.core.cache import caches
+    return BalanceCache(caches[alias], timeout=settings.BALANCE_CACHE_TIMEOUT)
+
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_cache():
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = _build()
+    return _instance
+
+
+def get_or_load(telegram_id, loader):
+    return get_cache().get_or_load(telegram_id, loader)
+
+
+# Sticky belgi tokendan oldin: yangi tokenni ko'rgan o'quvchi replikaga bormaydi
+# (eskirgan replika balansi yangi token bilan keshga yozilmaydi)
+
+def invalidate(telegram_id):
+    get_cache().invalidate(telegram_id)
+
+
+def invalidate_on_commit(telegram_id):
+    replicas.mark_written_on_commit(replicas.user_scope(telegram_id))
+    get_cache().invalidate_on_commit(telegram_id)
+
+
+def invalidate_many_on_commit(telegram_ids):
+    replicas.mark_written_on_commit(*[replicas.user_scope(telegram_id) for telegram_id in telegram_ids])
+    cache = get_cache()
+    cache.invalidate_many(telegram_ids)
+    transaction.on_commit(lambda: cache.invalidate_many(telegram_ids))
+
+
+def stats():
+    return get_cache().stats()
@@ -0,0 +1,221 @@
+# payments/balance_grants.py - Ommaviy balans berish / olish (aksiyalar) to'plamli UPDATE bilan
+"""
+Ish (BalanceGrant) ikki bosqichda:
+
+1. Yaratish: foydalanuvchilar BalanceGrantTarget ga muzlatiladi - CSV dan
+   (telegram_id lar, bo'laklab) yoki filtrdan (bitta INSERT ... SELECT).
+   Keyin qo'shilgan / filtrga tushgan userlar ishga kirmaydi.
+2. Bajarish (run): targetlar id tartibida BATCH_SIZE dan, har bir partiya
+   bitta tranzaksiyada:
+     UPDATE bot_users SET balance = balance + N  (olishda MAX(balance - N, 0))
+     WHERE id IN (SELECT user_id FROM balance_grant_targets WHERE ...)
+   + audit qatori (BalanceGrantBatch) + ish kursori (last_target_id).
+   Jarayon uzilsa run qayta chaqiriladi - tugallangan partiyalar takrorlanmaydi.
+   Ish qatori har partiyada select_for_update bilan olinadi: bir vaqtda ikki
+   runner bir partiyani ikki marta qo'llay olmaydi.
+"""
+import csv
+import logging
+from datetime import date, datetime, time
+
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import balance_cache
+from .models import BalanceGrant, BalanceGrantBatch, BalanceGrantTarget, BotUser
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+CSV_CHUNK_SIZE = 5000
+
+
+class GrantError(Exception):
+    """Ishni yaratib yoki bajarib bo'lmaydi (foydalanuvchiga ko'rsatiladigan xabar)"""
+
+
+def _check_delta(delta):
+    if not delta:
+        raise GrantError("O'zgarish (delta) 0 bo'lmasligi kerak")
+
+
+# ============= YARATISH =============
+
+def _csv_telegram_ids(lines):
+    """
+    CSV qatorlaridan telegram_id lar: 'telegram_id' sarlavhali ustun yoki
+    birinchi ustun. Raqam bo'lmagan qatorlar (sarlavha, bo'sh) o'tkazib yuboriladi.
+    """
+    column = 0
+    for index, row in enumerate(csv.reader(lines)):
+        if not row:
+            continue
+        if index == 0 and 'telegram_id' in row:
+            column = row.index('telegram_id')
+            continue
+        value = row[column].strip() if column < len(row) else ''
+        if value.isdigit():
+            yield int(value)
+
+
+def create_from_csv(lines, delta, reason, created_by='', filename=''):
+    """
+    lines - CSV matn qatorlari (fayl yoki TextIOWrapper). Noma'lum telegram_id lar
+    va takrorlar hisoblanadi, lekin ishga kirmaydi.
+    """
+    _check_delta(delta)
+    with transaction.atomic():
+        grant = BalanceGrant.objects.create(
+            reason=reason, delta=delta, source=BalanceGrant.SOURCE_CSV, created_by=created_by,
+        )
+        rows = unknown = 0
+        chunk = []
+
+        def flush():
+            nonlocal unknown
+            user_ids = list(BotUser.objects.filter(telegram_id__in=chunk).values_list('id', flat=True))
+            unknown += len(set(chunk)) - len(user_ids)
+            BalanceGrantTarget.objects.bulk_create(
+                [BalanceGrantTarget(grant=grant, user_id=user_id) for user_id in sorted(user_ids)],
+                ignore_conflicts=True,
+            )
+            chunk.clear()
+
+        for telegram_id in _csv_telegram_ids(lines):
+            rows += 1
+            chunk.append(telegram_id)
+            if len(chunk) >= CSV_CHUNK_SIZE:
+                flush()
+        if chunk:
+            flush()
+
+        grant.total_users = grant.targets.count()
+        grant.criteria = {'file': filename, 'rows': rows, 'unknown': unknown}
+        grant.save(update_fields=['total_users', 'criteria'])
+    return grant
+
+
+def day_start(value):
+    """date yoki 'YYYY-MM-DD' -> joriy timezone dagi kun boshi"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return timezone.make_aware(datetime.combine(value, time.min))
+
+
+def filter_users(is_active=None, created_before=None, created_after=None):
+    """Filtr mezonlari -> BotUser queryset (datetime lar aware)"""
+    users = BotUser.objects.all()
+    if is_active is not None:
+        users = users.filter(is_active=is_active)
+    if created_before is not None:
+        users = users.filter(created_at__lt=created_before)
+    if created_after is not None:
+        users = users.filter(created_at__gte=created_after)
+    return users
+
+
+def create_from_filter(delta, reason, is_active=None, created_before=None, created_after=None, created_by=''):
+    """Filtrga mos userlar bitta INSERT ... SELECT bilan muzlatiladi"""
+    _check_delta(delta)
+    criteria = {
+        'is_active': is_active,
+        'created_before': created_before.isoformat() if created_before else None,
+        'created_after': created_after.isoformat() if created_after else None,
+    }
+    users = filter_users(is_active, created_before, created_after).order_by().values('id')
+    sql, params = users.query.sql_with_params()
+    qn = connection.ops.quote_name
+
+    with transaction.atomic():
+        grant = BalanceGrant.objects.create(
+            reason=reason, delta=delta, source=BalanceGrant.SOURCE_FILTER, criteria=criteria,
+            created_by=created_by,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {qn(BalanceGrantTarget._meta.db_table)} ({qn('grant_id')}, {qn('user_id')}) "
+                f"SELECT %s, u.{qn('id')} FROM ({sql}) u ORDER BY u.{qn('id')}",
+                [grant.pk, *params],
+            )
+            grant.total_users = cursor.rowcount
+        grant.save(update_fields=['total_users'])
+    return grant
+
+
+# ============= BAJARISH =============
+
+def _apply_batch(grant_id, batch_size):
+    """Bitta partiya. Qaytaradi: BalanceGrantBatch yoki None (ish tugagan)"""
+    now = timezone.now()
+    with transaction.atomic():
+        grant = BalanceGrant.objects.select_for_update().get(pk=grant_id)
+        if grant.status == BalanceGrant.STATUS_COMPLETED:
+            return None
+
+        target_ids = list(
+            grant.targets.filter(id__gt=grant.last_target_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not target_ids:
+            grant.status = BalanceGrant.STATUS_COMPLETED
+            grant.finished_at = now
+            grant.save(update_fields=['status', 'finished_at'])
+            return None
+
+        first, last = target_ids[0], target_ids[-1]
+        users = BotUser.objects.filter(id__in=grant.targets.filter(id__gte=first, id__lte=last).values('user_id'))
+
+        # Haqiqiy o'zgarish (olishda 0 dan pastga tushmaydi) va kesh uchun telegram_id lar
+        current = list(users.select_for_update().values_list('telegram_id', 'balance'))
+        change = sum(max(balance + grant.delta, 0) - balance for _, balance in current)
+
+        balance = F('balance') + grant.delta
+        if grant.delta < 0:
+            balance = Greatest(balance, Value(0))
+        updated = users.update(balance=balance, updated_at=now)
+
+        batch = BalanceGrantBatch.objects.create(
+            grant=grant, number=grant.batches + 1, first_target_id=first, last_target_id=last,
+            users=updated, balance_change=change,
+        )
+        grant.last_target_id = last
+        grant.batches += 1
+        grant.processed_users += len(target_ids)
+        grant.updated_users += updated
+        grant.balance_change += change
+        grant.save(update_fields=['last_target_id', 'batches', 'processed_users', 'updated_users',
+                                  'balance_change'])
+
+        balance_cache.invalidate_many_on_commit([telegram_id for telegram_id, _ in current])
+    return batch
+
+
+def run(grant, batch_size=BATCH_SIZE, progress=None):
+    """
+    Ishni oxirigacha (yoki xatogacha) bajarish; FAILED / to'xtatilgan ishni
+    davom ettiradi. progress(grant, batch) - har partiyadan keyin.
+    """
+    if grant.status == BalanceGrant.STATUS_COMPLETED:
+        return grant
+
+    BalanceGrant.objects.filter(pk=grant.pk).update(
+        status=BalanceGrant.STATUS_RUNNING, started_at=grant.started_at or timezone.now(), last_error='',
+    )
+    try:
+        while True:
+            batch = _apply_batch(grant.pk, batch_size)
+            if batch is None:
+                break
+            if progress:
+                progress(batch.grant, batch)
+    except Exception as e:
+        BalanceGrant.objects.filter(pk=grant.pk).update(status=BalanceGrant.STATUS_FAILED, last_error=str(e))
+        logger.error(f"Balance grant #{grant.pk} to'xtadi: {e}", exc_info=True)
+        raise
+
+    grant.refresh_from_db()
+    logger.info(f"Balance grant #{grant.pk} tugadi: {grant.updated_users} user, {grant.balance_change:+d}")
+    return grant
@@ -0,0 +1,234 @@
+# payments/bench.py - Benchmark yordamchilari (management commandlar uchun)
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from . import search_index
+from .models import BotUser, Payment, PricingHistory, PricingTariff
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    """
+    Vaqtinchalik DB (asosiy bazaga tegmaslik uchun).
+    SQLite da fayl ishlatiladi - in-memory shared cache threadlar bilan qulflanadi.
+    """
+    old_name = connection.settings_dict['NAME']
+    tmp_dir = None
+    if connection.vendor == 'sqlite':
+        tmp_dir = tempfile.mkdtemp(prefix='sebmarket-bench-')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmp_dir, 'bench.sqlite3')
+
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def in_process_settings():
+    """
+    In-process test Client uchun: Client "Host: testserver" yuboradi va DEBUG=False da
+    SECURE_SSL_REDIRECT qo'llanadi - ularsiz har bir so'rov DisallowedHost 400 /
+    301 bo'lib, benchmark xato sahifalarini o'lchaydi.
+    """
+    return override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], SECURE_SSL_REDIRECT=False)
+
+
+class UnexpectedResponse(Exception):
+    """Endpoint kutilmagan status qaytardi (run_concurrent uni xato deb sanaydi)"""
+
+    def __init__(self, status, content=b''):
+        body = content.decode(errors='replace') if isinstance(content, bytes) else str(content)
+        super().__init__(f"HTTP {status}: {' '.join(body.split())[:200]}")
+        self.status = status
+
+
+def percentile(sorted_values, pct):
+    """Saralangan ro'yxatdan percentil (nearest-rank)"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+def summarize(latencies, elapsed, workers, ok, errors):
+    """Latency ro'yxatidan umumiy statistika"""
+    all_latencies = sorted(latencies)
+    total = len(all_latencies)
+    return {
+        'workers': workers,
+        'requests': total,
+        'ok': ok,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 4),
+        'rps': round(total / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(all_latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(all_latencies, 99) * 1000, 3),
+    }
+
+
+def run_concurrent(func, workers, iterations):
+    """
+    func(worker_index, iteration) ni `workers` ta threadda `iterations` martadan chaqiradi.
+    func True/False qaytaradi (muvaffaqiyat). Natija: statistikalar dict.
+    """
+    latencies = [[] for _ in range(workers)]
+    ok_counts = [0] * workers
+    errors = [0] * workers
+    barrier = threading.Barrier(workers + 1)
+
+    def worker(index):
+        try:
+            barrier.wait()
+            for i in range(iterations):
+                started = time.perf_counter()
+                try:
+                    if func(index, i):
+                        ok_counts[index] += 1
+                except Exception:
+                    errors[index] += 1
+                latencies[index].append(time.perf_counter() - started)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return summarize([x for chunk in latencies for x in chunk], elapsed, workers, sum(ok_counts), sum(errors))
+
+
+def run_concurrent_async(coro_func, workers, iterations):
+    """run_concurrent ning asyncio varianti: `workers` ta task bitta event loopda"""
+    latencies = []
+    counts = {'ok': 0, 'errors': 0}
+
+    async def worker(index):
+        for i in range(iterations):
+            started = time.perf_counter()
+            try:
+                if await coro_func(index, i):
+                    counts['ok'] += 1
+            except Exception:
+                counts['errors'] += 1
+            latencies.append(time.perf_counter() - started)
+
+    async def main():
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(workers)))
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(main())
+    connections.close_all()
+    return summarize(latencies, elapsed, workers, counts['ok'], counts['errors'])
+
+
+# ============= REAL HAJMDAGI MA'LUMOTLAR =============
+
+SEED_BATCH_SIZE = 5000
+SEED_TELEGRAM_BASE = 1_000_000
+SEED_UPDATE_BATCH_SIZE = 1000
+SEED_SPAN = timedelta(days=365)
+
+
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_volume(users, history, payments, batch_size=SEED_BATCH_SIZE, progress=None, rng_seed=0):
+    """
+    Benchmark uchun hajmli ma'lumot: BotUser, PricingHistory, Payment (bulk_create,
+    bo'laklab). telegram_id lar SEED_TELEGRAM_BASE + n. created_at oxirgi SEED_SPAN
+    ichida id tartibida yoyiladi (vaqt oralig'i / keyset so'rovlari va arxiv oylari
+    ishlab turgan bazadagidek). Qaytaradi: tarif ro'yxati.
+    progress(nomi, yozilgan, jami) - ixtiyoriy.
+    """
+    rng = random.Random(rng_seed)
+    tariffs = PricingTariff.objects.bulk_create([
+        PricingTariff(name='Start', count=10, price=Decimal('10000')),
+        PricingTariff(name='Pro', count=50, price=Decimal('45000')),
+        PricingTariff(name='Biznes', count=200, price=Decimal('160000')),
+    ])
+    now = timezone.now()
+
+    def write(model, rows, total, name, stamp=None, fields=()):
+        """
+        auto_now_add bulk_create da ham joriy vaqtni qo'yadi - created_at (va
+        stamp(obj) o'zgartirgan fields) shu tranzaksiyada bulk_update bilan yoziladi
+        """
+        done = 0
+        for batch in _batched(rows, batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=batch_size)
+                for n, obj in enumerate(batch, done):
+                    obj.created_at = now - SEED_SPAN + SEED_SPAN * n / total
+                    if stamp:
+                        stamp(obj)
+                model.objects.bulk_update(batch, ['created_at', *fields], batch_size=SEED_UPDATE_BATCH_SIZE)
+            done += len(batch)
+            if progress:
+                progress(name, done, total)
+
+    write(BotUser, (
+        BotUser(telegram_id=SEED_TELEGRAM_BASE + n, full_name=f'user {n}', username=f'user{n}',
+                balance=rng.randint(0, 500))
+        for n in range(users)
+    ), users, 'users')
+
+    user_ids = list(BotUser.objects.order_by('id').values_list('id', flat=True))
+    models_pool = ['iPhone 13', 'iPhone 15 Pro', 'Galaxy S23', 'Redmi Note 12', 'Pixel 8', 'Galaxy A54']
+
+    write(PricingHistory, (
+        PricingHistory(user_id=rng.choice(user_ids), phone_model=rng.choice(models_pool),
+                       price=Decimal(rng.randint(100, 20000) * 1000))
+        for _ in range(history)
+    ), history, 'pricing_history')
+
+    states = [Payment.STATE_COMPLETED] * 6 + [Payment.STATE_CREATED] * 3 + [Payment.STATE_CANCELLED]
+
+    def payment_rows():
+        for n in range(payments):
+            tariff = rng.choice(tariffs)
+            state = rng.choice(states)
+            yield Payment(
+                user_id=rng.choice(user_ids), tariff=tariff, amount=tariff.price, pricing_count=tariff.count,
+                order_id=f'seed-{n}', state=state,
+                payme_transaction_id=f'seedtx-{n}' if state != Payment.STATE_CREATED else None,
+            )
+
+    def performed(payment):
+        if payment.state == Payment.STATE_COMPLETED:
+            payment.performed_at = payment.created_at + timedelta(minutes=rng.randint(1, 30))
+
+    write(Payment, payment_rows(), payments, 'payments', stamp=performed, fields=['performed_at'])
+
+    # bulk_create signal yubormaydi - qidiruv indeksi ishlab turgan bazadagidek to'ldiriladi
+    search_index.rebuild(batch_size=batch_size)
+    return tariffs
@@ -0,0 +1,210 @@
+# payments/exports.py - To'lovlar va narxlash tarixini oqim bilan eksport (CSV / JSONL, ixtiyoriy gzip)
+"""
+Buxgalteriya eksportlari: admin actionlari va /api/payments/export/... API.
+
+Qatorlar (created_at, id) o'sish tartibida keyset bo'laklar bilan o'qiladi -
+har bir so'rov CHUNK_SIZE qator, OFFSET va uzoq ochiq cursor/tranzaksiya yo'q.
+Kodlangan baytlar FLUSH_BYTES ga yetganda StreamingHttpResponse ga beriladi,
+gzip (zlib, wbits=31) ham oqim ko'rinishida. Xotira eksport hajmiga bog'liq emas.
+
+Narxlash tarixi API da arxivlangan oylar ham kiradi (history_archive fayllari
+qatorma-qator o'qiladi); admin action faqat live jadvaldagi tanlovni beradi.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from . import history_archive
+from .models import HistoryArchive, Payment, PricingHistory
+
+CHUNK_SIZE = 5000
+FLUSH_BYTES = 64 * 1024
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = [CSV, JSONL]
+
+CONTENT_TYPES = {
+    CSV: 'text/csv; charset=utf-8',
+    JSONL: 'application/x-ndjson; charset=utf-8',
+}
+
+# (ustun nomi, queryset maydoni)
+PAYMENT_COLUMNS = [
+    ('id', 'id'),
+    ('order_id', 'order_id'),
+    ('telegram_id', 'user__telegram_id'),
+    ('tariff_id', 'tariff_id'),
+    ('tariff', 'tariff__name'),
+    ('amount', 'amount'),
+    ('pricing_count', 'pricing_count'),
+    ('state', 'state'),
+    ('reason', 'reason'),
+    ('payme_transaction_id', 'payme_transaction_id'),
+    ('created_at', 'created_at'),
+    ('performed_at', 'performed_at'),
+    ('cancelled_at', 'cancelled_at'),
+]
+# Arxiv fayli qatorlari bilan bir xil ustunlar (history_archive._row)
+HISTORY_COLUMNS = [
+    ('id', 'id'),
+    ('user_id', 'user_id'),
+    ('telegram_id', 'user__telegram_id'),
+    ('phone_model', 'phone_model'),
+    ('price', 'price'),
+    ('created_at', 'created_at'),
+]
+
+
+# ============= QATORLAR =============
+
+def iter_rows(queryset, columns, chunk_size=CHUNK_SIZE):
+    """queryset qatorlari dict ko'rinishida, (created_at, id) bo'yicha keyset bo'laklar"""
+    names = [name for name, _ in columns]
+    fields = [field for _, field in columns]
+    created_index, id_index = fields.index('created_at'), fields.index('id')
+    base = queryset.order_by('created_at', 'id').values_list(*fields)
+
+    cursor = None
+    while True:
+        chunk = base
+        if cursor is not None:
+            chunk = chunk.filter(Q(created_at__gt=cursor[0]) | Q(created_at=cursor[0], id__gt=cursor[1]))
+        rows = list(chunk[:chunk_size])
+        for row in rows:
+            yield dict(zip(names, row))
+        if len(rows) < chunk_size:
+            return
+        cursor = (rows[-1][created_index], rows[-1][id_index])
+
+
+def payment_rows(queryset=None, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """To'lovlar, created_at oralig'i [start, end)"""
+    if queryset is None:
+        queryset = Payment.objects.all()
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+    return iter_rows(queryset, PAYMENT_COLUMNS, chunk_size)
+
+
+def history_rows(queryset=None, start=None, end=None, user_id=None, include_archive=False,
+                 chunk_size=CHUNK_SIZE):
+    """
+    Narxlash tarixi [start, end), (created_at, id) o'sish tartibida.
+    include_archive - oraliqqa tushgan arxiv oylari (ular live qatorlardan eski)
+    avval: vaqt bloklaridan, user_id berilsa faqat shu foydalanuvchi segmentidan
+    (segment yangidan eskiga yozilgan - history_archive.reverse_rows bilan
+    bloklab teskari o'giriladi). Xotirada ko'pi bilan bitta blok.
+    """
+    if include_archive:
+        archives = HistoryArchive.objects.order_by('month')
+        if start is not None:
+            archives = archives.filter(month__gte=history_archive.month_start(start).date())
+        if end is not None:
+            archives = archives.filter(month__lt=timezone.localtime(end).date())
+        names = [name for name, _ in HISTORY_COLUMNS]
+        for archive in archives:
+            if user_id is not None:
+                rows = history_archive.reverse_rows(history_archive.read_user_archive(archive, user_id))
+            else:
+                rows = history_archive.read_archive(archive)
+            for row in rows:
+                created_at = datetime.fromisoformat(row['created_at'])
+                if (start is not None and created_at < start) or (end is not None and created_at >= end):
+                    continue
+                yield dict({name: row[name] for name in names}, created_at=created_at)
+
+    if queryset is None:
+        queryset = PricingHistory.objects.all()
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+    yield from iter_rows(queryset, HISTORY_COLUMNS, chunk_size)
+
+
+# ============= KODLASH =============
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _buffered(lines):
+    """Kichik satrlarni FLUSH_BYTES lik bo'laklarga yig'ish"""
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def csv_lines(rows, names):
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def render(values):
+        line.seek(0)
+        line.truncate()
+        writer.writerow(values)
+        return line.getvalue()
+
+    yield render(names)
+    for row in rows:
+        yield render([_plain(row[name]) for name in names])
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps({key: _plain(value) for key, value in row.items()}, ensure_ascii=False) + '\n'
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def streaming_response(rows, columns, fmt=CSV, compress=False, filename='export'):
+    """Eksport javobi: fayl nomi kengaytmasi format va gzip bo'yicha qo'shiladi"""
+    if fmt == CSV:
+        lines = csv_lines(rows, [name for name, _ in columns])
+    else:
+        lines = jsonl_lines(rows)
+    chunks = _buffered(lines)
+    content_type = CONTENT_TYPES[fmt]
+    filename = f'{filename}.{fmt}'
+    if compress:
+        chunks = gzip_stream(chunks)
+        content_type = 'application/gzip'
+        filename += '.gz'
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    response['X-Accel-Buffering'] = 'no'  # nginx buferlamasin
+    return response
@@ -0,0 +1,500 @@
+# payments/history_archive.py - PricingHistory: oylik bo'laklar va arxiv
+"""
+Live jadval faqat oxirgi PRICING_HISTORY_LIVE_MONTHS oyni saqlaydi, yopilgan
+oylar HISTORY_ARCHIVE_DIR/pricing_history/YYYY-MM.jsonl.gz fayllariga
+ko'chiriladi (HistoryArchive katalogida qayd etiladi).
+
+- PostgreSQL: pricing_history native RANGE (created_at) bo'yicha oylik
+  partitionlangan (0014 migratsiya). Oyni arxivlash = partitionni DETACH +
+  DROP, katta DELETE yo'q.
+- SQLite: bitta jadval, (created_at, id) indeksi; arxivlangan oy qatorlari
+  bo'laklab o'chiriladi.
+
+O'qish (admin, tarix API) iter_history() orqali: avval live jadval, keyin
+arxiv fayllari - bir xil (-created_at, -id) tartibida, keyset kursor bilan.
+Arxiv faylida har bir foydalanuvchi alohida gzip member (HistoryArchiveSegment:
+offset, length) - bitta foydalanuvchi tarixi faqat o'z segmentlarini o'qiydi
+va limitga yetganda to'xtaydi, boshqa foydalanuvchilar qatorlari ochilmaydi.
+Oyning barcha qatorlari esa vaqt bloklarida (HistoryArchive.timeline) - ikki
+yo'nalishda ham bittadan blok o'qiladi, xotira oy hajmiga bog'liq emas.
+"""
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import os
+import tempfile
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import HistoryArchive, HistoryArchiveSegment, PricingHistory
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 5000
+EXPORT_CHUNK_SIZE = 5000
+SEGMENT_READ_SIZE = 1 << 16
+TIMELINE_BLOCK_ROWS = 5000
+PARTITION_PREFIX = 'pricing_history_y'
+
+
+# ============= OY CHEGARALARI =============
+
+def month_start(value):
+    """Berilgan vaqt (yoki sana) oyining boshlanishi - joriy timezone da"""
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, 1)
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    start = value.replace(day=1, hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    return timezone.make_aware(start)
+
+
+def add_months(start, months):
+    index = start.year * 12 + start.month - 1 + months
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+
+
+def archive_cutoff(now=None, live_months=None):
+    """Shu vaqtdan oldingi oylar arxivlanadi (joriy oy + live_months-1 oldingi oy qoladi)"""
+    if live_months is None:
+        live_months = settings.PRICING_HISTORY_LIVE_MONTHS
+    return add_months(month_start(now or timezone.now()), -(max(live_months, 1) - 1))
+
+
+def archive_path(start):
+    return os.path.join(settings.HISTORY_ARCHIVE_DIR, 'pricing_history', f'{start:%Y-%m}.jsonl.gz')
+
+
+# ============= POSTGRESQL PARTITIONLAR =============
+
+def partition_name(start):
+    return f'{PARTITION_PREFIX}{start:%Y}m{start:%m}'
+
+
+def _is_partitioned(cursor):
+    cursor.execute("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                   "WHERE c.relname = 'pricing_history'")
+    return cursor.fetchone() is not None
+
+
+def _create_partition(cursor, start):
+    end = add_months(start, 1)
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF pricing_history "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+def convert_to_partitioned(conn):
+    """
+    Mavjud pricing_history ni oylik partitionlangan jadvalga aylantirish (faqat PostgreSQL).
+    PRIMARY KEY (id, created_at) bo'ladi - partition kaliti PK ichida bo'lishi shart.
+    Indekslar (pkey dan tashqari) asl nomlari bilan qayta yaratiladi.
+    """
+    with conn.cursor() as cursor:
+        if _is_partitioned(cursor):
+            return
+        cursor.execute("SELECT indexdef FROM pg_indexes WHERE tablename = 'pricing_history' "
+                       "AND indexname <> 'pricing_history_pkey'")
+        index_defs = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT min(created_at) FROM pricing_history")
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute("ALTER TABLE pricing_history RENAME TO pricing_history_legacy")
+        cursor.execute("CREATE SEQUENCE pricing_history_seq")
+        cursor.execute("""
+            CREATE TABLE pricing_history (
+                id bigint NOT NULL DEFAULT nextval('pricing_history_seq'),
+                phone_model varchar(255) NOT NULL,
+                price numeric(12, 2) NOT NULL,
+                created_at timestamp with time zone NOT NULL,
+                user_id bigint NOT NULL REFERENCES bot_users (id) DEFERRABLE INITIALLY DEFERRED,
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
+        """)
+        cursor.execute("ALTER SEQUENCE pricing_history_seq OWNED BY pricing_history.id")
+        # Oyi yaratilmagan qatorlar uchun (ensure_partitions ularni ko'chiradi)
+        cursor.execute("CREATE TABLE pricing_history_default PARTITION OF pricing_history DEFAULT")
+
+        start = month_start(oldest) if oldest else month_start(timezone.now())
+        last = add_months(month_start(timezone.now()), 3)
+        while start < last:
+            _create_partition(cursor, start)
+            start = add_months(start, 1)
+
+        cursor.execute("INSERT INTO pricing_history (id, phone_model, price, created_at, user_id) "
+                       "SELECT id, phone_model, price, created_at, user_id FROM pricing_history_legacy")
+        cursor.execute("SELECT setval('pricing_history_seq', COALESCE(max(id), 0) + 1, false) FROM pricing_history")
+        cursor.execute("DROP TABLE pricing_history_legacy")
+        for index_def in index_defs:
+            cursor.execute(index_def)
+
+
+def ensure_partitions(ahead=3, now=None):
+    """
+    Joriy va keyingi `ahead` oy partitionlari (PostgreSQL). Default partitionga
+    tushib qolgan qatorlar yangi oy partitioniga ko'chiriladi.
+    Qaytaradi: yaratilgan partition nomlari.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not _is_partitioned(cursor):
+            return []
+        start = month_start(now or timezone.now())
+        for offset in range(ahead + 1):
+            month = add_months(start, offset)
+            name = partition_name(month)
+            cursor.execute("SELECT to_regclass(%s)", [name])
+            if cursor.fetchone()[0] is not None:
+                continue
+            end = add_months(month, 1)
+            cursor.execute("SELECT count(*) FROM pricing_history_default WHERE created_at >= %s AND created_at < %s",
+                           [month, end])
+            stray = cursor.fetchone()[0]
+            if stray:
+                cursor.execute(f"CREATE TABLE {name}_move AS SELECT * FROM pricing_history_default "
+                               f"WHERE created_at >= %s AND created_at < %s", [month, end])
+                cursor.execute("DELETE FROM pricing_history_default WHERE created_at >= %s AND created_at < %s",
+                               [month, end])
+            _create_partition(cursor, month)
+            if stray:
+                cursor.execute(f"INSERT INTO pricing_history SELECT * FROM {name}_move")
+                cursor.execute(f"DROP TABLE {name}_move")
+            created.append(name)
+    return created
+
+
+def _drop_live_month(start, end, max_id):
+    """Arxivlangan oy qatorlarini live jadvaldan olib tashlash"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            if _is_partitioned(cursor):
+                name = partition_name(start)
+                cursor.execute("SELECT to_regclass(%s)", [name])
+                if cursor.fetchone()[0] is not None:
+                    cursor.execute(f"ALTER TABLE pricing_history DETACH PARTITION {name}")
+                    cursor.execute(f"DROP TABLE {name}")
+
+    # SQLite / default partition / partitionsiz PostgreSQL: bo'laklab DELETE
+    rows = PricingHistory.objects.filter(created_at__gte=start, created_at__lt=end, id__lte=max_id)
+    deleted = 0
+    while True:
+        ids = list(rows.values_list('id', flat=True)[:DELETE_BATCH_SIZE])
+        if not ids:
+            return deleted
+        deleted += PricingHistory.objects.filter(id__in=ids).delete()[0]
+
+
+# ============= ARXIVLASH =============
+
+def _row(pk, user_id, telegram_id, phone_model, price, created_at):
+    return {
+        'id': pk,
+        'user_id': user_id,
+        'telegram_id': telegram_id,
+        'phone_model': phone_model,
+        'price': str(price),
+        'created_at': created_at.isoformat(),
+    }
+
+
+def archivable_months(now=None, live_months=None):
+    """Live jadvalda qolgan, cutoff dan oldingi oylar (eskidan yangiga)"""
+    cutoff = archive_cutoff(now, live_months)
+    oldest = PricingHistory.objects.filter(created_at__lt=cutoff).order_by('created_at', 'id') \
+        .values_list('created_at', flat=True).first()
+    months = []
+    start = month_start(oldest) if oldest else cutoff
+    while start < cutoff:
+        months.append(start)
+        start = add_months(start, 1)
+    return months
+
+
+def _user_order(row):
+    """Segment tartibi (reverse=True bilan): user_id o'sish, foydalanuvchi ichida (created_at, id) kamayish"""
+    return -row['user_id'], datetime.fromisoformat(row['created_at']), row['id']
+
+
+def _time_order(row):
+    return datetime.fromisoformat(row['created_at']), row['id']
+
+
+def _write_member(raw, items):
+    """items ni bitta gzip member qilib yozish. Qaytaradi: (offset, length, qatorlar, narxlar yig'indisi)"""
+    offset, count, total = raw.tell(), 0, Decimal('0')
+    with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as out:
+        for item in items:
+            out.write((json.dumps(item, ensure_ascii=False) + '\n').encode())
+            count += 1
+            total += Decimal(item['price'])
+    return offset, raw.tell() - offset, count, total
+
+
+def _user_sources(previous, live):
+    """Segmentlar uchun manbalar (_user_order tartibida)"""
+    if previous is None:
+        return [live]
+    if previous.per_user:
+        segments = previous.segments.order_by('offset')
+        return [live, (row for segment in segments.iterator() for row in _read_segment(previous, segment))]
+    # Eski (segmentsiz) arxiv vaqt tartibida - bir marta xotirada qayta tartiblanadi
+    return [live, sorted(read_archive(previous), key=_user_order, reverse=True)]
+
+
+def archive_month(start):
+    """
+    Bitta oyni arxivlash. Fayl ikki qismdan iborat (ikkalasi ham gzip memberlar):
+    - har bir foydalanuvchi qatorlari alohida member ((-created_at, -id) tartibida),
+      joyi HistoryArchiveSegment da - bitta foydalanuvchi tarixi uchun;
+    - vaqt bloklari: oyning barcha qatorlari (created_at, id) tartibida,
+      TIMELINE_BLOCK_ROWS qatorlik memberlar (HistoryArchive.timeline) - admin
+      "barcha tarix", eksport va rolluplar xotirani bitta blok bilan cheklab o'qiydi.
+    Fayl .tmp -> fsync -> rename; katalog, segmentlar va live qatorlarni
+    o'chirish bitta tranzaksiyada. Qayta ishga tushirish xavfsiz: fayl qayta
+    yoziladi, avval arxivlangan qatorlar bilan birlashtiriladi (eski formatdagi
+    arxiv shu yo'l bilan qayta yoziladi).
+    Qaytaradi: HistoryArchive yoki None (oyda qator yo'q).
+    """
+    end = add_months(start, 1)
+    path = archive_path(start)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    previous = HistoryArchive.objects.filter(month=start.date()).first()
+    month_rows = PricingHistory.objects.filter(created_at__gte=start, created_at__lt=end)
+    # Ikki o'qish (segmentlar va vaqt bloklari) bir xil qatorlarni ko'rishi uchun
+    max_id = month_rows.aggregate(top=Max('id'))['top'] or 0
+    if max_id == 0 and previous is not None and previous.per_user and previous.timeline:
+        return previous
+    if max_id == 0 and previous is None:
+        return None
+    month_rows = month_rows.filter(id__lte=max_id)
+
+    def live(*ordering):
+        rows = month_rows.order_by(*ordering) \
+            .values_list('id', 'user_id', 'user__telegram_id', 'phone_model', 'price', 'created_at')
+        return (_row(*values) for values in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE))
+
+    segments, timeline = [], []
+    count, total = 0, Decimal('0')
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as raw:
+        users = heapq.merge(*_user_sources(previous, live('user_id', '-created_at', '-id')),
+                            key=_user_order, reverse=True)
+        for uid, items in groupby(users, key=itemgetter('user_id')):
+            offset, length, user_rows, user_total = _write_member(raw, items)
+            segments.append(HistoryArchiveSegment(user_id=uid, offset=offset, length=length, rows=user_rows))
+            count += user_rows
+            total += user_total
+
+        sources = [live('created_at', 'id')]
+        if previous is not None:
+            sources.append(read_archive(previous))
+        ordered = heapq.merge(*sources, key=_time_order)
+        while True:
+            block = list(islice(ordered, TIMELINE_BLOCK_ROWS))
+            if not block:
+                break
+            offset, length, block_rows, _ = _write_member(raw, block)
+            timeline.append([offset, length, block_rows, block[0]['created_at']])
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    digest = hashlib.sha256()
+    with open(tmp, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    os.replace(tmp, path)
+
+    with transaction.atomic():
+        archive, _ = HistoryArchive.objects.update_or_create(month=start.date(), defaults={
+            'path': os.path.relpath(path, settings.HISTORY_ARCHIVE_DIR),
+            'rows': count,
+            'total_price': total,
+            'size_bytes': os.path.getsize(path),
+            'sha256': digest.hexdigest(),
+            'per_user': True,
+            'timeline': timeline,
+        })
+        archive.segments.all().delete()
+        for segment in segments:
+            segment.archive = archive
+        HistoryArchiveSegment.objects.bulk_create(segments, batch_size=DELETE_BATCH_SIZE)
+        deleted = _drop_live_month(start, end, max_id) if max_id else 0
+
+    logger.info(f"Tarix arxivlandi: {start:%Y-%m}, {count} qator, {len(segments)} segment, "
+                f"{len(timeline)} blok, live dan {deleted} o'chirildi")
+    return archive
+
+
+# ============= O'QISH (LIVE + ARXIV) =============
+
+def _archive_file(archive):
+    return os.path.join(settings.HISTORY_ARCHIVE_DIR, archive.path)
+
+
+def _read_member(archive, offset, length):
+    """Bitta gzip member bo'laklab ochiladi - o'quvchi to'xtasa, qolgani o'qilmaydi"""
+    decoder = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    pending = b''
+    with open(_archive_file(archive), 'rb') as f:
+        f.seek(offset)
+        left = length
+        while left:
+            block = f.read(min(left, SEGMENT_READ_SIZE))
+            if not block:
+                raise ValueError(f"Arxiv fayli qisqa: {archive.path} ({offset}+{length})")
+            left -= len(block)
+            *lines, pending = (pending + decoder.decompress(block)).split(b'\n')
+            for line in lines:
+                yield json.loads(line)
+    pending += decoder.flush()
+    if pending.strip():
+        yield json.loads(pending)
+
+
+def _read_segment(archive, segment):
+    return _read_member(archive, segment.offset, segment.length)
+
+
+def reverse_rows(rows, block_rows=TIMELINE_BLOCK_ROWS):
+    """
+    Qatorlarni teskari tartibda berish, xotirada ko'pi bilan bitta blok:
+    bloklar vaqtinchalik faylga gzip member sifatida yoziladi, keyin oxiridan o'qiladi.
+    """
+    with tempfile.TemporaryFile() as spill:
+        blocks = []
+        while True:
+            block = list(islice(rows, block_rows))
+            if not block:
+                break
+            offset = spill.tell()
+            spill.write(gzip.compress(json.dumps(block, ensure_ascii=False).encode(), mtime=0))
+            blocks.append((offset, spill.tell() - offset))
+        for offset, length in reversed(blocks):
+            spill.seek(offset)
+            yield from reversed(json.loads(gzip.decompress(spill.read(length))))
+
+
+def read_archive(archive, newest_first=False, before=None):
+    """
+    Arxivlangan oyning barcha qatorlari (created_at, id) tartibida
+    (newest_first - kamayish), xotirada ko'pi bilan bitta blok. before - shu
+    (created_at, id) dan yangi qatorlar bo'lgan bloklar ochilmaydi (faqat newest_first).
+    Vaqt bloklarisiz eski arxivlar (`archive_pricing_history --reindex` gacha):
+    segmentsiz fayl qatorma-qator, teskarisi vaqtinchalik fayl orqali; faqat
+    segmentli fayl xotirada tartiblanadi.
+    """
+    if archive.timeline:
+        blocks = archive.timeline
+        if newest_first:
+            blocks = reversed(blocks)
+            if before is not None:
+                blocks = (b for b in blocks if datetime.fromisoformat(b[3]) <= before[0])
+        for offset, length, _, _ in blocks:
+            rows = _read_member(archive, offset, length)
+            yield from reversed(list(rows)) if newest_first else rows
+        return
+
+    if archive.per_user:
+        rows = (row for segment in archive.segments.iterator() for row in _read_segment(archive, segment))
+        yield from sorted(rows, key=_time_order, reverse=newest_first)
+        return
+
+    def flat():
+        with gzip.open(_archive_file(archive), 'rt', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+    yield from reverse_rows(flat()) if newest_first else flat()
+
+
+def read_user_archive(archive, user_id, segment=None):
+    """
+    Bitta foydalanuvchining arxivlangan oyi, (-created_at, -id) tartibida.
+    Segmentlangan arxivda faqat shu foydalanuvchi member i o'qiladi (segment
+    berilmasa katalogdan olinadi); eski arxivda butun fayl skanerlanadi.
+    """
+    if not archive.per_user:
+        return (row for row in read_archive(archive, newest_first=True) if row['user_id'] == user_id)
+    if segment is None:
+        segment = archive.segments.filter(user_id=user_id).first()
+    if segment is None:
+        return iter(())
+    return _read_segment(archive, segment)
+
+
+def _cursor_q(before):
+    """(created_at, id) < before. created_at__lte - indeksdagi diapazon chegarasi (chuqur sahifalar)"""
+    created_at, pk = before
+    return Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=pk))
+
+
+def iter_history(user_id=None, before=None, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE,
+                 indexed_only=False):
+    """
+    Tarix qatorlari (-created_at, -id) tartibida: live jadval, keyin arxivlar.
+    before=(created_at, id) - keyset kursor (shu qatordan keyingilar).
+    start/end - created_at oralig'i [start, end).
+    chunk_size - live jadvaldan bir o'qishdagi qatorlar (sahifa uchun limit + 1).
+    indexed_only - segmentsiz (eski) arxivlar o'tkazib yuboriladi: butun fayl
+    skanerlanmaydi (`archive_pricing_history --reindex` dan keyin ko'rinadi).
+    Har bir qator: id, user_id, telegram_id, phone_model, price (Decimal),
+    created_at (aware datetime), archived.
+    """
+    live = PricingHistory.objects.order_by('-created_at', '-id').values_list(
+        'id', 'user_id', 'user__telegram_id', 'phone_model', 'price', 'created_at'
+    )
+    if user_id is not None:
+        live = live.filter(user_id=user_id)
+    if before is not None:
+        live = live.filter(_cursor_q(before))
+    if start is not None:
+        live = live.filter(created_at__gte=start)
+    if end is not None:
+        live = live.filter(created_at__lt=end)
+
+    for pk, uid, telegram_id, phone_model, price, created_at in live.iterator(chunk_size=chunk_size):
+        yield {'id': pk, 'user_id': uid, 'telegram_id': telegram_id, 'phone_model': phone_model,
+               'price': price, 'created_at': created_at, 'archived': False}
+
+    archives = HistoryArchive.objects.order_by('-month')
+    upper = before[0] if before is not None else end
+    if upper is not None:
+        archives = archives.filter(month__lte=timezone.localtime(upper).date())
+    if start is not None:
+        archives = archives.filter(month__gte=month_start(start).date())
+
+    if indexed_only:
+        archives = archives.filter(per_user=True)
+    segments = {}
+    if user_id is not None:
+        # Foydalanuvchi qatori yo'q segmentlangan oylar umuman ochilmaydi
+        archives = archives.filter(Q(per_user=False) | Q(segments__user_id=user_id)).distinct()
+        segments = {segment.archive_id: segment for segment in HistoryArchiveSegment.objects.filter(user_id=user_id)}
+
+    for archive in archives:
+        if user_id is not None:
+            rows = read_user_archive(archive, user_id, segments.get(archive.id))
+        else:
+            rows = read_archive(archive, newest_first=True, before=before)
+        for row in rows:
+            created_at = datetime.fromisoformat(row['created_at'])
+            if before is not None and (created_at, row['id']) >= tuple(before):
+                continue
+            if start is not None and created_at < start:
+                break
+            if end is not None and created_at >= end:
+                continue
+            yield dict(row, price=Decimal(row['price']), created_at=created_at, archived=True)
@@ -0,0 +1,79 @@
+# payments/idempotency.py - create_payment uchun Idempotency-Key ombori
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+CACHE_PREFIX = 'payments:idem:'
+IN_PROGRESS = object()
+
+
+def _normalize_id(value):
+    """"123", " 123" va 123 - bitta kalit (JSON da son yoki satr kelishi mumkin)"""
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return value
+
+
+def build_key(request, telegram_id, tariff_id):
+    """
+    Idempotency-Key header yoki body dagi `nonce` dan kalit.
+    Kalit telegram_id va tariff_id bilan chegaralanadi. Yo'q bo'lsa None.
+    """
+    raw = request.headers.get('Idempotency-Key') or request.data.get('nonce')
+    if not raw:
+        return None
+    return f"{_normalize_id(telegram_id)}:{_normalize_id(tariff_id)}:{raw}"[:255]
+
+
+def lookup(key):
+    """Tez yo'l: oldin saqlangan javob (faqat cache dan). Topilmasa None"""
+    return cache.get(CACHE_PREFIX + key)
+
+
+def claim(key):
+    """
+    Kalitni band qilish (tranzaksiya ichida chaqiriladi).
+    Qaytaradi: None - kalit yangi, so'rovni bajarish kerak;
+               saqlangan javob (dict) - qayta yuborilgan so'rov;
+               IN_PROGRESS - xuddi shu kalit bilan so'rov hali tugamagan.
+    """
+    expires_at = timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_TTL)
+    record, created = IdempotencyKey.objects.get_or_create(key=key, defaults={'expires_at': expires_at})
+    if created:
+        return None
+
+    if record.is_expired:
+        # Muddati o'tgan kalit - qaytadan band qilamiz
+        IdempotencyKey.objects.filter(pk=record.pk).update(response=None, expires_at=expires_at)
+        return None
+
+    if record.response is None:
+        return IN_PROGRESS
+    return record.response
+
+
+def store(key, response):
+    """Muvaffaqiyatli javobni DB ga, commit'dan keyin cache ga yozish"""
+    IdempotencyKey.objects.filter(key=key).update(response=response)
+    transaction.on_commit(
+        lambda: cache.set(CACHE_PREFIX + key, response, timeout=settings.IDEMPOTENCY_TTL)
+    )
+
+
+def purge_expired(batch_size=1000):
+    """Muddati o'tgan kalitlarni bo'laklab o'chirish. Qaytaradi: o'chirilganlar soni"""
+    deleted = 0
+    now = timezone.now()
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,63 @@
+# payments/management/commands/archive_pricing_history.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments import history_archive, rollups
+from payments.models import HistoryArchive, PricingHistory
+
+
+class Command(BaseCommand):
+    help = ("PricingHistory yopilgan oylarini siqilgan faylga ko'chirish (oyiga bir marta, cron). "
+            "PostgreSQL da kelgusi oy partitionlarini ham yaratadi")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--live-months', type=int, default=settings.PRICING_HISTORY_LIVE_MONTHS,
+                            help="Live jadvalda qoladigan oylar soni (joriy oy bilan)")
+        parser.add_argument('--partitions-ahead', type=int, default=3)
+        parser.add_argument('--dry-run', action='store_true', help="Faqat arxivlanadigan oylarni ko'rsatish")
+        parser.add_argument('--reindex', action='store_true',
+                            help="Eski formatdagi arxivlarni segmentlar va vaqt bloklari bilan qayta yozish")
+
+    def handle(self, *args, **options):
+        for name in history_archive.ensure_partitions(ahead=options['partitions_ahead']):
+            self.stdout.write(f"Partition yaratildi: {name}")
+
+        if options['reindex']:
+            for archive in HistoryArchive.objects.order_by('month'):
+                if archive.per_user and archive.timeline:
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(f"{archive.month:%Y-%m}: segmentlanadi")
+                    continue
+                start = history_archive.month_start(archive.month)
+                end = history_archive.add_months(start, 1)
+                if PricingHistory.objects.filter(created_at__gte=start, created_at__lt=end).exists():
+                    # Live qatorlari bor oy pastdagi oddiy arxivlashda (rollup tekshiruvi bilan) segmentlanadi
+                    continue
+                archive = history_archive.archive_month(start)
+                self.stdout.write(self.style.SUCCESS(
+                    f"{start:%Y-%m}: {archive.segments.count()} segment, {archive.size_bytes} bayt"
+                ))
+
+        months = history_archive.archivable_months(live_months=options['live_months'])
+        if not months:
+            self.stdout.write("Arxivlanadigan oy yo'q")
+            return
+
+        rolled_up = rollups.watermark(rollups.PRICING)
+        for start in months:
+            end = history_archive.add_months(start, 1)
+            if PricingHistory.objects.filter(created_at__gte=start, created_at__lt=end, id__gt=rolled_up).exists():
+                # Rollup hali o'qimagan qatorlar arxivga ketsa hisobotdan tushib qoladi
+                self.stdout.write(self.style.WARNING(f"{start:%Y-%m}: avval update_rollups ishga tushiring"))
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"{start:%Y-%m}: arxivlanadi")
+                continue
+            archive = history_archive.archive_month(start)
+            if archive is None:
+                self.stdout.write(f"{start:%Y-%m}: qator yo'q")
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{start:%Y-%m}: {archive.rows} qator, {archive.size_bytes} bayt -> {archive.path}"
+                ))
@@ -0,0 +1,250 @@
+# payments/management/commands/bench_api.py
+import itertools
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+from contextlib import nullcontext
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from payments.bench import (
+    SEED_TELEGRAM_BASE, UnexpectedResponse, in_process_settings, run_concurrent, scratch_database, seed_volume,
+)
+from payments.models import BotUser, Payment, PricingTariff
+
+PREFIX = '/api/payments'
+
+DEFAULT_USERS = 100_000
+DEFAULT_HISTORY = 1_000_000
+DEFAULT_PAYMENTS = 200_000
+
+INSUFFICIENT_BALANCE = 'Balans yetarli emas'
+
+
+class Workload:
+    """
+    Endpoint so'rovlari. base_url bo'lmasa in-process test Client, aks holda
+    ishlab turgan serverga HTTP (gunicorn sozlamalarini o'lchash uchun).
+    Har bir thread o'z Client/Session obyektini ishlatadi.
+    """
+
+    def __init__(self, users, payments, tariff_ids, base_url=None, rng_seed=0):
+        self.users = users
+        self.payments = payments
+        self.tariff_ids = tariff_ids
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self._local = threading.local()
+        self._new_ids = itertools.count(SEED_TELEGRAM_BASE + users + int(time.time()) % 1_000_000 * 1000)
+        self._rng_seed = rng_seed
+        self.last_error = None
+
+    def _thread_state(self):
+        local = self._local
+        if not hasattr(local, 'rng'):
+            local.rng = random.Random(self._rng_seed + threading.get_ident())
+            if self.base_url:
+                import requests
+                local.http = requests.Session()
+            else:
+                local.http = Client()
+        return local
+
+    def _get(self, path):
+        local = self._thread_state()
+        if self.base_url:
+            response = local.http.get(self.base_url + PREFIX + path, timeout=30)
+        else:
+            response = local.http.get(PREFIX + path)
+        return response.status_code, response.content
+
+    def _post(self, path, data):
+        local = self._thread_state()
+        if self.base_url:
+            response = local.http.post(self.base_url + PREFIX + path, json=data, timeout=30)
+        else:
+            response = local.http.post(PREFIX + path, data, content_type='application/json')
+        return response.status_code, response.content
+
+    def _expect(self, reply, expected=200):
+        """Kutilmagan status (DisallowedHost 400, redirect, 5xx ...) - xato, ok emas"""
+        status, content = reply
+        if status != expected:
+            self.last_error = UnexpectedResponse(status, content)
+            raise self.last_error
+        return True
+
+    def _telegram_id(self):
+        return SEED_TELEGRAM_BASE + self._thread_state().rng.randrange(self.users)
+
+    def get_tariffs(self):
+        return self._expect(self._get('/tariffs/'))
+
+    def create_user(self):
+        return self._expect(self._post('/user/create/', {'telegram_id': next(self._new_ids), 'full_name': 'bench'}))
+
+    def get_balance(self):
+        return self._expect(self._get(f'/user/{self._telegram_id()}/balance/'))
+
+    def use_pricing(self):
+        status, content = self._post('/pricing/use/', {
+            'telegram_id': self._telegram_id(), 'phone_model': 'iPhone 13', 'price': 5000000,
+        })
+        # Balansi tugagan user 400 qaytaradi - bu ham to'liq ishlangan so'rov (boshqa 400 lar - xato)
+        if status == 400 and json.loads(content).get('error') == INSUFFICIENT_BALANCE:
+            return True
+        return self._expect((status, content))
+
+    def create_payment(self):
+        return self._expect(self._post('/payment/create/', {
+            'telegram_id': self._telegram_id(), 'tariff_id': self._thread_state().rng.choice(self.tariff_ids),
+        }))
+
+    def check_payment_status(self):
+        order_id = f'seed-{self._thread_state().rng.randrange(self.payments)}'
+        return self._expect(self._get(f'/payment/status/{order_id}/'))
+
+
+ENDPOINTS = ['get_tariffs', 'create_user', 'get_balance', 'use_pricing', 'create_payment', 'check_payment_status']
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def database_version():
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version
+    if connection.vendor == 'postgresql':
+        return connection.pg_version
+    return None
+
+
+def database_profile():
+    """DB_PROFILE va haqiqatda qo'llangan ulanish sozlamalari (natijalarni solishtirish uchun)"""
+    db = connection.settings_dict
+    profile = {
+        'name': settings.DB_PROFILE,
+        'conn_max_age': db['CONN_MAX_AGE'],
+        'conn_health_checks': db['CONN_HEALTH_CHECKS'],
+        'pool': db['OPTIONS'].get('pool') or False,
+    }
+    if connection.vendor == 'sqlite':
+        profile['transaction_mode'] = connection.transaction_mode or 'DEFERRED'
+        with connection.cursor() as cursor:
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size'):
+                profile[pragma] = cursor.execute(f'PRAGMA {pragma}').fetchone()[0]
+    return profile
+
+
+class Command(BaseCommand):
+    help = ("Bot API hot path benchmarki: hajmli seed (100k user, 1M tarix, 200k to'lov), "
+            "endpoint x concurrency bo'yicha rps va p50/p99, natija JSON faylga")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+        parser.add_argument('--history', type=int, default=DEFAULT_HISTORY)
+        parser.add_argument('--payments', type=int, default=DEFAULT_PAYMENTS)
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help="Seed hajmlarini ko'paytirish (masalan 0.01 - tezkor tekshiruv)")
+        parser.add_argument('--endpoints', choices=ENDPOINTS, nargs='+', default=ENDPOINTS)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--iterations', type=int, default=200, help="Har bir worker uchun")
+        parser.add_argument('--output', help="Natija JSON fayli (default: stdout)")
+        parser.add_argument('--label', default='', help="Natijaga yoziladigan belgi (masalan 'workers=3')")
+        parser.add_argument('--allow-errors', action='store_true',
+                            help="Xato javoblarda to'xtamaslik (errors natijaga yoziladi, masalan DB profillarini "
+                                 "'database is locked' bo'yicha solishtirish)")
+        parser.add_argument('--url', help="Ishlab turgan server (masalan http://localhost:8000). Seed shu "
+                                          "serverning DB siga (joriy sozlamalar) bir marta yoziladi")
+        parser.add_argument('--allow-seed', action='store_true',
+                            help="--url rejimida DEBUG=False bo'lsa ham joriy DB ga seed yozish")
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        users = max(1, int(options['users'] * scale))
+        history = int(options['history'] * scale)
+        payments = max(1, int(options['payments'] * scale))
+        if min(options['concurrency']) < 1 or options['iterations'] < 1:
+            raise CommandError("--concurrency va --iterations musbat bo'lishi kerak")
+
+        payme = dict(settings.PAYME_SETTINGS, MERCHANT_ID=settings.PAYME_SETTINGS.get('MERCHANT_ID') or 'bench')
+        database = nullcontext() if options['url'] else scratch_database()
+        client = nullcontext() if options['url'] else in_process_settings()
+        with database, client, override_settings(PAYME_SETTINGS=payme):
+            started = time.perf_counter()
+            tariffs = self._seed(users, history, payments, reuse=bool(options['url']),
+                                 allow_seed=options['allow_seed'])
+            seed_seconds = round(time.perf_counter() - started, 2)
+
+            workload = Workload(users, payments, [t.id for t in tariffs], base_url=options['url'])
+            results = []
+            for name in options['endpoints']:
+                func = getattr(workload, name)
+                for workers in options['concurrency']:
+                    stats = run_concurrent(lambda w, i: func(), workers, options['iterations'])
+                    stats['endpoint'] = name
+                    results.append(stats)
+                    self.stderr.write(
+                        f"{name:22} concurrency={workers:<4} rps={stats['rps']:<8} "
+                        f"p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms ok={stats['ok']} errors={stats['errors']}"
+                    )
+                    if stats['errors'] and not options['allow_errors']:
+                        # Xato javoblar tezligi endpoint tezligi emas - natija yozilmaydi
+                        raise CommandError(f"{name}: {stats['requests'] - stats['ok']} ta xato javob "
+                                           f"(masalan: {workload.last_error})")
+
+            report = {
+                'label': options['label'],
+                'target': options['url'] or 'in-process',
+                'git_revision': git_revision(),
+                'timestamp': int(time.time()),
+                'environment': {
+                    'database': connection.vendor,
+                    'database_version': database_version(),
+                    'database_profile': database_profile(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'api_async': settings.API_ASYNC,
+                },
+                'seed': {'users': users, 'pricing_history': history, 'payments': payments,
+                         'seconds': seed_seconds, 'total_payments': Payment.objects.count()},
+                'iterations': options['iterations'],
+                'results': results,
+            }
+
+        payload = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(payload + '\n')
+            self.stderr.write(f"Natija yozildi: {options['output']}")
+        else:
+            self.stdout.write(payload)
+
+    def _seed(self, users, history, payments, reuse, allow_seed=False):
+        """
+        --url rejimida oldingi seed qayta ishlatiladi (order_id lar noyob). Joriy
+        (scratch emas) DB ga yangi seed faqat DEBUG=True yoki --allow-seed bilan
+        """
+        if reuse and BotUser.objects.filter(telegram_id=SEED_TELEGRAM_BASE).exists():
+            if Payment.objects.filter(order_id=f'seed-{payments - 1}').exists():
+                return list(PricingTariff.objects.filter(is_active=True))
+            raise CommandError("DB da boshqa hajmdagi seed bor - xuddi shu --scale bilan ishga tushiring")
+        if reuse and not (settings.DEBUG or allow_seed):
+            raise CommandError(f"DEBUG=False: {connection.settings_dict['NAME']} ga seed yozilmaydi "
+                               f"(ishlab turgan baza bo'lishi mumkin). Benchmark bazasi bo'lsa --allow-seed bering")
+        return seed_volume(users, history, payments, progress=self._progress)
+
+    def _progress(self, name, done, total):
+        if done == total or done % 100_000 == 0:
+            self.stderr.write(f"seed {name}: {done}/{total}")
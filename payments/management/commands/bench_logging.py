@@ -0,0 +1,144 @@
+# payments/management/commands/bench_logging.py
+import base64
+import copy
+import json
+import logging
+import logging.config
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from payments.bench import UnexpectedResponse, in_process_settings, run_concurrent, scratch_database
+from payments.models import BotUser, Payment
+
+LOGGER_NAMES = ('django', 'payments', 'payme')
+
+
+class SlowStream:
+    """Sekin console (to'lgan stdout pipe, docker log driver) simulyatsiyasi"""
+
+    def __init__(self, stream, delay):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, data):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def sync_config(log_dir, stream):
+    """Eski sozlama: har bir yozuv request threadida console va faylga"""
+    handlers = {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'verbose', 'stream': stream},
+        'file': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(log_dir, 'sync.log'),
+            'maxBytes': 1024 * 1024 * 5,
+            'backupCount': 5,
+            'formatter': 'verbose',
+        },
+    }
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': settings.LOGGING['formatters'],
+        'handlers': handlers,
+        'root': {'handlers': ['console', 'file'], 'level': 'INFO'},
+        'loggers': {
+            name: {'handlers': ['console', 'file'], 'level': 'INFO', 'propagate': False}
+            for name in LOGGER_NAMES
+        },
+    }
+
+
+def queue_config(log_dir, stream):
+    """Joriy settings.LOGGING, faqat chiqish joylari vaqtinchalik"""
+    config = copy.deepcopy(settings.LOGGING)
+    config['handlers']['console']['stream'] = stream
+    config['handlers']['file']['filename'] = os.path.join(log_dir, 'queue.log')
+    for name in LOGGER_NAMES:
+        config['loggers'][name]['level'] = 'INFO'
+    return config
+
+
+class Command(BaseCommand):
+    help = "Payme callback latency: sinxron logging va QueueHandler pipeline solishtirish"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--records', type=int, default=6,
+                            help="Har bir callbackda yoziladigan WARNING yozuvlar (eski kod: 6)")
+        parser.add_argument('--io-delay-ms', type=float, default=0.2,
+                            help="Console ga har bir yozish kechikishi (0 - faqat CPU xarajati)")
+        parser.add_argument('--json', action='store_true', help="Natijani JSON ko'rinishida chiqarish")
+
+    def handle(self, *args, **options):
+        results = []
+        devnull = open(os.devnull, 'w')
+        stream = SlowStream(devnull, options['io_delay_ms'] / 1000)
+        log_dir = tempfile.mkdtemp(prefix='sebmarket-logbench-')
+        payme_logger = logging.getLogger('payme')
+
+        try:
+            with scratch_database(), in_process_settings():
+                user = BotUser.objects.create(telegram_id=1, full_name='bench')
+                Payment.objects.create(user=user, amount=5000, pricing_count=1, payme_transaction_id='bench-tx')
+
+                secret = settings.PAYME_SETTINGS.get('SECRET_KEY') or ''
+                auth = 'Basic ' + base64.b64encode(f'Paycom:{secret}'.encode()).decode()
+                body = json.dumps({'method': 'CheckTransaction', 'params': {'id': 'bench-tx'}, 'id': 1})
+
+                for name, build in (('sync', sync_config), ('queue', queue_config)):
+                    logging.config.dictConfig(build(log_dir, stream))
+                    clients = [Client() for _ in range(options['workers'])]
+
+                    def call(w, i):
+                        # Eski payme_callback har chaqiruvda yozgan hajmdagi loglar
+                        for n in range(options['records']):
+                            payme_logger.warning(f"AUTH HEADER: {auth} RAW BODY: {body} #{n}")
+                        response = clients[w].post(
+                            '/api/payments/payme/callback/', body,
+                            content_type='application/json', HTTP_AUTHORIZATION=auth,
+                        )
+                        # Payme callback har doim 200 - JSON-RPC xatosi (auth va h.k.) ham xato
+                        if response.status_code != 200 or 'error' in response.json():
+                            raise UnexpectedResponse(response.status_code, response.content)
+                        return True
+
+                    stats = run_concurrent(call, options['workers'], options['iterations'])
+
+                    # Navbatdagi yozuvlar yozilib bo'lishini kutamiz (va tashlanganlarini sanaymiz)
+                    handler = payme_logger.handlers[0]
+                    stats['dropped'] = getattr(handler, 'dropped', 0)
+                    if hasattr(handler, 'listener'):
+                        handler.stop()
+
+                    stats['logging'] = name
+                    stats['io_delay_ms'] = options['io_delay_ms']
+                    results.append(stats)
+        finally:
+            logging.config.dictConfig(settings.LOGGING)
+            devnull.close()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for stats in results:
+            self.stdout.write(
+                f"{stats['logging']:6} rps={stats['rps']:<8} p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms "
+                f"errors={stats['errors']} dropped={stats['dropped']}"
+            )
+        if any(stats['errors'] for stats in results):
+            raise CommandError("Xato javoblar bor - solishtirish oddiy so'rov loglarini o'lchamaydi")
+        sync, queued = results
+        self.stdout.write(f"Tejash (p50): {round(sync['p50_ms'] - queued['p50_ms'], 3)}ms har bir callbackda")
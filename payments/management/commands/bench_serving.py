@@ -0,0 +1,119 @@
+# payments/management/commands/bench_serving.py
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+from payments.bench import (
+    UnexpectedResponse, in_process_settings, run_concurrent, run_concurrent_async, scratch_database,
+)
+from payments.models import BotUser, Payment, PricingTariff
+
+PREFIX = '/api/payments'
+
+
+def seed(users):
+    tariff = PricingTariff.objects.create(name='Bench', count=10, price=10000)
+    BotUser.objects.bulk_create(
+        BotUser(telegram_id=n, full_name=f'user {n}', balance=100) for n in range(1, users + 1)
+    )
+    user_ids = dict(BotUser.objects.values_list('telegram_id', 'id'))
+    Payment.objects.bulk_create(
+        Payment(user_id=user_ids[n], tariff=tariff, amount=tariff.price, pricing_count=tariff.count,
+                order_id=f'bench-{n}')
+        for n in range(1, users + 1)
+    )
+
+
+def request_path(users, worker, iteration):
+    """GET endpointlar aralashmasi: balans, to'lov holati, tariflar"""
+    n = (worker * 7919 + iteration) % users + 1
+    kind = iteration % 3
+    if kind == 0:
+        return f'{PREFIX}/user/{n}/balance/'
+    if kind == 1:
+        return f'{PREFIX}/payment/status/bench-{n}/'
+    return f'{PREFIX}/tariffs/'
+
+
+def expect_ok(response):
+    """Aralashmadagi barcha endpointlar 200 qaytaradi - boshqa status xato sanaladi"""
+    if response.status_code != 200:
+        raise UnexpectedResponse(response.status_code, response.content)
+    return True
+
+
+class Command(BaseCommand):
+    help = "Sync (WSGI) va async (ASGI) rejimlarini solishtirish: rps va p99"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128])
+        parser.add_argument('--iterations', type=int, default=50, help="Har bir worker uchun")
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--json', action='store_true', help="Natijani JSON ko'rinishida chiqarish")
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'both':
+            # URLconf rejimi import paytida tanlanadi - har bir rejim alohida processda
+            results = []
+            for mode in ('sync', 'async'):
+                results.extend(self._run_subprocess(mode, options))
+        else:
+            results = self._run(options['mode'], options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for stats in results:
+            self.stdout.write(
+                f"{stats['mode']:6} concurrency={stats['workers']:<4} rps={stats['rps']:<8} "
+                f"p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms errors={stats['errors']}"
+            )
+        if any(stats['errors'] for stats in results):
+            raise CommandError("Xato javoblar bor - natijalar endpoint tezligini ko'rsatmaydi")
+
+    def _run_subprocess(self, mode, options):
+        env = dict(os.environ, API_ASYNC='True' if mode == 'async' else 'False')
+        cmd = [
+            sys.executable, sys.argv[0], 'bench_serving', '--mode', mode, '--json',
+            '--iterations', str(options['iterations']), '--users', str(options['users']),
+            '--concurrency', *map(str, options['concurrency']),
+        ]
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise CommandError(proc.stderr)
+        return json.loads(proc.stdout)
+
+    def _run(self, mode, options):
+        if (mode == 'async') != settings.API_ASYNC:
+            raise CommandError(f"--mode {mode} uchun API_ASYNC={mode == 'async'} bo'lishi kerak")
+
+        users = options['users']
+        results = []
+        with scratch_database(), in_process_settings():
+            seed(users)
+            for workers in options['concurrency']:
+                if mode == 'sync':
+                    clients = [Client() for _ in range(workers)]
+
+                    def call(w, i):
+                        return expect_ok(clients[w].get(request_path(users, w, i)))
+
+                    stats = run_concurrent(call, workers, options['iterations'])
+                else:
+                    clients = [AsyncClient() for _ in range(workers)]
+
+                    async def acall(w, i):
+                        return expect_ok(await clients[w].get(request_path(users, w, i)))
+
+                    stats = run_concurrent_async(acall, workers, options['iterations'])
+
+                stats['mode'] = mode
+                results.append(stats)
+        return results
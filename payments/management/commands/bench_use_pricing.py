@@ -0,0 +1,84 @@
+# payments/management/commands/bench_use_pricing.py
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from payments.bench import run_concurrent, scratch_database
+from payments.models import BotUser, PricingHistory
+
+
+def consume_guarded(telegram_id):
+    with transaction.atomic():
+        result = BotUser.objects.change_balance(-1, telegram_id=telegram_id)
+        if result is None:
+            return False
+        PricingHistory.objects.create(user_id=result[0], phone_model='bench', price=0)
+    return True
+
+
+def consume_legacy(telegram_id):
+    """Eski yo'l: tranzaksiyadan tashqarida o'qish + to'liq save()"""
+    user = BotUser.objects.get(telegram_id=telegram_id)
+    if user.balance <= 0:
+        return False
+    with transaction.atomic():
+        user.balance -= 1
+        user.save()
+        PricingHistory.objects.create(user=user, phone_model='bench', price=0)
+    return True
+
+
+STRATEGIES = {
+    'guarded': consume_guarded,
+    'legacy': consume_legacy,
+}
+
+
+class Command(BaseCommand):
+    help = "use_pricing contention benchmark: bitta userda ko'p parallel iste'molchi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--iterations', type=int, default=200, help="Har bir worker uchun")
+        parser.add_argument('--balance', type=int, default=None,
+                            help="Boshlang'ich balans (default: umumiy so'rovlarning yarmi)")
+        parser.add_argument('--strategy', choices=sorted(STRATEGIES), nargs='+', default=['guarded', 'legacy'])
+        parser.add_argument('--json', action='store_true', help="Natijani JSON ko'rinishida chiqarish")
+
+    def handle(self, *args, **options):
+        results = []
+        with scratch_database():
+            for name in options['strategy']:
+                consume = STRATEGIES[name]
+                for workers in options['workers']:
+                    total = workers * options['iterations']
+                    balance = options['balance'] if options['balance'] is not None else total // 2
+
+                    BotUser.objects.all().delete()
+                    user = BotUser.objects.create(telegram_id=1, full_name='bench', balance=balance)
+
+                    stats = run_concurrent(lambda w, i: consume(user.telegram_id), workers, options['iterations'])
+
+                    user.refresh_from_db()
+                    history = PricingHistory.objects.filter(user=user).count()
+                    stats.update({
+                        'strategy': name,
+                        'start_balance': balance,
+                        'final_balance': user.balance,
+                        'history_rows': history,
+                        # history yozuvlari balansdan ko'p bo'lsa - ortiqcha sarf
+                        'overspend': max(0, history - (balance - user.balance)),
+                    })
+                    results.append(stats)
+
+                    if not options['json']:
+                        self.stdout.write(
+                            f"{name:8} workers={workers:<3} rps={stats['rps']:<8} "
+                            f"p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms "
+                            f"ok={stats['ok']} errors={stats['errors']} "
+                            f"final_balance={user.balance} history={history} overspend={stats['overspend']}"
+                        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,253 @@
+# payments/management/commands/check_replicas.py
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from payments import balance_cache, replicas, tariff_cache
+from payments.bench import SEED_TELEGRAM_BASE, scratch_database, seed_volume
+from payments.models import BotUser, PricingTariff
+from payments.views import _statement_rows
+
+PREFIX = '/api/payments'
+
+
+class SqliteReplication:
+    """
+    SQLite da replikatsiya emulyatsiyasi: primary fayli replika fayllariga
+    backup API bilan nusxalanadi - qo'lda (sync) yoki har interval sekundda
+    (start). Replika kechikishi shu bilan chegaralangan.
+    """
+
+    def __init__(self, aliases):
+        self.aliases = aliases
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sync(self):
+        source = sqlite3.connect(connection.settings_dict['NAME'])
+        try:
+            for alias in self.aliases:
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+        finally:
+            source.close()
+
+    def start(self, interval):
+        def loop():
+            while not self._stop.wait(interval):
+                self.sync()
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+
+class Command(BaseCommand):
+    help = ("O'qish replikalari: endpoint routing, yozuvdan keyin sticky primary va replika "
+            "kechikishi REPLICA_STICKY_SECONDS dan kichikligini tekshirish (vaqtinchalik DB da)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=float, default=2.0,
+                            help="Tekshiruv uchun REPLICA_STICKY_SECONDS (sekund)")
+        parser.add_argument('--samples', type=int, default=20, help="Kechikish o'lchovlari soni")
+        parser.add_argument('--sync-interval', type=float, default=0.2,
+                            help="SQLite: replikatsiya emulyatsiyasi intervali (sekund)")
+
+    def handle(self, *args, **options):
+        aliases = settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError("DB_REPLICAS sozlanmagan (masalan DB_REPLICAS=replica.sqlite3)")
+        window = options['window']
+
+        payme = dict(settings.PAYME_SETTINGS, MERCHANT_ID=settings.PAYME_SETTINGS.get('MERCHANT_ID') or 'check')
+        with scratch_database(), override_settings(REPLICA_STICKY_SECONDS=window, PAYME_SETTINGS=payme):
+            names = {alias: connections[alias].settings_dict['NAME'] for alias in aliases}
+            replication = self._point_replicas(aliases)
+            try:
+                self.failures = []
+                self.client = Client()
+                self._check(aliases, replication, window, options)
+            finally:
+                if replication:
+                    replication.stop()
+                for alias, name in names.items():
+                    connections[alias].close()
+                    connections[alias].settings_dict['NAME'] = name
+
+        if self.failures:
+            raise CommandError(f"{len(self.failures)} ta tekshiruv o'tmadi: {', '.join(self.failures)}")
+        self.stdout.write(self.style.SUCCESS("Replikalar to'g'ri ishlayapti"))
+
+    def _point_replicas(self, aliases):
+        """Replikalar vaqtinchalik primary ning nusxasiga (SQLite) yoki o'sha DB ga (PostgreSQL)"""
+        for alias in aliases:
+            connections[alias].close()
+            if connection.vendor == 'sqlite':
+                connections[alias].settings_dict['NAME'] = f"{connection.settings_dict['NAME']}.{alias}"
+            else:
+                connections[alias].settings_dict['NAME'] = connection.settings_dict['NAME']
+        return SqliteReplication(aliases) if connection.vendor == 'sqlite' else None
+
+    def _wait_replicated(self, replication, window):
+        if replication:
+            replication.sync()
+        else:
+            time.sleep(window)
+
+    def _routed(self, func):
+        """func() natijasi va {alias: so'rovlar soni}"""
+        with ExitStack() as stack:
+            captures = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in [DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS]
+            }
+            result = func()
+        return result, {alias: len(capture) for alias, capture in captures.items() if len(capture)}
+
+    def _expect(self, name, counts, replica, detail=''):
+        """replica=True - faqat replikalar, False - faqat default"""
+        on_default = DEFAULT_DB_ALIAS in counts
+        on_replica = any(alias in counts for alias in settings.DATABASE_REPLICAS)
+        ok = on_replica and not on_default if replica else on_default and not on_replica
+        label = 'OK  ' if ok else 'FAIL'
+        self.stdout.write(f"{label} {name:45} {counts} {detail}")
+        if not ok:
+            self.failures.append(name)
+
+    def _balance(self, telegram_id):
+        response = self.client.get(f'{PREFIX}/user/{telegram_id}/balance/')
+        return response.json().get('balance')
+
+    def _check(self, aliases, replication, window, options):
+        seed_volume(users=100, history=0, payments=50)
+        user_a, user_b = SEED_TELEGRAM_BASE, SEED_TELEGRAM_BASE + 1
+        BotUser.objects.filter(telegram_id__in=[user_a, user_b]).update(balance=10)
+        self._wait_replicated(replication, window)
+
+        # ============= ROUTING =============
+        tariff_cache.invalidate_local()
+        _, counts = self._routed(lambda: self.client.get(f'{PREFIX}/tariffs/'))
+        self._expect("get_tariffs -> replika", counts, replica=True)
+        _, counts = self._routed(lambda: self._balance(user_a))
+        self._expect("get_balance -> replika", counts, replica=True)
+        _, counts = self._routed(lambda: self.client.get(f'{PREFIX}/payment/status/seed-0/'))
+        self._expect("check_payment_status -> replika", counts, replica=True)
+        old, now = timezone.now() - timedelta(days=400), timezone.now()
+        _, counts = self._routed(lambda: list(_statement_rows(old, now - timedelta(hours=1))))
+        self._expect("GetStatement (o'tgan davr) -> replika", counts, replica=True)
+        _, counts = self._routed(lambda: list(_statement_rows(old, now)))
+        self._expect("GetStatement (hozirgacha) -> primary", counts, replica=False)
+
+        # ============= STICKY PRIMARY =============
+        response, counts = self._routed(lambda: self.client.post(
+            f'{PREFIX}/pricing/use/', {'telegram_id': user_a, 'phone_model': 'iPhone 13', 'price': 1000},
+            content_type='application/json',
+        ))
+        self._expect("use_pricing (yozuv) -> primary", counts, replica=False, detail=f"status={response.status_code}")
+        balance, counts = self._routed(lambda: self._balance(user_a))
+        self._expect("yozuvdan keyin get_balance -> primary", counts, replica=False, detail=f"balance={balance}")
+        if balance != 9:
+            self.failures.append("o'z yozuvini o'qish")
+            self.stdout.write(f"FAIL o'z yozuvini o'qish: balance={balance}, kutilgan 9")
+        _, counts = self._routed(lambda: self._balance(user_b))
+        self._expect("boshqa user get_balance -> replika", counts, replica=True)
+
+        response = self.client.post(f'{PREFIX}/payment/create/', {
+            'telegram_id': user_b, 'tariff_id': PricingTariff.objects.values_list('id', flat=True).first(),
+        }, content_type='application/json')
+        order_id = response.json().get('order_id')
+        response, counts = self._routed(lambda: self.client.get(f'{PREFIX}/payment/status/{order_id}/'))
+        self._expect("yangi buyurtma holati -> primary", counts, replica=False, detail=f"status={response.status_code}")
+
+        time.sleep(window)
+        self._wait_replicated(replication, window)
+        balance_cache.get_cache().invalidate(user_a)
+        balance, counts = self._routed(lambda: self._balance(user_a))
+        self._expect("oyna tugagach get_balance -> replika", counts, replica=True, detail=f"balance={balance}")
+
+        # ============= PROCESSLAR ORASIDA =============
+        self._check_cross_process()
+
+        # ============= ESKIRISH CHEGARASI =============
+        if replication:
+            replication.start(options['sync_interval'])
+        lags = self._measure_lag(aliases, options['samples'], timeout=window * 5)
+        if not lags:
+            return
+        worst = max(lags)
+        ok = worst < window
+        self.stdout.write(
+            f"{'OK  ' if ok else 'FAIL'} {'replika kechikishi < REPLICA_STICKY_SECONDS':45} "
+            f"p50={statistics.median(lags) * 1000:.0f}ms max={worst * 1000:.0f}ms window={window * 1000:.0f}ms"
+        )
+        if not ok:
+            self.failures.append("kechikish")
+
+    def _report(self, name, ok, detail=''):
+        self.stdout.write(f"{'OK  ' if ok else 'FAIL'} {name:45} {detail}")
+        if not ok:
+            self.failures.append(name)
+
+    def _check_cross_process(self):
+        """Sticky belgi boshqa processda (boshqa worker, sidecar) yozilganda"""
+        scope = f'check:{time.time_ns()}'
+        proc = subprocess.run(
+            [sys.executable, sys.argv[0], 'shell', '-c', f'from payments import replicas; replicas.mark_written({scope!r})'],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            self._report("boshqa process yozuvi", False, proc.stderr.strip()[-300:])
+            return
+
+        if settings.SHARED_CACHE:
+            alias = replicas.pick(scope)
+            self._report("boshqa process yozuvi -> primary", alias == DEFAULT_DB_ALIAS, alias)
+            return
+
+        # Process ichidagi cache: bir nechta workerda replikalar ishlatilmasligi shart
+        with override_settings(GUNICORN_WORKERS=max(2, settings.GUNICORN_WORKERS)):
+            alias = replicas.pick(scope)
+        self._report("umumiy cache yo'q, ko'p worker -> primary", alias == DEFAULT_DB_ALIAS, alias)
+        self.stdout.write(
+            f"WARN {'process ichidagi cache':45} boshqa process (sidecar, grant_balance) yozuvi sticky emas - "
+            "umumiy CACHE_BACKEND ishlating"
+        )
+
+    def _measure_lag(self, aliases, samples, timeout):
+        """default ga yozilgan belgi har bir replikada ko'ringuncha o'tgan vaqt"""
+        user = BotUser.objects.get(telegram_id=SEED_TELEGRAM_BASE + 2)
+        lags = []
+        for n in range(samples):
+            marker = f'lag-{n}'
+            BotUser.objects.filter(pk=user.pk).update(full_name=marker)
+            started = time.perf_counter()
+            for alias in aliases:
+                while not BotUser.objects.using(alias).filter(pk=user.pk, full_name=marker).exists():
+                    if time.perf_counter() - started > timeout:
+                        self.stdout.write(f"FAIL {alias}: belgi {timeout:.1f}s ichida ko'rinmadi")
+                        self.failures.append(f"{alias} kechikish")
+                        return lags
+                    time.sleep(0.005)
+            lags.append(time.perf_counter() - started)
+        return lags
+
@@ -0,0 +1,38 @@
+# payments/management/commands/dispatch_outbox.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from payments.outbox import dispatch_batch, purge_delivered
+
+
+class Command(BaseCommand):
+    help = "Outbox hodisalarini botga yetkazish (alohida worker sifatida ishlating)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="To'xtovsiz ishlash")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Navbat bo'sh bo'lganda kutish (sekund)")
+        parser.add_argument('--purge-days', type=int, default=None,
+                            help="Shundan eski yetkazilgan hodisalarni o'chirish")
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            deleted = purge_delivered(options['purge_days'])
+            self.stdout.write(f"O'chirildi: {deleted}")
+
+        try:
+            while True:
+                close_old_connections()
+                claimed, delivered, failed = dispatch_batch(options['batch_size'])
+                if claimed:
+                    self.stdout.write(f"Olingan: {claimed}, yetkazildi: {delivered}, xato: {failed}")
+
+                if not options['loop']:
+                    break
+                if claimed < options['batch_size']:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
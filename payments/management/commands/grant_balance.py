@@ -0,0 +1,97 @@
+# payments/management/commands/grant_balance.py
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from payments import balance_grants
+from payments.models import BalanceGrant
+
+
+class Command(BaseCommand):
+    help = ("Ommaviy balans berish/olish: CSV (telegram_id) yoki filtr bo'yicha, bo'laklab to'plamli "
+            "UPDATE bilan. Uzilgan ishni --resume bilan davom ettirish mumkin")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delta', type=int, help="Har bir userga (manfiy - olish, 0 dan pastga tushmaydi)")
+        parser.add_argument('--reason', default='', help="Sabab (audit uchun)")
+        parser.add_argument('--csv', help="telegram_id lar fayli ('telegram_id' ustuni yoki birinchi ustun)")
+        parser.add_argument('--active', action='store_true', help="Filtr: faqat faol userlar")
+        parser.add_argument('--created-before', help="Filtr: YYYY-MM-DD dan oldin ro'yxatdan o'tganlar")
+        parser.add_argument('--created-after', help="Filtr: YYYY-MM-DD dan boshlab ro'yxatdan o'tganlar")
+        parser.add_argument('--all-users', action='store_true', help="Filtrsiz - barcha userlar (aniq tasdiq)")
+        parser.add_argument('--resume', type=int, metavar='ID', help="Mavjud ishni davom ettirish")
+        parser.add_argument('--batch-size', type=int, default=balance_grants.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Faqat nechta user tushishini ko'rsatish")
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            grant = BalanceGrant.objects.filter(pk=options['resume']).first()
+            if grant is None:
+                raise CommandError(f"Ish #{options['resume']} topilmadi")
+            if grant.status == BalanceGrant.STATUS_COMPLETED:
+                self.stdout.write(f"Ish #{grant.pk} allaqachon tugallangan")
+                return
+        else:
+            grant = self._create(options)
+            if grant is None:
+                return
+
+        self.stderr.write(f"Ish #{grant.pk}: {grant.total_users} user, delta {grant.delta:+d}, "
+                          f"{grant.processed_users} tasi oldin ishlangan")
+        started = time.perf_counter()
+        try:
+            grant = balance_grants.run(grant, options['batch_size'], progress=self._progress)
+        except Exception as e:
+            raise CommandError(f"Ish #{grant.pk} to'xtadi ({e}). Davom ettirish: --resume {grant.pk}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ish #{grant.pk} tugadi: {grant.updated_users} user yangilandi, jami {grant.balance_change:+d}, "
+            f"{grant.batches} partiya, {time.perf_counter() - started:.1f}s"
+        ))
+
+    def _create(self, options):
+        delta = options['delta']
+        if not delta:
+            raise CommandError("--delta majburiy va 0 bo'lmasligi kerak")
+        if not options['reason']:
+            raise CommandError("--reason majburiy")
+
+        try:
+            created_before = balance_grants.day_start(options['created_before'])
+            created_after = balance_grants.day_start(options['created_after'])
+        except ValueError:
+            raise CommandError("Sana formati: YYYY-MM-DD")
+        has_filter = options['active'] or created_before or created_after
+        if options['csv'] and has_filter:
+            raise CommandError("--csv va filtr birga ishlatilmaydi")
+        if not options['csv'] and not has_filter and not options['all_users']:
+            raise CommandError("--csv, filtr (--active/--created-before/--created-after) yoki --all-users kerak")
+
+        with transaction.atomic():
+            if options['csv']:
+                try:
+                    with open(options['csv'], newline='', encoding='utf-8-sig') as f:
+                        grant = balance_grants.create_from_csv(
+                            f, delta, options['reason'], created_by='cli', filename=os.path.basename(options['csv']),
+                        )
+                except OSError as e:
+                    raise CommandError(f"CSV o'qilmadi: {e}")
+                self.stderr.write(f"CSV: {grant.criteria['rows']} qator, {grant.criteria['unknown']} ta noma'lum "
+                                  f"telegram_id")
+            else:
+                grant = balance_grants.create_from_filter(
+                    delta, options['reason'], is_active=True if options['active'] else None,
+                    created_before=created_before, created_after=created_after, created_by='cli',
+                )
+
+            if options['dry_run']:
+                self.stdout.write(f"Dry run: {grant.total_users} user, delta {delta:+d} - hech narsa yozilmadi")
+                transaction.set_rollback(True)
+                return None
+        return grant
+
+    def _progress(self, grant, batch):
+        self.stderr.write(f"partiya {batch.number}: {grant.processed_users}/{grant.total_users} "
+                          f"({batch.users} user, {batch.balance_change:+d})")
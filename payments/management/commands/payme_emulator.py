@@ -0,0 +1,170 @@
+# payments/management/commands/payme_emulator.py
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.bench import in_process_settings, percentile, run_concurrent, scratch_database
+from payments.models import BotUser, Payment, PricingTariff
+from payments.payme_emulator import (
+    SCENARIO_CANCEL, SCENARIO_PERFORM, SCENARIO_RACE, SCENARIO_REFUND, EmulatorError, PaymeEmulator, check_balances,
+    check_statement, now_ms,
+)
+from payments.payme_utils import sum_to_tiyin
+
+ORDER_PREFIX = 'emu'
+
+
+def seed(orders, users, run_id):
+    """Foydalanuvchilar (balans 0) va CREATED holatdagi buyurtmalar"""
+    tariff = PricingTariff.objects.create(name=f'Emulator {run_id}', count=10, price=10000, is_active=False)
+    base = 9_000_000_000 + run_id % 1_000_000 * 1000
+    BotUser.objects.bulk_create(
+        BotUser(telegram_id=base + n, full_name=f'emu {n}', balance=0) for n in range(users)
+    )
+    user_ids = list(BotUser.objects.filter(telegram_id__gte=base, telegram_id__lt=base + users)
+                    .values_list('id', flat=True))
+    Payment.objects.bulk_create(
+        Payment(user_id=user_ids[n % users], tariff=tariff, amount=tariff.price, pricing_count=tariff.count,
+                order_id=f'{ORDER_PREFIX}-{run_id}-{n}')
+        for n in range(orders)
+    )
+    return user_ids, sum_to_tiyin(tariff.price)
+
+
+class Command(BaseCommand):
+    help = ("Payme emulyatori: payme_callback ga imzolangan so'rovlar, retry/duplicate "
+            "namunalari, parallel buyurtmalar va ikki marta kreditlash tekshiruvi")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--users', type=int, default=20, help="Buyurtmalar shu foydalanuvchilarga taqsimlanadi")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--retries', type=int, default=1, help="Har bir o'zgartiruvchi so'rov qayta yuborilishi")
+        parser.add_argument('--duplicates', type=int, default=1, help="Parallel nusxalar soni")
+        parser.add_argument('--cancel-ratio', type=float, default=0.1)
+        parser.add_argument('--refund-ratio', type=float, default=0.1)
+        parser.add_argument('--race-ratio', type=float, default=0.1,
+                            help="Parallel Create (turli ID) va parallel Perform/Cancel ulushi")
+        parser.add_argument('--competing-ratio', type=float, default=0.05,
+                            help="Boshqa tranzaksiya ID bilan CreateTransaction ulushi")
+        parser.add_argument('--url', help="Ishlab turgan server (masalan http://localhost:8000). "
+                                          "Berilsa joriy DB ishlatiladi, aks holda vaqtinchalik DB")
+        parser.add_argument('--key', help="Payme kaliti (default: PAYME_SECRET_KEY)")
+        parser.add_argument('--seed', type=int, default=0, help="Ssenariylar taqsimoti uchun random seed")
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['orders'] < 1 or options['users'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--orders, --users va --concurrency musbat bo'lishi kerak")
+
+        if options['url']:
+            report = self._run(options)
+        else:
+            with scratch_database(), in_process_settings():
+                report = self._run(options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print(report)
+
+        if report['failures'] or report['balance_mismatches'] or report['statement_missing'] \
+                or report['statement_duplicated']:
+            raise CommandError("Emulyator invariant buzilishlarini topdi")
+
+    def _run(self, options):
+        run_id = int(time.time())
+        user_ids, amount_tiyin = seed(options['orders'], options['users'], run_id)
+        initial = dict(BotUser.objects.filter(pk__in=user_ids).values_list('pk', 'balance'))
+
+        rng = random.Random(options['seed'])
+        plan = []
+        for _ in range(options['orders']):
+            roll = rng.random()
+            if roll < options['cancel_ratio']:
+                scenario = SCENARIO_CANCEL
+            elif roll < options['cancel_ratio'] + options['refund_ratio']:
+                scenario = SCENARIO_REFUND
+            elif roll < options['cancel_ratio'] + options['refund_ratio'] + options['race_ratio']:
+                scenario = SCENARIO_RACE
+            else:
+                scenario = SCENARIO_PERFORM
+            plan.append((scenario, rng.random() < options['competing_ratio']))
+
+        emulator = PaymeEmulator(key=options['key'], base_url=options['url'])
+        workers = min(options['concurrency'], options['orders'])
+        per_worker = -(-options['orders'] // workers)
+        transaction_ids = []
+        failures = []
+        started_ms = now_ms() - 1000
+
+        def one_order(worker, iteration):
+            n = worker * per_worker + iteration
+            if n >= options['orders']:
+                return True
+            scenario, competing = plan[n]
+            try:
+                transaction_ids.append(emulator.run_order(
+                    f'{ORDER_PREFIX}-{run_id}-{n}', amount_tiyin, scenario,
+                    retries=options['retries'], duplicates=options['duplicates'], competing=competing,
+                ))
+            except EmulatorError as exc:
+                failures.append(str(exc))
+                return False
+            return True
+
+        stats = run_concurrent(one_order, workers, per_worker)
+
+        statement = emulator.statement(started_ms, now_ms() + 1000)
+        statement_ids = [row['id'] for row in statement]
+        missing, duplicated = check_statement(
+            [row for row in statement if row['account']['order_id'].startswith(f'{ORDER_PREFIX}-{run_id}-')],
+            transaction_ids,
+        )
+
+        return {
+            'orders': options['orders'],
+            'completed_orders': len(transaction_ids),
+            'workers': workers,
+            'elapsed_s': stats['elapsed_s'],
+            'orders_per_s': round(len(transaction_ids) / stats['elapsed_s'], 1) if stats['elapsed_s'] else 0.0,
+            'order_p50_ms': stats['p50_ms'],
+            'order_p99_ms': stats['p99_ms'],
+            'callbacks': sum(len(v) for v in emulator.latencies.values()),
+            'internal_errors': emulator.internal_errors,
+            'methods': {
+                method: {
+                    'calls': len(values),
+                    'p50_ms': round(percentile(sorted(values), 50) * 1000, 3),
+                    'p99_ms': round(percentile(sorted(values), 99) * 1000, 3),
+                }
+                for method, values in sorted(emulator.latencies.items())
+            },
+            'failures': failures[:20],
+            'failure_count': len(failures),
+            'balance_mismatches': check_balances(initial, user_ids),
+            'statement_rows': len(statement_ids),
+            'statement_missing': missing,
+            'statement_duplicated': duplicated,
+        }
+
+    def _print(self, report):
+        self.stdout.write(
+            f"orders={report['completed_orders']}/{report['orders']} workers={report['workers']} "
+            f"orders/s={report['orders_per_s']} p50={report['order_p50_ms']}ms p99={report['order_p99_ms']}ms "
+            f"callbacks={report['callbacks']} internal_errors(retried)={report['internal_errors']}"
+        )
+        for method, stats in report['methods'].items():
+            self.stdout.write(f"  {method:26} calls={stats['calls']:<6} p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms")
+        for failure in report['failures']:
+            self.stdout.write(self.style.ERROR(f"  FAIL {failure}"))
+        for telegram_id, expected, actual in report['balance_mismatches'][:20]:
+            self.stdout.write(self.style.ERROR(f"  BALANCE telegram_id={telegram_id} kutilgan={expected} haqiqiy={actual}"))
+        if report['statement_missing'] or report['statement_duplicated']:
+            self.stdout.write(self.style.ERROR(
+                f"  STATEMENT yo'q={len(report['statement_missing'])} takror={len(report['statement_duplicated'])}"
+            ))
+        if not (report['failure_count'] or report['balance_mismatches']):
+            self.stdout.write(self.style.SUCCESS("Ikki marta kreditlash yo'q, barcha invariantlar bajarildi"))
@@ -0,0 +1,15 @@
+# payments/management/commands/purge_idempotency_keys.py
+from django.core.management.base import BaseCommand
+
+from payments.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Muddati o'tgan Idempotency kalitlarini o'chirish (cron uchun)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(f"O'chirildi: {deleted}")
@@ -0,0 +1,41 @@
+# payments/management/commands/reap_stale_orders.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from payments import order_reaper
+
+
+class Command(BaseCommand):
+    help = "PAYMENT_ORDER_TIMEOUT dan eski kutilayotgan buyurtmalarni bekor qilish (reason 4)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=order_reaper.BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Bir yugurishdagi partiyalar chegarasi")
+        parser.add_argument('--loop', action='store_true', help="To'xtovsiz ishlash")
+        parser.add_argument('--interval', type=float, default=300.0, help="Yugurishlar orasidagi kutish (sekund)")
+        parser.add_argument('--dry-run', action='store_true', help="Faqat eskirgan buyurtmalar sonini ko'rsatish")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            before = order_reaper.cutoff()
+            count = order_reaper.stale_orders(before).count()
+            self.stdout.write(f"Eskirgan buyurtmalar ({before:%Y-%m-%d %H:%M} dan oldin): {count}")
+            return
+
+        try:
+            while True:
+                close_old_connections()
+                reaped, batches = order_reaper.reap(
+                    batch_size=options['batch_size'], max_batches=options['max_batches'],
+                )
+                if reaped or not options['loop']:
+                    self.stdout.write(f"Bekor qilindi: {reaped} ({batches} partiya)")
+
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
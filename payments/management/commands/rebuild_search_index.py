@@ -0,0 +1,32 @@
+# payments/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from payments import search_index
+from payments.models import SearchDocument
+
+
+class Command(BaseCommand):
+    help = "Qidiruv indeksini (foydalanuvchilar, to'lovlar, telefon modellari) asosiy jadvallardan qayta qurish"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=search_index.KINDS, nargs='+', default=search_index.KINDS)
+        parser.add_argument('--batch-size', type=int, default=search_index.BATCH_SIZE)
+        parser.add_argument('--if-empty', action='store_true',
+                            help="Faqat hujjati yo'q turlarni qurish (deploy paytida)")
+
+    def handle(self, *args, **options):
+        kinds = options['kind']
+        if options['if_empty']:
+            indexed = set(SearchDocument.objects.values_list('kind', flat=True).distinct())
+            kinds = [kind for kind in kinds if kind not in indexed]
+            if not kinds:
+                return
+
+        counts = search_index.rebuild(kinds, options['batch_size'], progress=self._progress)
+        self.stdout.write(self.style.SUCCESS(
+            "Qidiruv indeksi qayta qurildi: " + ", ".join(f"{kind}: {count}" for kind, count in counts.items())
+        ))
+
+    def _progress(self, kind, done):
+        if done % 100_000 == 0:
+            self.stderr.write(f"{kind}: {done}")
@@ -0,0 +1,57 @@
+# payments/management/commands/update_rollups.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from payments import history_archive, idempotency, rollups
+
+# Kelgusi oylar partitionlarini tekshirish oralig'i (sekund) va necha oy oldinga
+PARTITION_CHECK_INTERVAL = 3600
+PARTITIONS_AHEAD = 3
+# Muddati o'tgan Idempotency-Key yozuvlarini o'chirish oralig'i (sekund)
+IDEMPOTENCY_PURGE_INTERVAL = 600
+
+
+class Command(BaseCommand):
+    help = ("Kunlik rollup jadvallarini watermark'dan yangilash (narxlash va tushum). "
+            "Soatiga bir marta kelgusi oylar partitionlarini ham yaratadi (PostgreSQL), "
+            "muddati o'tgan Idempotency-Key yozuvlarini o'chiradi")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=rollups.BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="To'xtovsiz ishlash")
+        parser.add_argument('--interval', type=float, default=60.0, help="Yugurishlar orasidagi kutish (sekund)")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Rolluplarni xom ma'lumotdan (arxiv bilan) qaytadan qurish")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rollups.rebuild()
+            self.stdout.write(self.style.SUCCESS("Rolluplar qayta qurildi"))
+
+        partitions_checked = keys_purged = None
+        try:
+            while True:
+                close_old_connections()
+                now = time.monotonic()
+                if partitions_checked is None or now - partitions_checked >= PARTITION_CHECK_INTERVAL:
+                    # PostgreSQL: yangi oy qatorlari default partitionga tushmasligi uchun
+                    for name in history_archive.ensure_partitions(ahead=PARTITIONS_AHEAD):
+                        self.stdout.write(f"Partition yaratildi: {name}")
+                    partitions_checked = now
+                if keys_purged is None or now - keys_purged >= IDEMPOTENCY_PURGE_INTERVAL:
+                    deleted = idempotency.purge_expired()
+                    if deleted:
+                        self.stdout.write(f"Idempotency kalitlari o'chirildi: {deleted}")
+                    keys_purged = now
+
+                processed = rollups.update_all(options['batch_size'])
+                if any(processed.values()):
+                    self.stdout.write(", ".join(f"{name}: {count}" for name, count in processed.items()))
+
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,219 @@
+# payments/metrics.py - Prometheus metrikalari (bir nechta gunicorn worker uchun)
+"""
+Har bir process metrikalarni xotirada yig'adi, fon threadi ularni har
+METRICS_FLUSH_INTERVAL sekundda METRICS_DIR/<pid>.json ga yozadi (atomik
+rename). /metrics endpointi barcha fayllarni o'qib yig'indisini beradi.
+Request yo'lida faqat lock ostida dict yangilanadi - disk I/O yo'q.
+
+To'xtagan processlar (gunicorn max_requests, qayta ishga tushgan worker)
+fayllari yig'ishda o'chiriladi (os.kill(pid, 0)) - katalog o'smaydi. Ularning
+counterlari yo'qoladi, Prometheus buni counter reset deb hisoblaydi (rate()
+to'g'ri). METRICS_DIR bitta pid namespace (konteyner) ichida bo'lishi kerak.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+HISTOGRAM_BUCKETS = {
+    'http_request_duration_seconds': LATENCY_BUCKETS,
+    'payme_method_duration_seconds': LATENCY_BUCKETS,
+    'db_queries_per_request': QUERY_BUCKETS,
+}
+
+HELP = {
+    'http_requests_total': 'HTTP so\'rovlar soni (view, method, status)',
+    'http_request_duration_seconds': 'View bajarilish vaqti',
+    'db_queries_per_request': 'Bitta so\'rovdagi DB querylar soni',
+    'payme_requests_total': 'Payme JSON-RPC chaqiruvlari',
+    'payme_errors_total': 'Payme xato kodlari (method, code)',
+    'payme_method_duration_seconds': 'Payme metod bajarilish vaqti',
+    'cache_requests_total': 'Kesh murojaatlari (cache, result)',
+    'payment_state_transitions_total': 'Payment holati o\'tishlari (from, to)',
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_state = {'pid': None, 'dirty': False, 'thread': None}
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _ensure_process():
+    """Fork'dan keyin (yangi pid) registrni tozalash va flush threadini ishga tushirish"""
+    pid = os.getpid()
+    if _state['pid'] == pid:
+        return
+    _counters.clear()
+    _histograms.clear()
+    _state['pid'] = pid
+    thread = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+    _state['thread'] = thread
+    thread.start()
+
+
+def inc(name, amount=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _ensure_process()
+        _counters[key] = _counters.get(key, 0) + amount
+        _state['dirty'] = True
+
+
+def observe(name, value, **labels):
+    buckets = HISTOGRAM_BUCKETS[name]
+    key = (name, _labels(labels))
+    with _lock:
+        _ensure_process()
+        data = _histograms.get(key)
+        if data is None:
+            data = _histograms[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                data[i] += 1
+        data[-2] += value
+        data[-1] += 1
+        _state['dirty'] = True
+
+
+def payment_transition(old_state, new_state, amount=1):
+    inc('payment_state_transitions_total', amount, **{'from': old_state, 'to': new_state})
+
+
+# ============= FAYLLAR ORQALI YIG'ISH =============
+
+def _path(pid):
+    return os.path.join(settings.METRICS_DIR, f'{pid}.json')
+
+
+def flush():
+    """Joriy process snapshotini faylga yozish"""
+    with _lock:
+        if not _state['dirty']:
+            return
+        data = {
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), list(values)] for (name, labels), values in _histograms.items()],
+        }
+        _state['dirty'] = False
+        pid = _state['pid']
+
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    tmp = _path(pid) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, _path(pid))
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+atexit.register(lambda: _state['pid'] == os.getpid() and flush())
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # boshqa foydalanuvchi processi - tirik
+    return True
+
+
+def collect():
+    """Barcha tirik processlar fayllarini yig'ish: (counters, histograms)"""
+    flush()
+    counters, histograms = {}, {}
+    try:
+        names = os.listdir(settings.METRICS_DIR)
+    except FileNotFoundError:
+        names = []
+
+    for filename in names:
+        pid = filename.removesuffix('.json')
+        if not filename.endswith('.json') or not pid.isdigit():
+            continue
+        path = os.path.join(settings.METRICS_DIR, filename)
+        if not _alive(int(pid)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # boshqa worker allaqachon o'chirgan
+            continue
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in data['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in data['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+            else:
+                histograms[key] = values
+    return counters, histograms
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Prometheus text exposition format (0.0.4)"""
+    counters, histograms = collect()
+    lines = []
+
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        lines.append(f'# HELP {name} {HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} counter')
+        for labels, value in sorted(by_name[name]):
+            lines.append(f'{name}{_format_labels(labels)} {_number(value)}')
+
+    by_name = {}
+    for (name, labels), values in histograms.items():
+        by_name.setdefault(name, []).append((labels, values))
+    for name in sorted(by_name):
+        buckets = HISTOGRAM_BUCKETS.get(name, ())
+        lines.append(f'# HELP {name} {HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, values in sorted(by_name[name]):
+            for bound, count in zip(buckets, values):
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", str(bound))])} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {values[-1]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_number(values[-2])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {values[-1]}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,92 @@
+# payments/middleware.py
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+# Joriy so'rov hisoblagichi. ContextVar sync_to_async threadlariga ham o'tadi -
+# async view querylari (boshqa threaddagi ulanish) ham shu so'rovga yoziladi
+_queries = ContextVar('metrics_queries', default=None)
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _queries.get()
+    if counter is not None:
+        counter.count += 1
+    return execute(sql, params, many, context)
+
+
+def _install(connection):
+    """Har bir alias va thread ulanishiga bir marta (ulanish obyekti qayta ulanishda ham saqlanadi)"""
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def _connection_created(sender, connection, **kwargs):
+    _install(connection)
+
+
+connection_created.connect(_connection_created, dispatch_uid='payments.metrics.count_queries')
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    So'rovlar soni, view bo'yicha latency va DB querylar soni (payments.metrics).
+    Querylar barcha aliaslarda (default, replikalar) va async view'larda ham sanaladi.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        # Middleware yuklanishidan oldin ochilgan ulanishlar
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = _QueryCounter()
+        token = _queries.set(counter)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _queries.reset(token)
+        self._record(request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        token = _queries.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _queries.reset(token)
+        self._record(request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    @staticmethod
+    def _record(request, response, elapsed, queries):
+        view = _view_name(request)
+        metrics.inc('http_requests_total', view=view, method=request.method, status=response.status_code)
+        metrics.observe('http_request_duration_seconds', elapsed, view=view)
+        metrics.observe('db_queries_per_request', queries, view=view)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 07:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_alter_botuser_balance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('payme_transaction_id__isnull', False)), fields=['created_at', 'id'], name='payments_statement_idx'),
+        ),
+    ]
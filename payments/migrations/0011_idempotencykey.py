@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-17 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_payment_statement_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Kalit')),
+                ('response', models.JSONField(blank=True, null=True, verbose_name='Javob')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Yaratilgan')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Amal qilish muddati')),
+            ],
+            options={
+                'verbose_name': 'Idempotency kaliti',
+                'verbose_name_plural': 'Idempotency kalitlari',
+                'db_table': 'idempotency_keys',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-17 07:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0011_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=64, verbose_name='Hodisa turi')),
+                ('payload', models.JSONField(verbose_name="Ma'lumot")),
+                ('status', models.SmallIntegerField(choices=[(0, 'Kutilmoqda'), (1, 'Yetkazildi'), (2, 'Xato (urinishlar tugadi)')], default=0, verbose_name='Holati')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Urinishlar')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Keyingi urinish')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Oxirgi xato')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Yaratilgan')),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='Yetkazilgan')),
+            ],
+            options={
+                'verbose_name': 'Outbox hodisasi',
+                'verbose_name_plural': 'Outbox hodisalari',
+                'db_table': 'outbox_events',
+                'indexes': [models.Index(condition=models.Q(('status', 0)), fields=['available_at', 'id'], name='outbox_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-17 07:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0012_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Oy (1-kun)')),
+                ('path', models.CharField(max_length=500, verbose_name='Fayl')),
+                ('rows', models.PositiveIntegerField(verbose_name='Qatorlar soni')),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=18, verbose_name="Narxlar yig'indisi")),
+                ('size_bytes', models.PositiveBigIntegerField(verbose_name='Hajmi (bayt)')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Arxivlangan vaqt')),
+            ],
+            options={
+                'verbose_name': 'Tarix arxivi',
+                'verbose_name_plural': 'Tarix arxivlari',
+                'db_table': 'pricing_history_archives',
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pricinghistory',
+            index=models.Index(fields=['created_at', 'id'], name='pricing_history_created_idx'),
+        ),
+    ]
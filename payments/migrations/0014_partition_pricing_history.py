@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def partition_pricing_history(apps, schema_editor):
+    """
+    PostgreSQL: pricing_history -> oylik RANGE partitionlar. SQLite da o'zgarish yo'q.
+
+    Sxema va migratsiya holati bu yerda ataylab farq qiladi: bazada PRIMARY KEY
+    (id, created_at), Django holatida esa PK - `id` (PricingHistory docstring).
+    Kelgusi oylar partitionlarini rollups sidecar (update_rollups --loop) oldindan yaratadi.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from payments.history_archive import convert_to_partitioned
+    convert_to_partitioned(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0013_history_archive'),
+    ]
+
+    operations = [
+        # Orqaga qaytarish: partitionlangan jadval oddiy jadval kabi ishlayveradi
+        migrations.RunPython(partition_pricing_history, migrations.RunPython.noop),
+    ]
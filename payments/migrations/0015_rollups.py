@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-17 07:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0014_partition_pricing_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True, verbose_name='Manba')),
+                ('last_id', models.BigIntegerField(default=0, verbose_name='Oxirgi id')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Yangilangan')),
+            ],
+            options={
+                'verbose_name': 'Rollup watermark',
+                'verbose_name_plural': 'Rollup watermarklar',
+                'db_table': 'rollup_watermarks',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyTariffRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Kun')),
+                ('tariff_ref', models.BigIntegerField(default=0, verbose_name="Tarif ID (0 - noma'lum)")),
+                ('payments_count', models.IntegerField(default=0, verbose_name="To'lovlar")),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Tushum')),
+            ],
+            options={
+                'verbose_name': 'Kunlik tushum',
+                'verbose_name_plural': 'Kunlik tushum',
+                'db_table': 'rollup_daily_tariff_revenue',
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'tariff_ref'), name='rollup_revenue_day_tariff_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyUserUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Kun')),
+                ('pricing_count', models.PositiveIntegerField(default=0, verbose_name='Narxlashlar')),
+                ('price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name="Narxlar yig'indisi")),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usage', to='payments.botuser', verbose_name='Foydalanuvchi')),
+            ],
+            options={
+                'verbose_name': 'Kunlik foydalanish',
+                'verbose_name_plural': 'Kunlik foydalanish',
+                'db_table': 'rollup_daily_user_usage',
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'user'), name='rollup_usage_day_user_uniq')],
+            },
+        ),
+    ]
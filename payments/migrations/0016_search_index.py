@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-17 08:02
+
+from django.db import migrations, models
+
+
+def create_backend_index(apps, schema_editor):
+    """SQLite: FTS5 (trigram) jadvali + triggerlar; PostgreSQL: pg_trgm GIN indeksi"""
+    from payments.search_index import create_backend_index
+    create_backend_index(schema_editor.connection)
+
+
+def drop_backend_index(apps, schema_editor):
+    from payments.search_index import drop_backend_index
+    drop_backend_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0015_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Foydalanuvchi'), ('payment', "To'lov"), ('phone_model', 'Telefon modeli')], max_length=16, verbose_name='Turi')),
+                ('ref', models.CharField(max_length=255, verbose_name='Obyekt')),
+                ('body', models.TextField(verbose_name='Qidiriladigan matn')),
+            ],
+            options={
+                'verbose_name': 'Qidiruv hujjati',
+                'verbose_name_plural': 'Qidiruv indeksi',
+                'db_table': 'search_documents',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pricinghistory',
+            index=models.Index(fields=['phone_model', 'created_at'], name='pricing_history_phone_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('kind', 'ref'), name='search_documents_kind_ref_uniq'),
+        ),
+        # Hujjatlar: manage.py rebuild_search_index (entrypoint.sh --if-empty bilan chaqiradi)
+        migrations.RunPython(create_backend_index, drop_backend_index),
+    ]
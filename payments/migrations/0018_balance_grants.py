@@ -0,0 +1,75 @@
+# Generated by Django 5.2 on 2026-10-17 08:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0017_payment_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceGrant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(max_length=255, verbose_name='Sabab')),
+                ('delta', models.IntegerField(verbose_name="O'zgarish (har bir userga)")),
+                ('source', models.CharField(choices=[('csv', 'CSV fayl'), ('filter', 'Filtr')], max_length=16, verbose_name='Manba')),
+                ('criteria', models.JSONField(blank=True, default=dict, verbose_name="Filtr / fayl ma'lumoti")),
+                ('status', models.SmallIntegerField(choices=[(0, 'Kutilmoqda'), (1, 'Bajarilmoqda'), (2, 'Tugallandi'), (3, 'Xato (davom ettirish mumkin)')], default=0, verbose_name='Holati')),
+                ('total_users', models.PositiveIntegerField(default=0, verbose_name='Foydalanuvchilar')),
+                ('processed_users', models.PositiveIntegerField(default=0, verbose_name='Ishlangan')),
+                ('updated_users', models.PositiveIntegerField(default=0, verbose_name='Yangilangan')),
+                ('balance_change', models.BigIntegerField(default=0, verbose_name="Jami o'zgarish")),
+                ('batches', models.PositiveIntegerField(default=0, verbose_name='Partiyalar')),
+                ('last_target_id', models.BigIntegerField(default=0, verbose_name='Oxirgi ishlangan target')),
+                ('created_by', models.CharField(blank=True, default='', max_length=150, verbose_name='Kim yaratgan')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Oxirgi xato')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Yaratilgan')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Boshlangan')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Tugagan')),
+            ],
+            options={
+                'verbose_name': 'Ommaviy balans',
+                'verbose_name_plural': 'Ommaviy balans ishlari',
+                'db_table': 'balance_grants',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceGrantBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='Partiya')),
+                ('first_target_id', models.BigIntegerField(verbose_name='Birinchi target')),
+                ('last_target_id', models.BigIntegerField(verbose_name='Oxirgi target')),
+                ('users', models.PositiveIntegerField(verbose_name='Yangilangan userlar')),
+                ('balance_change', models.BigIntegerField(verbose_name="Jami o'zgarish")),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Vaqt')),
+                ('grant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batch_log', to='payments.balancegrant', verbose_name='Ish')),
+            ],
+            options={
+                'verbose_name': 'Partiya',
+                'verbose_name_plural': 'Partiyalar (audit)',
+                'db_table': 'balance_grant_batches',
+                'ordering': ['number'],
+                'constraints': [models.UniqueConstraint(fields=('grant', 'number'), name='balance_grant_batch_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceGrantTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='targets', to='payments.balancegrant')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='payments.botuser')),
+            ],
+            options={
+                'db_table': 'balance_grant_targets',
+                'indexes': [models.Index(fields=['grant', 'id'], name='balance_grant_target_idx')],
+                'constraints': [models.UniqueConstraint(fields=('grant', 'user'), name='balance_grant_target_uniq')],
+            },
+        ),
+    ]
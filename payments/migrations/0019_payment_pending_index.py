@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0018_balance_grants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('state', 1)), fields=['created_at', 'id'], name='payments_pending_idx'),
+        ),
+    ]
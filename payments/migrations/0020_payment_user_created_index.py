@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 08:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0019_payment_pending_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='payments_user_created_idx'),
+        ),
+    ]
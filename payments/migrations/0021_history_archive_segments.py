@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-17 08:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0020_payment_user_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historyarchive',
+            name='per_user',
+            field=models.BooleanField(default=False, verbose_name="Foydalanuvchi bo'yicha segmentlangan"),
+        ),
+        migrations.CreateModel(
+            name='HistoryArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(verbose_name='Foydalanuvchi ID')),
+                ('offset', models.PositiveBigIntegerField(verbose_name='Boshlanish (bayt)')),
+                ('length', models.PositiveBigIntegerField(verbose_name='Uzunlik (bayt)')),
+                ('rows', models.PositiveIntegerField(verbose_name='Qatorlar soni')),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='payments.historyarchive')),
+            ],
+            options={
+                'db_table': 'pricing_history_archive_segments',
+                'indexes': [models.Index(fields=['user_id', 'archive'], name='history_segment_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('archive', 'user_id'), name='history_segment_archive_user_uniq')],
+            },
+        ),
+    ]
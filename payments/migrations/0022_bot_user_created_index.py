@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0021_history_archive_segments'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='botuser',
+            index=models.Index(fields=['created_at', 'id'], name='bot_users_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0022_bot_user_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historyarchive',
+            name='timeline',
+            field=models.JSONField(blank=True, default=list, verbose_name='Vaqt bloklari'),
+        ),
+    ]
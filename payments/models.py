@@ -1,10 +1,15 @@
+import logging
 import uuid
 
-from django.db import models
+from django.db import connections, models, router, transaction
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+from . import balance_cache
+
+logger = logging.getLogger(__name__)
+
 
 class PricingTariff(models.Model):
     """Narxlash tariflari"""
@@ -38,6 +43,60 @@ class PricingTariff(models.Model):
         return self.price / self.count if self.count > 0 else 0
 
 
+class BotUserManager(models.Manager):
+
+    def change_balance(self, delta, **lookup):
+        """
+        Balansni bitta shartli UPDATE bilan o'zgartirish (oldindan o'qimasdan).
+        delta < 0 bo'lsa: balance = balance + delta WHERE balance >= -delta
+        Qaytaradi: (user_id, yangi_balans) yoki None (user yo'q / balans yetarli emas)
+        """
+        now = timezone.now()
+        # db_manager(alias) / DATABASE_ROUTERS hisobga olinadi (modul darajasidagi connection emas)
+        db = self._db or router.db_for_write(self.model)
+        connection = connections[db]
+        if 'telegram_id' in lookup:
+            # Yozuvdan oldin token: UPDATE va commit orasida keshlangan eski balans yaroqsiz
+            balance_cache.invalidate(lookup['telegram_id'])
+
+        if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+            # RETURNING - bitta statement, qo'shimcha SELECT yo'q
+            (name, value), = lookup.items()
+            field = self.model._meta.pk if name == 'pk' else self.model._meta.get_field(name)
+            qn = connection.ops.quote_name
+            sql = (
+                f"UPDATE {qn(self.model._meta.db_table)} "
+                f"SET {qn('balance')} = {qn('balance')} + %s, {qn('updated_at')} = %s "
+                f"WHERE {qn(field.column)} = %s"
+            )
+            params = [delta, connection.ops.adapt_datetimefield_value(now), field.get_prep_value(value)]
+            if delta < 0:
+                sql += f" AND {qn('balance')} >= %s"
+                params.append(-delta)
+            sql += f" RETURNING {qn('id')}, {qn('telegram_id')}, {qn('balance')}"
+
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+        else:
+            # RETURNING yo'q backendlar: UPDATE + shu tranzaksiya ichida o'qish
+            # (qator UPDATE tufayli commit'gacha qulflangan)
+            qs = self.using(db).filter(**lookup)
+            if delta < 0:
+                qs = qs.filter(balance__gte=-delta)
+            with transaction.atomic(using=db):
+                row = None
+                if qs.update(balance=models.F('balance') + delta, updated_at=now):
+                    row = self.using(db).filter(**lookup).values_list('id', 'telegram_id', 'balance').get()
+
+        if row is None:
+            return None
+
+        user_id, telegram_id, balance = row
+        balance_cache.invalidate_on_commit(telegram_id)
+        return user_id, balance
+
+
 class BotUser(models.Model):
     """Bot foydalanuvchilari"""
     telegram_id = models.BigIntegerField(
@@ -67,11 +126,17 @@ class BotUser(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Ro'yxatdan o'tgan")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Yangilangan")
 
+    objects = BotUserManager()
+
     class Meta:
         verbose_name = "Bot foydalanuvchisi"
         verbose_name_plural = "Bot foydalanuvchilari"
         ordering = ['-created_at']
         db_table = 'bot_users'
+        indexes = [
+            # Admin changelist keyset sahifalash (-created_at, -id)
+            models.Index(fields=['created_at', 'id'], name='bot_users_created_idx'),
+        ]
 
     def __str__(self):
         username_display = f"@{self.username}" if self.username else "username yo'q"
@@ -83,17 +148,19 @@ class BotUser(models.Model):
 
     def use_pricing(self):
         """Narxlashdan foydalanish"""
-        if self.balance > 0:
-            self.balance -= 1
-            self.save(update_fields=['balance', 'updated_at'])
-            return True
-        return False
+        result = BotUser.objects.change_balance(-1, pk=self.pk)
+        if result is None:
+            return False
+        self.balance = result[1]
+        return True
 
     def add_balance(self, count):
         """Balansni to'ldirish"""
         if count > 0:
-            self.balance += count
-            self.save(update_fields=['balance', 'updated_at'])
+            result = BotUser.objects.change_balance(count, pk=self.pk)
+            if result is None:
+                return False
+            self.balance = result[1]
             return True
         return False
 
@@ -112,6 +179,14 @@ class Payment(models.Model):
         (STATE_CANCELLED_AFTER_COMPLETE, "To'lovdan keyin bekor qilindi"),
     )
 
+    # Ruxsat etilgan holat o'tishlari: (eski, yangi) -> balansga pricing_count ishorasi.
+    # Boshqa o'tishlar (masalan bekor qilingandan keyin bajarish) yo'q.
+    TRANSITIONS = {
+        (STATE_CREATED, STATE_COMPLETED): 1,
+        (STATE_CREATED, STATE_CANCELLED): 0,
+        (STATE_COMPLETED, STATE_CANCELLED_AFTER_COMPLETE): -1,
+    }
+
     # 🔴 PAYME ORDER ID (STRING BO‘LISHI SHART)
     order_id = models.CharField(
         max_length=64,
@@ -176,59 +251,131 @@ class Payment(models.Model):
     class Meta:
         db_table = "payments"
         ordering = ["-created_at"]
+        indexes = [
+            # GetStatement: created_at oralig'i, faqat Payme tranzaksiyasi borlari
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(payme_transaction_id__isnull=False),
+                name="payments_statement_idx",
+            ),
+            # Admin changelist (-created_at) va oylik eksport (created_at, id) keyset
+            models.Index(fields=["created_at", "id"], name="payments_created_idx"),
+            # Bot: foydalanuvchi to'lovlari (user_history) - (-created_at, -id) keyset
+            models.Index(fields=["user", "created_at", "id"], name="payments_user_created_idx"),
+            # Reaper: faqat kutilayotgan buyurtmalar - sweep narxi eskirganlar soniga bog'liq
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(state=1),
+                name="payments_pending_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"#{self.order_id} | {self.amount:,.0f} so'm"
 
-    # ===== PERFORM =====
-    def perform(self):
-        print(f"--- DEBUG: Perform boshlandi. State: {self.state}, Pricing count: {self.pricing_count} ---")
-        if self.state != self.STATE_CREATED:
-            print(f"--- DEBUG: XATO! To'lov holati noto'g'ri: {self.state} ---")
+    # ===== HOLAT O'TISHLARI =====
+    def transition(self, new_state, **fields):
+        """
+        self.state -> new_state bitta shartli UPDATE bilan (WHERE id = ? AND state = eski),
+        qator qulfisiz (select_for_update kerak emas). Balans o'zgarishi va outbox
+        hodisasi shu tranzaksiyada - faqat UPDATE yutgan so'rovda, ya'ni aynan bir marta.
+        Parallel so'rov ulgurgan bo'lsa False; obyekt DB dagi holat bilan yangilanadi.
+        """
+        old_state = self.state
+        balance_sign = self.TRANSITIONS.get((old_state, new_state))
+        if balance_sign is None:
+            logger.debug(f"Ruxsat etilmagan o'tish: #{self.pk} {old_state} -> {new_state}")
             return False
 
-        self.state = self.STATE_COMPLETED
-        self.performed_at = timezone.now()
-        self.payme_perform_time = int(timezone.now().timestamp() * 1000)
-
-        self.save(update_fields=[
-            "state",
-            "performed_at",
-            "payme_perform_time"
-        ])
-        print(f"--- DEBUG: Payment holati COMPLETED ga o'zgartirildi ---")
-
-        if self.user and self.pricing_count:
-            print(f"--- DEBUG: Balans oshirilmoqda. User: {self.user.telegram_id}, Miqdor: {self.pricing_count} ---")
-            success = self.user.add_balance(self.pricing_count)
-            print(f"--- DEBUG: Balans oshirish natijasi: {success} ---")
-        else:
-            print(f"--- DEBUG: XATO! User yoki pricing_count topilmadi: User={self.user}, Count={self.pricing_count} ---")
-
+        with transaction.atomic():
+            updated = Payment.objects.filter(pk=self.pk, state=old_state).update(state=new_state, **fields)
+            if not updated:
+                self.refresh_from_db(fields=self.TRANSITION_FIELDS)
+                self._loaded_state = self.state
+                return False
+
+            self.state = new_state
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+            if balance_sign and self.user_id and self.pricing_count:
+                # Qaytarishda balans yetmasa (sarflangan) 0 dan pastga tushirilmaydi
+                if BotUser.objects.change_balance(balance_sign * self.pricing_count, pk=self.user_id) is None:
+                    logger.warning(f"Balans o'zgarmadi: Payment #{self.pk}, {balance_sign * self.pricing_count:+d}")
+            elif balance_sign:
+                logger.warning(f"User yoki pricing_count topilmadi: Payment #{self.pk}, Count={self.pricing_count}")
+
+            event_type = (OutboxEvent.PAYMENT_COMPLETED if new_state == self.STATE_COMPLETED
+                          else OutboxEvent.PAYMENT_CANCELLED)
+            OutboxEvent.for_payment(self, event_type)
+            self._loaded_state = old_state
+            self.send_saved(['state', *fields])
         return True
 
-    # ===== CANCEL =====
+    @classmethod
+    def transition_many(cls, ids, old_state, new_state, **fields):
+        """
+        Ommaviy o'tish (reaper): bitta shartli UPDATE ... WHERE id IN (...) AND state = eski.
+        Faqat balansga tegmaydigan o'tishlar; outbox hodisasi yozilmaydi. Har bir
+        o'tgan to'lov uchun post_save (kutuvchilar, metrikalar, replika sticky).
+        Qaytaradi: o'tgan to'lovlar - parallel so'rov ulgurganlari kirmaydi.
+        """
+        if cls.TRANSITIONS.get((old_state, new_state)) != 0:
+            raise ValueError(f"Ommaviy o'tish mumkin emas: {old_state} -> {new_state}")
+
+        with transaction.atomic():
+            if not cls.objects.filter(id__in=ids, state=old_state).update(state=new_state, **fields):
+                return []
+            # Aynan shu UPDATE o'tkazganlari: yangi holat va shu qiymatlar (cancelled_at va h.k.)
+            payments = list(cls.objects.filter(id__in=ids, state=new_state, **fields).only(
+                'id', 'order_id', 'state', *fields,
+            ))
+            for payment in payments:
+                payment._loaded_state = old_state
+                payment.send_saved(['state', *fields])
+        return payments
+
+    # transition() yutqazganda DB dan qayta o'qiladigan maydonlar
+    TRANSITION_FIELDS = [
+        'state', 'reason', 'performed_at', 'cancelled_at', 'payme_perform_time', 'payme_cancel_time',
+    ]
+
+    def send_saved(self, update_fields):
+        """
+        Shartli update() dan keyin post_save (kutuvchilarni uyg'otish, metrikalar,
+        replika sticky, qidiruv indeksi) - save() bilan bir xil signallar.
+        """
+        models.signals.post_save.send(
+            sender=Payment, instance=self, created=False, update_fields=frozenset(update_fields),
+            raw=False, using=self._state.db,
+        )
+
+    def perform(self):
+        now = timezone.now()
+        return self.transition(
+            self.STATE_COMPLETED, performed_at=now, payme_perform_time=int(now.timestamp() * 1000),
+        )
+
     def cancel(self, reason=None):
-        if self.state == self.STATE_COMPLETED:
-            self.state = self.STATE_CANCELLED_AFTER_COMPLETE
-        else:
-            self.state = self.STATE_CANCELLED
-
-        self.cancelled_at = timezone.now()
-        self.payme_cancel_time = int(timezone.now().timestamp() * 1000)
-        self.reason = reason
-
-        self.save(update_fields=[
-            "state",
-            "cancelled_at",
-            "payme_cancel_time",
-            "reason"
-        ])
-        return True
+        """CREATED -> CANCELLED yoki COMPLETED -> CANCELLED_AFTER_COMPLETE (balansdan qaytarish bilan)"""
+        new_state = self.STATE_CANCELLED_AFTER_COMPLETE if self.state == self.STATE_COMPLETED else self.STATE_CANCELLED
+        now = timezone.now()
+        return self.transition(
+            new_state, cancelled_at=now, payme_cancel_time=int(now.timestamp() * 1000), reason=reason,
+        )
 
 
 class PricingHistory(models.Model):
-    """Narxlash tarixi"""
+    """
+    Narxlash tarixi.
+
+    PostgreSQL da jadval created_at bo'yicha oylik partitionlangan (0014) va
+    haqiqiy PRIMARY KEY (id, created_at) - partition kaliti PK ichida bo'lishi
+    shart. Django holati (migratsiyalar) PK ni `id` deb biladi: id noyobligini
+    pricing_history_seq ta'minlaydi, (id, created_at) PK esa uni indekslaydi.
+    Shu sababli `id` maydonini o'zgartiradigan migratsiya (AlterField) yozilmaydi -
+    u pricing_history_pkey ni `id` ustiga qayta qurmoqchi bo'ladi.
+    """
     user = models.ForeignKey(
         BotUser,
         on_delete=models.CASCADE,
@@ -251,7 +398,319 @@ class PricingHistory(models.Model):
         db_table = 'pricing_history'
         indexes = [
             models.Index(fields=['user', 'created_at']),
+            # Admin changelist (-created_at) va arxivlash oralig'i uchun
+            models.Index(fields=['created_at', 'id'], name='pricing_history_created_idx'),
+            # Qidiruv: indeksdan topilgan telefon modellari bo'yicha filtr (phone_model IN (...))
+            models.Index(fields=['phone_model', 'created_at'], name='pricing_history_phone_idx'),
         ]
 
     def __str__(self):
         return f"{self.user.full_name} - {self.phone_model}"
+
+
+class HistoryArchive(models.Model):
+    """
+    Arxivlangan (yopilgan) oy: PricingHistory qatorlari live jadvaldan siqilgan
+    JSONL faylga ko'chirilgan. Batafsil: payments/history_archive.py
+    """
+    month = models.DateField(unique=True, verbose_name="Oy (1-kun)")
+    path = models.CharField(max_length=500, verbose_name="Fayl")
+    rows = models.PositiveIntegerField(verbose_name="Qatorlar soni")
+    total_price = models.DecimalField(max_digits=18, decimal_places=2, verbose_name="Narxlar yig'indisi")
+    size_bytes = models.PositiveBigIntegerField(verbose_name="Hajmi (bayt)")
+    sha256 = models.CharField(max_length=64, verbose_name="SHA-256")
+    per_user = models.BooleanField(default=False, verbose_name="Foydalanuvchi bo'yicha segmentlangan")
+    # [[offset, length, qatorlar, birinchi created_at], ...] - (created_at, id) tartibidagi bloklar
+    timeline = models.JSONField(default=list, blank=True, verbose_name="Vaqt bloklari")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Arxivlangan vaqt")
+
+    class Meta:
+        verbose_name = "Tarix arxivi"
+        verbose_name_plural = "Tarix arxivlari"
+        ordering = ['-month']
+        db_table = 'pricing_history_archives'
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} ({self.rows} qator)"
+
+
+class HistoryArchiveSegment(models.Model):
+    """
+    Arxiv faylidagi bitta foydalanuvchining qatorlari - alohida gzip member
+    (offset, length bayt). Foydalanuvchi tarixi faqat o'z segmentini o'qiydi.
+    """
+    archive = models.ForeignKey(HistoryArchive, on_delete=models.CASCADE, related_name='segments')
+    # FK emas: user o'chirilsa ham arxiv o'zgarmaydi
+    user_id = models.BigIntegerField(verbose_name="Foydalanuvchi ID")
+    offset = models.PositiveBigIntegerField(verbose_name="Boshlanish (bayt)")
+    length = models.PositiveBigIntegerField(verbose_name="Uzunlik (bayt)")
+    rows = models.PositiveIntegerField(verbose_name="Qatorlar soni")
+
+    class Meta:
+        db_table = 'pricing_history_archive_segments'
+        constraints = [
+            models.UniqueConstraint(fields=['archive', 'user_id'], name='history_segment_archive_user_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user_id', 'archive'], name='history_segment_user_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """create_payment qayta yuborilganda asl javobni qaytarish uchun kalitlar"""
+    key = models.CharField(max_length=255, unique=True, verbose_name="Kalit")
+    response = models.JSONField(null=True, blank=True, verbose_name="Javob")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Yaratilgan")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Amal qilish muddati")
+
+    class Meta:
+        verbose_name = "Idempotency kaliti"
+        verbose_name_plural = "Idempotency kalitlari"
+        db_table = 'idempotency_keys'
+
+    def __str__(self):
+        return self.key
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+
+class OutboxEvent(models.Model):
+    """
+    Transactional outbox: hodisalar to'lov bilan BIR tranzaksiyada yoziladi,
+    dispatch_outbox command ularni alohida yetkazadi.
+    """
+    PAYMENT_COMPLETED = 'payment.completed'
+    PAYMENT_CANCELLED = 'payment.cancelled'
+
+    STATUS_PENDING = 0
+    STATUS_DELIVERED = 1
+    STATUS_FAILED = 2
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Kutilmoqda"),
+        (STATUS_DELIVERED, "Yetkazildi"),
+        (STATUS_FAILED, "Xato (urinishlar tugadi)"),
+    )
+
+    event_type = models.CharField(max_length=64, verbose_name="Hodisa turi")
+    payload = models.JSONField(verbose_name="Ma'lumot")
+    status = models.SmallIntegerField(choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Holati")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Urinishlar")
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="Keyingi urinish")
+    last_error = models.TextField(blank=True, default='', verbose_name="Oxirgi xato")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Yaratilgan")
+    delivered_at = models.DateTimeField(null=True, blank=True, verbose_name="Yetkazilgan")
+
+    class Meta:
+        verbose_name = "Outbox hodisasi"
+        verbose_name_plural = "Outbox hodisalari"
+        db_table = 'outbox_events'
+        indexes = [
+            # Dispatcher faqat kutilayotganlarni o'qiydi
+            models.Index(
+                fields=['available_at', 'id'],
+                condition=models.Q(status=0),
+                name='outbox_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.pk}"
+
+    @classmethod
+    def for_payment(cls, payment, event_type):
+        """To'lov hodisasini outbox ga yozish (chaqiruvchi tranzaksiyasi ichida)"""
+        return cls.objects.create(event_type=event_type, payload={
+            'payment_id': payment.pk,
+            'order_id': str(payment.order_id),
+            'telegram_id': payment.user.telegram_id if payment.user_id else None,
+            'state': payment.state,
+            'amount': str(payment.amount),
+            'pricing_count': payment.pricing_count,
+            'tariff_id': payment.tariff_id,
+        })
+
+
+# ============= ROLLUPLAR (payments/rollups.py) =============
+
+class RollupWatermark(models.Model):
+    """Rollup manbasi (jadval) bo'yicha oxirgi qayta ishlangan id"""
+    name = models.CharField(max_length=64, unique=True, verbose_name="Manba")
+    last_id = models.BigIntegerField(default=0, verbose_name="Oxirgi id")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Yangilangan")
+
+    class Meta:
+        verbose_name = "Rollup watermark"
+        verbose_name_plural = "Rollup watermarklar"
+        db_table = 'rollup_watermarks'
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
+
+
+class DailyUserUsage(models.Model):
+    """Kun x foydalanuvchi: narxlashlar soni va narxlar yig'indisi"""
+    day = models.DateField(verbose_name="Kun")
+    user = models.ForeignKey(BotUser, on_delete=models.CASCADE, related_name='daily_usage',
+                             verbose_name="Foydalanuvchi")
+    pricing_count = models.PositiveIntegerField(default=0, verbose_name="Narxlashlar")
+    price_sum = models.DecimalField(max_digits=18, decimal_places=2, default=0, verbose_name="Narxlar yig'indisi")
+
+    class Meta:
+        verbose_name = "Kunlik foydalanish"
+        verbose_name_plural = "Kunlik foydalanish"
+        db_table = 'rollup_daily_user_usage'
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user'], name='rollup_usage_day_user_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} | {self.user_id}: {self.pricing_count}"
+
+
+class DailyTariffRevenue(models.Model):
+    """Kun x tarif: bajarilgan to'lovlar soni va tushum (bekor qilinganlar ayirilgan)"""
+    day = models.DateField(verbose_name="Kun")
+    # FK emas: tarif o'chirilsa ham tushum saqlanadi, (day, tariff_ref) upsert kaliti NULL siz
+    tariff_ref = models.BigIntegerField(default=0, verbose_name="Tarif ID (0 - noma'lum)")
+    payments_count = models.IntegerField(default=0, verbose_name="To'lovlar")
+    revenue = models.DecimalField(max_digits=18, decimal_places=2, default=0, verbose_name="Tushum")
+
+    class Meta:
+        verbose_name = "Kunlik tushum"
+        verbose_name_plural = "Kunlik tushum"
+        db_table = 'rollup_daily_tariff_revenue'
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'tariff_ref'], name='rollup_revenue_day_tariff_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} | {self.tariff_ref}: {self.revenue}"
+
+
+class SearchDocument(models.Model):
+    """
+    Qidiruv indeksi hujjati (search_index.py). Backend indeksi (SQLite FTS5 /
+    PostgreSQL pg_trgm) migratsiyada yaratiladi, save signallari sinxron ushlaydi.
+    """
+    KIND_USER = 'user'
+    KIND_PAYMENT = 'payment'
+    KIND_PHONE_MODEL = 'phone_model'
+
+    KIND_CHOICES = [
+        (KIND_USER, 'Foydalanuvchi'),
+        (KIND_PAYMENT, "To'lov"),
+        (KIND_PHONE_MODEL, 'Telefon modeli'),
+    ]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, verbose_name="Turi")
+    # Obyekt id si (user, payment) yoki telefon modeli nomining o'zi
+    ref = models.CharField(max_length=255, verbose_name="Obyekt")
+    body = models.TextField(verbose_name="Qidiriladigan matn")
+
+    class Meta:
+        verbose_name = "Qidiruv hujjati"
+        verbose_name_plural = "Qidiruv indeksi"
+        db_table = 'search_documents'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'ref'], name='search_documents_kind_ref_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.ref}"
+
+
+class BalanceGrant(models.Model):
+    """
+    Ommaviy balans berish (delta > 0) yoki olish (delta < 0) ishi. Foydalanuvchilar
+    yaratilishda BalanceGrantTarget ga muzlatiladi, balance_grants.run ularni
+    bo'laklab to'plamli UPDATE bilan qo'llaydi (last_target_id - davom ettirish nuqtasi).
+    """
+    SOURCE_CSV = 'csv'
+    SOURCE_FILTER = 'filter'
+
+    SOURCE_CHOICES = [
+        (SOURCE_CSV, 'CSV fayl'),
+        (SOURCE_FILTER, 'Filtr'),
+    ]
+
+    STATUS_PENDING = 0
+    STATUS_RUNNING = 1
+    STATUS_COMPLETED = 2
+    STATUS_FAILED = 3
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Kutilmoqda"),
+        (STATUS_RUNNING, "Bajarilmoqda"),
+        (STATUS_COMPLETED, "Tugallandi"),
+        (STATUS_FAILED, "Xato (davom ettirish mumkin)"),
+    )
+
+    reason = models.CharField(max_length=255, verbose_name="Sabab")
+    delta = models.IntegerField(verbose_name="O'zgarish (har bir userga)")
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, verbose_name="Manba")
+    criteria = models.JSONField(default=dict, blank=True, verbose_name="Filtr / fayl ma'lumoti")
+    status = models.SmallIntegerField(choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Holati")
+    total_users = models.PositiveIntegerField(default=0, verbose_name="Foydalanuvchilar")
+    processed_users = models.PositiveIntegerField(default=0, verbose_name="Ishlangan")
+    updated_users = models.PositiveIntegerField(default=0, verbose_name="Yangilangan")
+    balance_change = models.BigIntegerField(default=0, verbose_name="Jami o'zgarish")
+    batches = models.PositiveIntegerField(default=0, verbose_name="Partiyalar")
+    last_target_id = models.BigIntegerField(default=0, verbose_name="Oxirgi ishlangan target")
+    created_by = models.CharField(max_length=150, blank=True, default='', verbose_name="Kim yaratgan")
+    last_error = models.TextField(blank=True, default='', verbose_name="Oxirgi xato")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Yaratilgan")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Boshlangan")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Tugagan")
+
+    class Meta:
+        verbose_name = "Ommaviy balans"
+        verbose_name_plural = "Ommaviy balans ishlari"
+        db_table = 'balance_grants'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"#{self.pk} {self.reason} ({self.delta:+d})"
+
+
+class BalanceGrantTarget(models.Model):
+    """Ishga kiritilgan foydalanuvchi (id tartibida bo'laklab ishlanadi)"""
+    grant = models.ForeignKey(BalanceGrant, on_delete=models.CASCADE, related_name='targets')
+    user = models.ForeignKey(BotUser, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        db_table = 'balance_grant_targets'
+        constraints = [
+            models.UniqueConstraint(fields=['grant', 'user'], name='balance_grant_target_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['grant', 'id'], name='balance_grant_target_idx'),
+        ]
+
+
+class BalanceGrantBatch(models.Model):
+    """Audit: har bir partiya (bitta tranzaksiya) uchun bitta qator"""
+    grant = models.ForeignKey(BalanceGrant, on_delete=models.CASCADE, related_name='batch_log',
+                              verbose_name="Ish")
+    number = models.PositiveIntegerField(verbose_name="Partiya")
+    first_target_id = models.BigIntegerField(verbose_name="Birinchi target")
+    last_target_id = models.BigIntegerField(verbose_name="Oxirgi target")
+    users = models.PositiveIntegerField(verbose_name="Yangilangan userlar")
+    balance_change = models.BigIntegerField(verbose_name="Jami o'zgarish")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Vaqt")
+
+    class Meta:
+        verbose_name = "Partiya"
+        verbose_name_plural = "Partiyalar (audit)"
+        db_table = 'balance_grant_batches'
+        ordering = ['number']
+        constraints = [
+            models.UniqueConstraint(fields=['grant', 'number'], name='balance_grant_batch_uniq'),
+        ]
+
+    def __str__(self):
+        return f"#{self.grant_id}/{self.number}: {self.users} user, {self.balance_change:+d}"
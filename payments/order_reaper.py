@@ -0,0 +1,89 @@
+# payments/order_reaper.py - Eskirgan (STATE_CREATED) buyurtmalarni bekor qilish
+"""
+Tashlab ketilgan checkoutlar, botning qayta urinishlari va Payme hech qachon
+chaqirmagan buyurtmalar STATE_CREATED da qolib ketadi. Reaper ularni
+PAYMENT_ORDER_TIMEOUT dan keyin bekor qiladi (state -1, reason 4 - Payme
+"tranzaksiya muddati o'tdi" kodi):
+
+- Payme tranzaksiyasi yo'q buyurtma: created_at bo'yicha.
+- Payme tranzaksiyasi bor: payme_create_time bo'yicha (Payme 12 soatni
+  CreateTransaction vaqtidan sanaydi). Keyin kelgan CancelTransaction
+  idempotent javob oladi, kechikkan PerformTransaction -31008.
+
+Har bir partiya Payment.transition_many - bitta shartli UPDATE (... WHERE id
+IN (...) AND state = 1): shu orada PerformTransaction bajarib ulgurgan buyurtma
+tegilmaydi. Bekor qilingan buyurtmalarni kutayotgan long-poll/SSE mijozlar
+post_save orqali uyg'otiladi. Tanlov
+payments_pending_idx (created_at, id) WHERE state = 1 qisman indeksidan - sweep
+narxi jadval hajmiga emas, eskirgan buyurtmalar soniga bog'liq.
+
+Bekor qilingan buyurtmalar uchun outbox hodisasi yozilmaydi: to'lanmagan
+buyurtma botga xabar emas, tushum rolluplari esa faqat bajarilganlarni sanaydi.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+REASON_TIMEOUT = 4
+
+
+def cutoff(now=None):
+    return (now or timezone.now()) - timedelta(seconds=settings.PAYMENT_ORDER_TIMEOUT)
+
+
+def stale_orders(before):
+    """before dan oldin yaratilgan (yoki Payme tranzaksiyasi ochilgan) kutilayotgan buyurtmalar"""
+    before_ms = int(before.timestamp() * 1000)
+    return Payment.objects.filter(state=Payment.STATE_CREATED, created_at__lt=before).filter(
+        Q(payme_transaction_id__isnull=True) | Q(payme_create_time__isnull=True)
+        | Q(payme_create_time__lt=before_ms)
+    )
+
+
+def reap_batch(before, batch_size=BATCH_SIZE):
+    """
+    Bitta partiya. Qaytaradi: (tanlanganlar, bekor qilinganlar). Tanlanganlar 0 -
+    eskirgan buyurtma qolmadi; bekor qilinganlar kam bo'lishi mumkin (parallel
+    Perform/Cancel ulgurgan).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(stale_orders(before).order_by('created_at', 'id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0, 0
+        reaped = Payment.transition_many(
+            ids, Payment.STATE_CREATED, Payment.STATE_CANCELLED,
+            reason=REASON_TIMEOUT,
+            cancelled_at=now,
+            payme_cancel_time=int(now.timestamp() * 1000),
+        )
+    return len(ids), len(reaped)
+
+
+def reap(before=None, batch_size=BATCH_SIZE, max_batches=None):
+    """
+    Eskirgan buyurtmalar tugaguncha (yoki max_batches gacha) partiyalab bekor qilish.
+    Qaytaradi: (bekor qilinganlar, partiyalar)
+    """
+    before = before or cutoff()
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        # Partiyadagi barcha buyurtmalar poygada yutqazgan bo'lsa ham davom etamiz:
+        # ular endi state = 1 emas, keyingi tanlovga kirmaydi
+        selected, reaped = reap_batch(before, batch_size)
+        if not selected:
+            break
+        total += reaped
+        batches += 1
+    if total:
+        logger.info(f"Eskirgan buyurtmalar bekor qilindi: {total} ({batches} partiya)")
+    return total, batches
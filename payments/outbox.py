@@ -0,0 +1,127 @@
+# payments/outbox.py - Outbox hodisalarini yetkazish (dispatch_outbox command uchun)
+import logging
+import random
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+_session = None
+
+
+def get_session():
+    """Bitta pooled requests.Session (keep-alive ulanishlar qayta ishlatiladi)"""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.OUTBOX_HTTP_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if settings.BOT_NOTIFY_TOKEN:
+            session.headers['Authorization'] = f"Bearer {settings.BOT_NOTIFY_TOKEN}"
+        _session = session
+    return _session
+
+
+def http_notify(event):
+    """Botga HTTP xabarnoma. BOT_NOTIFY_URL bo'sh bo'lsa - yetkazildi deb hisoblanadi"""
+    url = settings.BOT_NOTIFY_URL
+    if not url:
+        return
+    response = get_session().post(
+        url,
+        json={'id': event.pk, 'event': event.event_type, 'data': event.payload},
+        timeout=settings.BOT_NOTIFY_TIMEOUT,
+    )
+    response.raise_for_status()
+
+
+# event_type -> yetkazuvchi funksiya
+HANDLERS = {
+    OutboxEvent.PAYMENT_COMPLETED: http_notify,
+    OutboxEvent.PAYMENT_CANCELLED: http_notify,
+}
+
+
+def backoff(attempts):
+    """Eksponensial kechikish (sekund), +-20% jitter bilan"""
+    delay = min(settings.OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)), settings.OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(batch_size):
+    """
+    Vaqti kelgan hodisalarni olish va lease muddatiga "yashirish",
+    shunda yetkazish paytida boshqa dispatcher ularni qayta olmaydi.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        qs = OutboxEvent.objects.filter(
+            status=OutboxEvent.STATUS_PENDING, available_at__lte=now
+        ).order_by('available_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+
+        events = list(qs[:batch_size])
+        if events:
+            OutboxEvent.objects.filter(pk__in=[e.pk for e in events]).update(
+                available_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+            )
+    return events
+
+
+def dispatch_batch(batch_size=100):
+    """Bitta paketni yetkazish. Qaytaradi: (olingan, yetkazilgan, xato)"""
+    events = claim_batch(batch_size)
+    delivered = []
+    failed = 0
+
+    for event in events:
+        handler = HANDLERS.get(event.event_type)
+        try:
+            if handler is None:
+                raise LookupError(f"Handler yo'q: {event.event_type}")
+            handler(event)
+            delivered.append(event.pk)
+        except Exception as e:
+            failed += 1
+            attempts = event.attempts + 1
+            give_up = attempts >= settings.OUTBOX_MAX_ATTEMPTS
+            OutboxEvent.objects.filter(pk=event.pk).update(
+                attempts=attempts,
+                status=OutboxEvent.STATUS_FAILED if give_up else OutboxEvent.STATUS_PENDING,
+                available_at=timezone.now() + timedelta(seconds=backoff(attempts)),
+                last_error=str(e)[:1000],
+            )
+            log = logger.error if give_up else logger.warning
+            log(f"Outbox #{event.pk} ({event.event_type}) yetkazilmadi, urinish {attempts}: {e}")
+
+    if delivered:
+        OutboxEvent.objects.filter(pk__in=delivered).update(
+            status=OutboxEvent.STATUS_DELIVERED,
+            delivered_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+
+    return len(events), len(delivered), failed
+
+
+def purge_delivered(older_than_days, batch_size=1000):
+    """Eski yetkazilgan hodisalarni bo'laklab o'chirish"""
+    threshold = timezone.now() - timedelta(days=older_than_days)
+    deleted = 0
+    while True:
+        ids = list(OutboxEvent.objects.filter(
+            status=OutboxEvent.STATUS_DELIVERED, delivered_at__lt=threshold
+        ).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += OutboxEvent.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,112 @@
+# payments/payme_dispatch.py - Payme JSON-RPC metodlari jadvali va statistikasi
+import threading
+import time
+
+from . import metrics
+
+# Payme xato kodlari
+ERROR_PARSE = -32700
+ERROR_INVALID_REQUEST = -32600
+ERROR_METHOD_NOT_FOUND = -32601
+ERROR_INSUFFICIENT_PRIVILEGES = -32504
+ERROR_INTERNAL = -32400
+
+NUMBER = 'number'
+INTEGER = 'integer'
+STRING = 'string'
+OBJECT = 'object'
+
+_CHECKS = {
+    NUMBER: lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    INTEGER: lambda v: isinstance(v, int) and not isinstance(v, bool),
+    STRING: lambda v: isinstance(v, str) and v != '',
+    OBJECT: lambda v: isinstance(v, dict),
+}
+
+METHODS = {}  # name -> (handler, schema)
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def payme_method(name, **schema):
+    """
+    Handlerni Payme metodi sifatida ro'yxatdan o'tkazish.
+    schema: majburiy param -> tur (NUMBER, INTEGER, STRING, OBJECT)
+    """
+    def decorator(handler):
+        METHODS[name] = (handler, tuple(schema.items()))
+        return handler
+    return decorator
+
+
+def validate(schema, params):
+    """Majburiy maydonlar va ularning turlarini tekshirish"""
+    for field, kind in schema:
+        if not _CHECKS[kind](params.get(field)):
+            return False
+    return True
+
+
+def error(code, message):
+    return {"error": {"code": code, "message": message}}
+
+
+def dispatch(method, params):
+    """
+    Metodni jadvaldan topib chaqirish va vaqtini yozish.
+    Qaytaradi: handler natijasi (dict, yoki {"error": ...})
+    """
+    entry = METHODS.get(method)
+    if entry is None:
+        record("unknown", 0.0, ERROR_METHOD_NOT_FOUND)
+        return error(ERROR_METHOD_NOT_FOUND, "Method not found")
+
+    handler, schema = entry
+    if not isinstance(params, dict) or not validate(schema, params):
+        record(method, 0.0, ERROR_INVALID_REQUEST)
+        return error(ERROR_INVALID_REQUEST, "Invalid params")
+
+    started = time.perf_counter()
+    result = None
+    try:
+        result = handler(params)
+        return result
+    finally:
+        code = ERROR_INTERNAL
+        if result is not None:
+            code = result["error"]["code"] if isinstance(result, dict) and "error" in result else None
+        record(method, time.perf_counter() - started, code)
+
+
+def record(method, elapsed, error_code=None):
+    """Metod statistikasi: chaqiruvlar, vaqt (sek), xato kodlari"""
+    metrics.inc('payme_requests_total', method=method)
+    metrics.observe('payme_method_duration_seconds', elapsed, method=method)
+    if error_code is not None:
+        metrics.inc('payme_errors_total', method=method, code=error_code)
+
+    with _stats_lock:
+        stats = _stats.get(method)
+        if stats is None:
+            stats = _stats[method] = {'count': 0, 'total_s': 0.0, 'max_s': 0.0, 'errors': {}}
+        stats['count'] += 1
+        stats['total_s'] += elapsed
+        if elapsed > stats['max_s']:
+            stats['max_s'] = elapsed
+        if error_code is not None:
+            stats['errors'][error_code] = stats['errors'].get(error_code, 0) + 1
+
+
+def snapshot():
+    """Joriy processdagi statistikaning nusxasi"""
+    with _stats_lock:
+        return {
+            method: {
+                'count': s['count'],
+                'avg_ms': round(s['total_s'] / s['count'] * 1000, 3) if s['count'] else 0.0,
+                'max_ms': round(s['max_s'] * 1000, 3),
+                'errors': dict(s['errors']),
+            }
+            for method, s in _stats.items()
+        }
@@ -0,0 +1,284 @@
+# payments/payme_emulator.py - Payme Merchant API emulyatori (lokal e2e va yuklama testlari)
+"""
+Payme serveri o'rnida payme_callback ga imzolangan JSON-RPC so'rovlar yuboradi:
+CheckPerformTransaction -> CreateTransaction -> PerformTransaction / CancelTransaction
+-> CheckTransaction, oxirida GetStatement.
+
+Payme ning haqiqiy xulq-atvori ham taqlid qilinadi:
+- retry: javob kelmadi deb bir xil so'rovni qayta yuborish (ketma-ket)
+- duplicate: bir xil so'rovni bir vaqtda bir nechta ulanishdan yuborish
+- competing: bitta buyurtma uchun boshqa tranzaksiya ID bilan CreateTransaction
+- race: ikki CreateTransaction (turli ID) bir vaqtda, keyin PerformTransaction va
+  CancelTransaction bir vaqtda - Payment.TRANSITIONS dan aynan bittasi o'tishi shart
+
+Transport: Django test Client (in-process) yoki haqiqiy HTTP (requests), agar
+base_url berilsa. In-process rejim bench.in_process_settings() ichida ishlatiladi
+(Client "Host: testserver" yuboradi - standart ALLOWED_HOSTS uni rad etadi).
+"""
+import base64
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Sum
+
+from .payme_dispatch import ERROR_INTERNAL
+
+CALLBACK_PATH = '/api/payments/payme/callback/'
+
+SCENARIO_PERFORM = 'perform'
+SCENARIO_CANCEL = 'cancel'    # yaratilgandan keyin bekor (reason 3)
+SCENARIO_REFUND = 'refund'    # bajarilgandan keyin bekor (reason 5)
+SCENARIO_RACE = 'race'        # Perform va Cancel parallel: yakuniy holat -1 yoki -2
+
+REASON_TIMEOUT = 3
+REASON_REFUND = 5
+
+EXPECTED_STATE = {SCENARIO_PERFORM: 2, SCENARIO_CANCEL: -1, SCENARIO_REFUND: -2}
+
+
+class EmulatorError(Exception):
+    """Callback javobi kutilganidan farq qildi"""
+
+
+def auth_header(key=None):
+    """Payme imzosi: Basic base64("Paycom:KEY")"""
+    if key is None:
+        key = settings.PAYME_SETTINGS.get('SECRET_KEY') or ''
+    return 'Basic ' + base64.b64encode(f'Paycom:{key}'.encode()).decode()
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class PaymeEmulator:
+    """
+    Bitta emulyator ko'p threaddan ishlatilishi mumkin: har bir thread o'z
+    Client/Session obyektini oladi. Metod bo'yicha latencylar yig'iladi.
+    """
+
+    def __init__(self, key=None, base_url=None, timeout=30, internal_retries=3):
+        self.authorization = auth_header(key)
+        self.base_url = base_url
+        self.timeout = timeout
+        self.internal_retries = internal_retries
+        self.internal_errors = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._request_id = 0
+        self.latencies = {}  # method -> [sekund, ...]
+
+    # ===== TRANSPORT =====
+
+    def _post(self, body):
+        if self.base_url:
+            session = getattr(self._local, 'session', None)
+            if session is None:
+                import requests
+                session = self._local.session = requests.Session()
+            response = session.post(
+                self.base_url.rstrip('/') + CALLBACK_PATH, data=body, timeout=self.timeout,
+                headers={'Authorization': self.authorization, 'Content-Type': 'application/json'},
+            )
+            return response.status_code, response.content
+
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            from django.test import Client
+            client = self._local.client = Client()
+        response = client.post(
+            CALLBACK_PATH, data=body, content_type='application/json',
+            HTTP_AUTHORIZATION=self.authorization,
+        )
+        # Async (API_ASYNC) StreamingHttpResponse: iter(response) async oqimni sync yig'adi
+        content = b''.join(response) if response.streaming else response.content
+        return response.status_code, content
+
+    def call(self, method, params):
+        """
+        Bitta JSON-RPC chaqiruv. Qaytaradi: (result, error) - biri None.
+        -32400 (ichki xato) da Payme kabi shu so'rovni qayta yuboradi.
+        """
+        for attempt in range(self.internal_retries + 1):
+            result, error = self._call_once(method, params)
+            if not error or error.get('code') != ERROR_INTERNAL or attempt == self.internal_retries:
+                return result, error
+            with self._lock:
+                self.internal_errors += 1
+            time.sleep(0.05 * 2 ** attempt)
+
+    def _call_once(self, method, params):
+        with self._lock:
+            self._request_id += 1
+            request_id = self._request_id
+        body = json.dumps({'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params})
+
+        started = time.perf_counter()
+        status, content = self._post(body)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.setdefault(method, []).append(elapsed)
+
+        if status != 200:
+            raise EmulatorError(f'{method}: HTTP {status} (Payme har doim 200 kutadi)')
+        data = json.loads(content)
+        if data.get('id') != request_id:
+            raise EmulatorError(f'{method}: javob id={data.get("id")}, kutilgan {request_id}')
+        return data.get('result'), data.get('error')
+
+    def _call_in_pool(self, method, params):
+        try:
+            return self.call(method, params)
+        finally:
+            if not self.base_url:
+                connections.close_all()
+
+    def call_repeated(self, method, params, retries=0, duplicates=0):
+        """
+        Payme qayta yuborish namunalari: `duplicates` ta nusxa parallel,
+        keyin `retries` ta ketma-ket. Barcha javoblar ro'yxati qaytariladi.
+        """
+        if duplicates:
+            with ThreadPoolExecutor(max_workers=duplicates + 1) as pool:
+                replies = list(pool.map(lambda _: self._call_in_pool(method, params), range(duplicates + 1)))
+        else:
+            replies = [self.call(method, params)]
+        for _ in range(retries):
+            replies.append(self.call(method, params))
+        return replies
+
+    def call_parallel(self, calls):
+        """[(method, params), ...] bir vaqtda. Javoblar shu tartibda"""
+        with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+            return list(pool.map(lambda call: self._call_in_pool(*call), calls))
+
+    # ===== SSENARIY =====
+
+    def run_order(self, order_id, amount_tiyin, scenario=SCENARIO_PERFORM, retries=0, duplicates=0,
+                  competing=False):
+        """
+        Bitta buyurtmaning to'liq hayot sikli. Protokol buzilishi EmulatorError bilan
+        to'xtatiladi. Qaytaradi: Payme tranzaksiya ID si.
+        """
+        account = {'order_id': str(order_id)}
+        transaction_id = uuid.uuid4().hex[:24]
+
+        result, error = self.call('CheckPerformTransaction', {'amount': amount_tiyin, 'account': account})
+        if error or not (result or {}).get('allow'):
+            raise EmulatorError(f'CheckPerformTransaction {order_id}: {error or result}')
+
+        if scenario == SCENARIO_RACE:
+            return self._race_order(order_id, amount_tiyin, account)
+
+        create_params = {'id': transaction_id, 'time': now_ms(), 'amount': amount_tiyin, 'account': account}
+        for result, error in self.call_repeated('CreateTransaction', create_params, retries, duplicates):
+            if error or result.get('state') != 1 or result.get('transaction') != transaction_id:
+                raise EmulatorError(f'CreateTransaction {order_id}: {error or result}')
+
+        if competing:
+            # Boshqa kassadan/qurilmadan parallel to'lov urinish - rad etilishi shart
+            other = dict(create_params, id=uuid.uuid4().hex[:24])
+            result, error = self.call('CreateTransaction', other)
+            if not error:
+                raise EmulatorError(f'CreateTransaction {order_id}: ikkinchi tranzaksiya qabul qilindi: {result}')
+
+        if scenario in (SCENARIO_PERFORM, SCENARIO_REFUND):
+            for result, error in self.call_repeated('PerformTransaction', {'id': transaction_id}, retries,
+                                                    duplicates):
+                if error or result.get('state') != 2:
+                    raise EmulatorError(f'PerformTransaction {order_id}: {error or result}')
+
+        if scenario in (SCENARIO_CANCEL, SCENARIO_REFUND):
+            reason = REASON_REFUND if scenario == SCENARIO_REFUND else REASON_TIMEOUT
+            for result, error in self.call_repeated('CancelTransaction', {'id': transaction_id, 'reason': reason},
+                                                    retries, duplicates):
+                if error or result.get('state') != EXPECTED_STATE[scenario]:
+                    raise EmulatorError(f'CancelTransaction {order_id}: {error or result}')
+
+        result, error = self.call('CheckTransaction', {'id': transaction_id})
+        if error or result.get('state') != EXPECTED_STATE[scenario]:
+            raise EmulatorError(f'CheckTransaction {order_id}: {error or result}')
+        return transaction_id
+
+    def _race_order(self, order_id, amount_tiyin, account):
+        """
+        Holat mashinasi poygasi: parallel CreateTransaction lardan aynan bittasi
+        biriktiriladi (ikkinchisi -31099), parallel Perform/Cancel dan keyin buyurtma
+        -1 (Cancel yutdi, Perform -31008) yoki -2 (Perform yutdi, Cancel qaytardi).
+        """
+        created = self.call_parallel([
+            ('CreateTransaction', {'id': uuid.uuid4().hex[:24], 'time': now_ms(), 'amount': amount_tiyin,
+                                   'account': account})
+            for _ in range(2)
+        ])
+        winners = [result['transaction'] for result, error in created if not error and result.get('state') == 1]
+        losers = [error for result, error in created if error]
+        if len(winners) != 1 or [error.get('code') for error in losers] != [-31099]:
+            raise EmulatorError(f'CreateTransaction {order_id}: parallel tranzaksiyalar: {created}')
+        transaction_id, = winners
+
+        (performed, perform_error), (cancelled, cancel_error) = self.call_parallel([
+            ('PerformTransaction', {'id': transaction_id}),
+            ('CancelTransaction', {'id': transaction_id, 'reason': REASON_REFUND}),
+        ])
+        if cancel_error or cancelled.get('state') not in (-1, -2):
+            raise EmulatorError(f'CancelTransaction {order_id}: {cancel_error or cancelled}')
+        final_state = cancelled['state']
+        if perform_error:
+            if perform_error.get('code') != -31008 or final_state != -1:
+                raise EmulatorError(f'PerformTransaction {order_id}: {perform_error}, cancel state={final_state}')
+        elif performed.get('state') != 2 or final_state != -2:
+            raise EmulatorError(f'PerformTransaction {order_id}: {performed}, cancel state={final_state}')
+
+        result, error = self.call('CheckTransaction', {'id': transaction_id})
+        if error or result.get('state') != final_state:
+            raise EmulatorError(f'CheckTransaction {order_id}: {error or result}, kutilgan {final_state}')
+        return transaction_id
+
+    def statement(self, from_ms, to_ms):
+        """GetStatement tranzaksiyalari ro'yxati"""
+        result, error = self.call('GetStatement', {'from': from_ms, 'to': to_ms})
+        if error:
+            raise EmulatorError(f'GetStatement: {error}')
+        return result['transactions']
+
+
+# ============= INVARIANTLAR =============
+
+def check_balances(initial_balances, user_ids=None):
+    """
+    Har bir foydalanuvchi balansi = boshlang'ich + bajarilgan (bekor qilinmagan)
+    to'lovlar pricing_count yig'indisi. Farqlar ro'yxati qaytariladi:
+    [(telegram_id, kutilgan, haqiqiy), ...] - musbat farq ikki marta kreditlash.
+    """
+    from .models import BotUser, Payment
+
+    credited = dict(
+        Payment.objects.filter(state=Payment.STATE_COMPLETED, user__isnull=False)
+        .values('user_id').annotate(total=Sum('pricing_count')).values_list('user_id', 'total')
+    )
+    users = BotUser.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+
+    mismatches = []
+    for pk, telegram_id, balance in users.values_list('pk', 'telegram_id', 'balance').iterator():
+        expected = initial_balances.get(pk, 0) + (credited.get(pk) or 0)
+        if balance != expected:
+            mismatches.append((telegram_id, expected, balance))
+    return mismatches
+
+
+def check_statement(transactions, expected_ids):
+    """GetStatement: har bir tranzaksiya aynan bir marta. Qaytaradi: (yo'qlar, takrorlar)"""
+    seen = {}
+    for row in transactions:
+        seen[row['id']] = seen.get(row['id'], 0) + 1
+    missing = sorted(set(expected_ids) - set(seen))
+    duplicated = sorted(tx for tx, count in seen.items() if count > 1)
+    return missing, duplicated
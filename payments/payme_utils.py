@@ -1,7 +1,10 @@
 # payments/payme_utils.py - TUZATILGAN (settings.PAYME_SETTINGS bilan)
 import base64
+import hmac
 import time
+from itertools import islice
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 import logging
 
 
@@ -22,11 +25,11 @@ def create_payme_link(order_id, amount):
         merchant_id = payme_settings.get('MERCHANT_ID', '')
 
         if not merchant_id:
-            print("❌ ERROR: PAYME_MERCHANT_ID not configured")
+            logger.error("❌ PAYME_MERCHANT_ID not configured")
             return ""
 
         if not order_id:
-            print("❌ ERROR: order_id is required")
+            logger.error("❌ order_id is required")
             return ""
 
         amount_tiyin = int(float(amount) * 100)
@@ -43,12 +46,11 @@ def create_payme_link(order_id, amount):
         payme_url = payme_settings.get('PAYME_URL', 'https://checkout.paycom.uz')
         url = f"{payme_url}/{encoded}"
 
-        print("✅ PAYME URL:", url)
-        print("📋 PAYME PARAMS:", params_str)
+        logger.debug(f"📋 PAYME PARAMS: {params_str}")
         return url
 
-    except Exception as e:
-        print("❌ PAYME LINK ERROR:", e)
+    except Exception:
+        logger.exception("❌ PAYME LINK ERROR")
         return ""
 
 
@@ -68,13 +70,10 @@ def check_payme_auth(request) -> bool:
         secret_key = settings.PAYME_SETTINGS.get("SECRET_KEY")
         expected = f"Paycom:{secret_key}"
 
-        logger.warning(f"🔐 PAYME AUTH DECODED: {decoded}")
-        logger.warning(f"🔐 PAYME AUTH EXPECTED: {expected}")
-
-        return decoded == expected
+        return hmac.compare_digest(decoded, expected)
 
     except Exception:
-        logger.exception("❌ PAYME AUTH ERROR")
+        logger.warning("❌ PAYME AUTH: Authorization header noto'g'ri")
         return False
 
 
@@ -123,4 +122,39 @@ def get_payme_settings():
         'payme_url': payme_settings.get('PAYME_URL', 'NOT_SET'),
         'callback_url': payme_settings.get('CALLBACK_URL', 'NOT_SET'),
         'min_amount': payme_settings.get('MIN_AMOUNT', 0)
-    }
\ No newline at end of file
+    }
+
+
+def stream_jsonrpc_result(request_id, key, items, batch_size=500):
+    """
+    {"jsonrpc": "2.0", "result": {key: [...]}, "id": ...} ni bo'laklab kodlash.
+    items - lazy iterator; xotirada bir vaqtda faqat batch_size ta element turadi.
+
+    Birinchi batch (DB so'rovi) shu funksiya ichida, javob yaratilishidan oldin
+    o'qiladi - xato bo'lsa istisno chaqiruvchiga chiqadi va u oddiy -32400
+    javobini qaytaradi. Keyingi bo'laklardagi xato oqimni uzmaydi: konvert
+    yopiladi va "error" (-32400) qo'shiladi - mijoz doim to'g'ri JSON oladi.
+    Qaytaradi: baytlar generatori.
+    """
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    items = iter(items)
+    head = [encoder.encode(item) for item in islice(items, batch_size)]
+
+    def chunks():
+        yield ('{"jsonrpc":"2.0","result":{%s:[' % encoder.encode(key)).encode('utf-8')
+        buffer, first, failed = head, True, False
+        try:
+            while buffer:
+                yield ((',' if not first else '') + ','.join(buffer)).encode('utf-8')
+                first = False
+                buffer = [encoder.encode(item) for item in islice(items, batch_size)]
+        except Exception:
+            logger.exception("GetStatement oqimi uzildi")
+            failed = True
+
+        tail = ']}'
+        if failed:
+            tail += ',"error":{"code":-32400,"message":"Internal error"}'
+        yield (tail + ',"id":%s}' % encoder.encode(request_id)).encode('utf-8')
+
+    return chunks()
@@ -0,0 +1,218 @@
+# payments/payment_events.py - To'lov holati o'zgarishini kutish (long-poll / SSE)
+"""
+Payment holati o'zgarganda (commit'dan keyin) notify() chaqiriladi:
+  1) oxirgi holat umumiy cache ga yoziladi (boshqa workerlar uchun);
+  2) shu processda kutayotganlar darhol uyg'otiladi;
+  3) PAYMENT_EVENTS_BROKER ga xabar yuboriladi - Redis PUBLISH yoki PostgreSQL
+     NOTIFY. Har bir kutuvchi process bitta obunachi thread (_Listener) ushlaydi,
+     u xabar kelganda shu processdagi kutuvchilarni uyg'otadi.
+
+Kutuvchi umumiy holatni faqat uyg'onganda tekshiradi. Polling faqat zaxira:
+broker yo'q (LocMem + SQLite) yoki obuna uzilgan bo'lsa - har POLL_SLICE
+sekundda umumiy cache kaliti (LocMem bo'lsa DB dagi holat) o'qiladi. Obuna
+qayta ulanganda barcha kutuvchilar bir marta uyg'otiladi (uzilish paytidagi
+xabarlar yo'qolmaydi).
+
+Kutish faqat async (API_ASYNC=True) view'larda: sync WSGI workerni long-poll/SSE
+bilan band qilish uni uyg'otadigan Payme callbacklarini to'xtatib qo'yadi
+(docker-compose da `events` ASGI servisi shu endpointlarga javob beradi).
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = 'payments:pstate:'
+STATE_TTL = 60 * 60
+POLL_SLICE = 1.0
+CHANNEL = 'payment_state'
+RECONNECT_DELAY = 2.0
+LISTEN_HEALTH_CHECK = 30
+
+REDIS = 'redis'
+POSTGRES = 'postgres'
+
+_lock = threading.Lock()
+_waiters = {}  # order_id -> set(callback)
+
+
+def _wake(order_id):
+    with _lock:
+        callbacks = _waiters.pop(order_id, ())
+    for callback in callbacks:
+        callback()
+
+
+def _wake_all():
+    with _lock:
+        callbacks = [callback for callbacks in _waiters.values() for callback in callbacks]
+        _waiters.clear()
+    for callback in callbacks:
+        callback()
+
+
+# ============= BROKER =============
+
+_redis_client = None
+
+
+def _redis():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(settings.PAYMENT_EVENTS_REDIS_URL,
+                                             health_check_interval=LISTEN_HEALTH_CHECK)
+    return _redis_client
+
+
+def _publish(order_id, state):
+    """Boshqa processlardagi kutuvchilar uchun xabar (xato to'lovni to'xtatmaydi - zaxira polling bor)"""
+    payload = f'{order_id}:{state}'
+    try:
+        if settings.PAYMENT_EVENTS_BROKER == REDIS:
+            _redis().publish(CHANNEL, payload)
+        elif settings.PAYMENT_EVENTS_BROKER == POSTGRES:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+    except Exception:
+        logger.warning(f"To'lov holati xabari yuborilmadi: {order_id}", exc_info=True)
+
+
+class _Listener:
+    """Process uchun bitta obuna (daemon thread): broker xabari -> shu processdagi kutuvchilar"""
+
+    def __init__(self):
+        self.healthy = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self):
+        if not settings.PAYMENT_EVENTS_BROKER or self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='payment-events', daemon=True)
+                self._thread.start()
+
+    def _subscribed(self):
+        self.healthy = True
+        # Obunasiz paytda kelgan xabarlar yo'q - kutuvchilar holatni bir marta tekshirsin
+        _wake_all()
+
+    def _run(self):
+        while True:
+            try:
+                for order_id in self._messages():
+                    _wake(order_id)
+            except Exception:
+                logger.warning("To'lov holati obunasi uzildi, qayta ulanamiz", exc_info=True)
+            self.healthy = False
+            _wake_all()  # uzoq kutayotganlar zaxira pollingga o'tsin
+            time.sleep(RECONNECT_DELAY)
+
+    def _messages(self):
+        if settings.PAYMENT_EVENTS_BROKER == REDIS:
+            yield from self._redis_messages()
+        else:
+            yield from self._postgres_messages()
+
+    def _redis_messages(self):
+        pubsub = _redis().pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(CHANNEL)
+            self._subscribed()
+            for message in pubsub.listen():
+                yield message['data'].decode().rpartition(':')[0]
+        finally:
+            pubsub.close()
+
+    def _postgres_messages(self):
+        import psycopg
+        db = settings.DATABASES['default']
+        with psycopg.connect(dbname=db['NAME'], user=db['USER'], password=db['PASSWORD'], host=db['HOST'],
+                             port=db['PORT'], autocommit=True) as conn:
+            conn.execute(f"LISTEN {CHANNEL}")
+            self._subscribed()
+            while True:
+                for notify in conn.notifies(timeout=LISTEN_HEALTH_CHECK):
+                    yield notify.payload.rpartition(':')[0]
+                conn.execute("SELECT 1")  # uzilgan ulanish shu yerda xato beradi
+
+
+_listener = _Listener()
+
+
+# ============= NOTIFY / KUTISH =============
+
+def notify(order_id, state):
+    cache.set(STATE_KEY + order_id, state, timeout=STATE_TTL)
+    _wake(order_id)
+    _publish(order_id, state)
+
+
+def notify_on_commit(order_id, state):
+    transaction.on_commit(lambda: notify(order_id, state))
+
+
+def _register(order_id, callback):
+    with _lock:
+        _waiters.setdefault(order_id, set()).add(callback)
+
+
+def _unregister(order_id, callback):
+    with _lock:
+        callbacks = _waiters.get(order_id)
+        if callbacks is not None:
+            callbacks.discard(callback)
+            if not callbacks:
+                del _waiters[order_id]
+
+
+def _changed(state, known_state):
+    return state is not None and state != known_state
+
+
+async def _shared_state(order_id):
+    """Boshqa processlar ham ko'radigan oxirgi holat"""
+    if settings.SHARED_CACHE:
+        return await cache.aget(STATE_KEY + order_id)
+    return await Payment.objects.filter(order_id=order_id).values_list('state', flat=True).afirst()
+
+
+async def await_change(order_id, known_state, timeout):
+    """Holat known_state dan o'zgarguncha kutish (event loop bloklanmaydi). True - o'zgardi, False - timeout"""
+    _listener.ensure_started()
+    loop = asyncio.get_running_loop()
+    event = asyncio.Event()
+
+    def callback():
+        loop.call_soon_threadsafe(event.set)
+
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            # Ro'yxatdan o'tgandan KEYIN tekshiramiz - oraliqdagi notify yo'qolmaydi.
+            # Uyg'otish callbackni olib tashlaydi - har aylanishda qayta ro'yxatdan o'tiladi
+            event.clear()
+            _register(order_id, callback)
+            if _changed(await _shared_state(order_id), known_state):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # Obuna ishlayotgan bo'lsa xabargacha kutamiz, aks holda zaxira polling
+            wait = remaining if _listener.healthy else min(POLL_SLICE, remaining)
+            try:
+                await asyncio.wait_for(event.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        _unregister(order_id, callback)
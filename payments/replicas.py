@@ -0,0 +1,131 @@
+# payments/replicas.py - O'qish replikalari: router va "o'z yozuvini o'qish" (sticky primary)
+"""
+Faqat o'qiydigan bot endpointlari (get_tariffs katalogi, get_balance,
+check_payment_status) va Payme GetStatement replikadan o'qiydi - Payme
+yozuvlari bilan bitta default DB uchun raqobatlashmaydi.
+
+- reading(*scopes) bloki ichidagi o'qishlar (ReplicaRouter orqali) tasodifiy
+  replikaga ketadi. Blok tashqarisi, tranzaksiya ichi va barcha yozuvlar - default.
+- Yozuvdan keyin (commit'da) scope (user:<telegram_id>, order:<order_id>,
+  tariffs) REPLICA_STICKY_SECONDS davomida "sticky": shu scope o'qishlari
+  primary dan. Balans va tarif keshlari ham shu yo'l bilan to'ldiriladi -
+  eskirgan replika qiymati keshga qayta yozilmaydi.
+- Kafolat: REPLICA_STICKY_SECONDS replikatsiya kechikishidan katta bo'lsa,
+  foydalanuvchi o'z yozuvini har doim ko'radi; boshqalar ko'rishi kechikish
+  bilan chegaralangan. Tekshirish: manage.py check_replicas.
+
+Sticky belgilar umumiy cache'da (CACHES default). Cache process ichida
+(LocMem) va GUNICORN_WORKERS > 1 bo'lsa, A workerdagi yozuv B worker uchun
+sticky bo'lmaydi - bunday sozlamada barcha o'qishlar primary dan (replikalar
+ishlatilmaydi). Boshqa processlar (sidecar, grant_balance) yozuvlari uchun ham
+umumiy cache kerak.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+STICKY_PREFIX = 'payments:replica:sticky:'
+TARIFFS = 'tariffs'
+
+_reads = ContextVar('replica_reads', default=None)
+
+
+def user_scope(telegram_id):
+    return f'user:{telegram_id}'
+
+
+def order_scope(order_id):
+    return f'order:{order_id}'
+
+
+# ============= STICKY PRIMARY =============
+
+def mark_written(*scopes):
+    if settings.DATABASE_REPLICAS and scopes:
+        cache.set_many({STICKY_PREFIX + scope: 1 for scope in scopes}, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+def mark_written_on_commit(*scopes):
+    """Oyna commit'dan boshlanadi (uzoq tranzaksiyada ham to'liq)"""
+    if settings.DATABASE_REPLICAS and scopes:
+        transaction.on_commit(lambda: mark_written(*scopes))
+
+
+def is_sticky(*scopes):
+    return bool(scopes) and bool(cache.get_many([STICKY_PREFIX + scope for scope in scopes]))
+
+
+def sticky_shared():
+    """Sticky belgilar o'qiydigan barcha workerlarga ko'rinadimi"""
+    return settings.SHARED_CACHE or settings.GUNICORN_WORKERS <= 1
+
+
+def pick(*scopes, newest=None):
+    """
+    O'qish uchun alias: replika yoki default (replika yo'q, sticky belgilar
+    workerlar orasida umumiy emas, scope sticky yoki newest - o'qiladigan eng
+    yangi yozuv vaqti - sticky oynasi ichida)
+    """
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or not sticky_shared():
+        return DEFAULT_DB_ALIAS
+    if newest is not None and newest > timezone.now() - timedelta(seconds=settings.REPLICA_STICKY_SECONDS):
+        return DEFAULT_DB_ALIAS
+    if is_sticky(*scopes):
+        return DEFAULT_DB_ALIAS
+    return random.choice(replicas)
+
+
+# ============= ROUTER =============
+
+class _Reads:
+    """reading() bloki: alias birinchi so'rovda aniqlanadi (async ORM da - worker threadda)"""
+
+    def __init__(self, scopes):
+        self.scopes = scopes
+        self.alias = None
+
+    def resolve(self):
+        if self.alias is None:
+            self.alias = pick(*self.scopes)
+        return self.alias
+
+    @property
+    def used_replica(self):
+        return self.alias not in (None, DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def reading(*scopes):
+    reads = _Reads(scopes)
+    token = _reads.set(reads)
+    try:
+        yield reads
+    finally:
+        _reads.reset(token)
+
+
+class ReplicaRouter:
+    """settings.DATABASE_ROUTERS ga DB_REPLICAS berilganda qo'shiladi"""
+
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return reads.resolve()
+
+    def db_for_write(self, model, **hints):
+        # Aniq default: aks holda Django replikadan o'qilgan obyektni replikaga saqlaydi
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
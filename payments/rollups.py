@@ -0,0 +1,262 @@
+# payments/rollups.py - Kunlik rollup jadvallari (hisobotlar xom jadvallarni o'qimaydi)
+"""
+Ikki rollup, har biri o'z watermark'i (RollupWatermark.last_id) bilan:
+
+- DailyUserUsage: PricingHistory (faqat qo'shiladi) id bo'yicha.
+- DailyTariffRevenue: OutboxEvent to'lov hodisalari id bo'yicha -
+  payment.completed +1/+summa, to'lovdan keyingi bekor qilish (state -2)
+  -1/-summa, hodisa kuni bo'yicha.
+
+Har bir partiya bitta tranzaksiyada: guruhlangan deltalar
+INSERT ... ON CONFLICT DO UPDATE (qo'shish) bilan yoziladi va watermark
+suriladi - qayta ishga tushirish qatorlarni ikki marta sanamaydi.
+ROLLUP_SAFETY_LAG dan yangi qatorlar keyingi yugurishga qoldiriladi: kechroq
+commit bo'lgan kichik id watermark'dan o'tib ketmasligi uchun.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import history_archive
+from .models import (
+    BotUser, DailyTariffRevenue, DailyUserUsage, HistoryArchive, OutboxEvent, Payment, PricingHistory,
+    PricingTariff, RollupWatermark,
+)
+
+logger = logging.getLogger(__name__)
+
+PRICING = 'pricing_history'
+PAYMENT_EVENTS = 'payment_events'
+
+BATCH_SIZE = 10000
+
+USAGE_UPSERT = (
+    "INSERT INTO rollup_daily_user_usage (day, user_id, pricing_count, price_sum) VALUES (%s, %s, %s, %s) "
+    "ON CONFLICT (day, user_id) DO UPDATE SET "
+    "pricing_count = rollup_daily_user_usage.pricing_count + excluded.pricing_count, "
+    "price_sum = rollup_daily_user_usage.price_sum + excluded.price_sum"
+)
+REVENUE_UPSERT = (
+    "INSERT INTO rollup_daily_tariff_revenue (day, tariff_ref, payments_count, revenue) VALUES (%s, %s, %s, %s) "
+    "ON CONFLICT (day, tariff_ref) DO UPDATE SET "
+    "payments_count = rollup_daily_tariff_revenue.payments_count + excluded.payments_count, "
+    "revenue = rollup_daily_tariff_revenue.revenue + excluded.revenue"
+)
+
+
+def _watermark(name):
+    """Watermark qatori, tranzaksiya oxirigacha qulflangan (parallel yugurishlar navbatda)"""
+    RollupWatermark.objects.get_or_create(name=name)
+    return RollupWatermark.objects.select_for_update().get(name=name)
+
+
+def watermark(name):
+    return RollupWatermark.objects.filter(name=name).values_list('last_id', flat=True).first() or 0
+
+
+def _limit_id(queryset, last_id):
+    """Lag dan eski qatorlar chegarasi: birinchi 'yangi' qatordan oldingi id"""
+    cutoff = timezone.now() - timedelta(seconds=settings.ROLLUP_SAFETY_LAG)
+    pending = queryset.filter(id__gt=last_id)
+    recent = pending.filter(created_at__gt=cutoff).order_by('id').values_list('id', flat=True).first()
+    if recent is not None:
+        return recent - 1
+    return pending.aggregate(top=Max('id'))['top'] or last_id
+
+
+def _write(sql, deltas):
+    ops = connection.ops
+    rows = [
+        (ops.adapt_datefield_value(day), key, count, ops.adapt_decimalfield_value(total, 18, 2))
+        for (day, key), (count, total) in deltas.items() if count or total
+    ]
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+    return len(rows)
+
+
+# ============= NARXLASH (PricingHistory) =============
+
+def update_usage(batch_size=BATCH_SIZE):
+    """DailyUserUsage ni watermark'dan davom ettirish. Qaytaradi: qayta ishlangan qatorlar"""
+    limit = _limit_id(PricingHistory.objects.all(), watermark(PRICING))
+    processed = 0
+    while True:
+        with transaction.atomic():
+            mark = _watermark(PRICING)
+            ids = list(PricingHistory.objects.filter(id__gt=mark.last_id, id__lte=limit)
+                       .order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return processed
+            groups = (
+                PricingHistory.objects.filter(id__gt=mark.last_id, id__lte=ids[-1])
+                .annotate(day=TruncDate('created_at')).order_by()
+                .values('day', 'user_id').annotate(count=Count('id'), total=Sum('price'))
+            )
+            _write(USAGE_UPSERT, {(g['day'], g['user_id']): (g['count'], g['total']) for g in groups})
+            mark.last_id = ids[-1]
+            mark.save(update_fields=['last_id', 'updated_at'])
+        processed += len(ids)
+
+
+# ============= TUSHUM (OutboxEvent) =============
+
+PAYMENT_EVENT_TYPES = (OutboxEvent.PAYMENT_COMPLETED, OutboxEvent.PAYMENT_CANCELLED)
+
+
+def _revenue_deltas(events):
+    """Hodisalar -> {(kun, tarif): [soni, summa]}. Eski hodisalarda tariff_id yo'q - Payment dan"""
+    missing = [payload['payment_id'] for _, _, payload, _ in events if 'tariff_id' not in payload]
+    tariffs = dict(Payment.objects.filter(pk__in=missing).values_list('pk', 'tariff_id')) if missing else {}
+
+    deltas = defaultdict(lambda: [0, Decimal('0')])
+    for _, event_type, payload, created_at in events:
+        if event_type == OutboxEvent.PAYMENT_COMPLETED:
+            sign = 1
+        elif payload.get('state') == Payment.STATE_CANCELLED_AFTER_COMPLETE:
+            sign = -1
+        else:
+            continue  # to'lovsiz bekor qilish tushumga ta'sir qilmaydi
+        tariff = payload['tariff_id'] if 'tariff_id' in payload else tariffs.get(payload['payment_id'])
+        delta = deltas[(timezone.localdate(created_at), tariff or 0)]
+        delta[0] += sign
+        delta[1] += sign * Decimal(payload['amount'])
+    return deltas
+
+
+def update_revenue(batch_size=BATCH_SIZE):
+    """DailyTariffRevenue ni outbox hodisalaridan davom ettirish"""
+    limit = _limit_id(OutboxEvent.objects.all(), watermark(PAYMENT_EVENTS))
+    processed = 0
+    while True:
+        with transaction.atomic():
+            mark = _watermark(PAYMENT_EVENTS)
+            events = list(
+                OutboxEvent.objects.filter(id__gt=mark.last_id, id__lte=limit).order_by('id')
+                .values_list('id', 'event_type', 'payload', 'created_at')[:batch_size]
+            )
+            if not events:
+                return processed
+            _write(REVENUE_UPSERT, _revenue_deltas([e for e in events if e[1] in PAYMENT_EVENT_TYPES]))
+            mark.last_id = events[-1][0]
+            mark.save(update_fields=['last_id', 'updated_at'])
+        processed += len(events)
+
+
+def update_all(batch_size=BATCH_SIZE):
+    return {PRICING: update_usage(batch_size), PAYMENT_EVENTS: update_revenue(batch_size)}
+
+
+# ============= TO'LIQ QAYTA QURISH =============
+
+def rebuild():
+    """
+    Rolluplarni xom ma'lumotdan qayta qurish (live + arxivlangan tarix, Payment
+    jadvali) va watermarklarni joriy maksimal id ga qo'yish. Outbox paydo
+    bo'lishidan oldingi ma'lumotlar uchun; to'lovlar kam bo'lgan paytda ishga tushiring.
+    """
+    with transaction.atomic():
+        usage_mark = _watermark(PRICING)
+        revenue_mark = _watermark(PAYMENT_EVENTS)
+        DailyUserUsage.objects.all().delete()
+        DailyTariffRevenue.objects.all().delete()
+
+        usage = defaultdict(lambda: [0, Decimal('0')])
+        for archive in HistoryArchive.objects.order_by('month'):
+            for row in history_archive.read_archive(archive):
+                created_at = datetime.fromisoformat(row['created_at'])
+                delta = usage[(timezone.localdate(created_at), row['user_id'])]
+                delta[0] += 1
+                delta[1] += Decimal(row['price'])
+        top_pricing = PricingHistory.objects.aggregate(top=Max('id'))['top'] or 0
+        groups = (
+            PricingHistory.objects.filter(id__lte=top_pricing).annotate(day=TruncDate('created_at')).order_by()
+            .values('day', 'user_id').annotate(count=Count('id'), total=Sum('price'))
+        )
+        for g in groups.iterator():
+            delta = usage[(g['day'], g['user_id'])]
+            delta[0] += g['count']
+            delta[1] += g['total']
+        # Arxivda bo'lib, keyin o'chirilgan foydalanuvchilar qatorlari tashlab yuboriladi
+        existing = set(BotUser.objects.values_list('id', flat=True))
+        _write(USAGE_UPSERT, {key: value for key, value in usage.items() if key[1] in existing})
+
+        top_event = OutboxEvent.objects.aggregate(top=Max('id'))['top'] or 0
+        revenue = defaultdict(lambda: [0, Decimal('0')])
+        paid = Payment.objects.filter(
+            state__in=[Payment.STATE_COMPLETED, Payment.STATE_CANCELLED_AFTER_COMPLETE], performed_at__isnull=False,
+        ).values_list('state', 'tariff_id', 'amount', 'performed_at', 'cancelled_at')
+        for state, tariff_id, amount, performed_at, cancelled_at in paid.iterator():
+            delta = revenue[(timezone.localdate(performed_at), tariff_id or 0)]
+            delta[0] += 1
+            delta[1] += amount
+            if state == Payment.STATE_CANCELLED_AFTER_COMPLETE and cancelled_at:
+                delta = revenue[(timezone.localdate(cancelled_at), tariff_id or 0)]
+                delta[0] -= 1
+                delta[1] -= amount
+        _write(REVENUE_UPSERT, revenue)
+
+        usage_mark.last_id = top_pricing
+        usage_mark.save(update_fields=['last_id', 'updated_at'])
+        revenue_mark.last_id = top_event
+        revenue_mark.save(update_fields=['last_id', 'updated_at'])
+    logger.info(f"Rolluplar qayta qurildi: pricing<= {top_pricing}, events<= {top_event}")
+
+
+# ============= HISOBOTLAR (faqat rolluplardan) =============
+
+def report_range(start=None, end=None, days=30):
+    """[start, end] kunlar oralig'i (default: oxirgi `days` kun)"""
+    end = end or timezone.localdate()
+    start = start or end - timedelta(days=days - 1)
+    return start, end
+
+
+def usage_report(start, end, user_id=None):
+    """Kunlik narxlashlar: [{'day', 'pricing_count', 'price_sum', 'users'}], jami"""
+    rows = DailyUserUsage.objects.filter(day__gte=start, day__lte=end)
+    if user_id is not None:
+        rows = rows.filter(user_id=user_id)
+    days = list(
+        rows.order_by('day').values('day')
+        .annotate(pricing_count=Sum('pricing_count'), price_sum=Sum('price_sum'), users=Count('user_id'))
+    )
+    total = {
+        'pricing_count': sum(d['pricing_count'] for d in days),
+        'price_sum': sum((d['price_sum'] for d in days), Decimal('0')),
+    }
+    return days, total
+
+
+def revenue_report(start, end):
+    """Kun x tarif tushumi: [{'day', 'tariff_id', 'tariff', 'payments_count', 'revenue'}], tariflar bo'yicha jami"""
+    names = dict(PricingTariff.objects.values_list('id', 'name'))
+    rows = list(
+        DailyTariffRevenue.objects.filter(day__gte=start, day__lte=end).order_by('day', 'tariff_ref')
+        .values('day', 'tariff_ref', 'payments_count', 'revenue')
+    )
+    by_tariff = defaultdict(lambda: {'payments_count': 0, 'revenue': Decimal('0')})
+    for row in rows:
+        row['tariff_id'] = row.pop('tariff_ref') or None
+        row['tariff'] = names.get(row['tariff_id'], "Noma'lum")
+        total = by_tariff[row['tariff_id']]
+        total['payments_count'] += row['payments_count']
+        total['revenue'] += row['revenue']
+    totals = [
+        dict(tariff_id=tariff_id, tariff=names.get(tariff_id, "Noma'lum"), **values)
+        for tariff_id, values in sorted(by_tariff.items(), key=lambda item: -item[1]['revenue'])
+    ]
+    return rows, totals
+
+
+def freshness():
+    """Har bir rollup qachon yangilangan"""
+    return dict(RollupWatermark.objects.values_list('name', 'updated_at'))
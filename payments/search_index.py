@@ -0,0 +1,234 @@
+# payments/search_index.py - Admin va API qidiruvi uchun to'liq matnli indeks
+"""
+SearchDocument - har bir obyekt uchun qidiriladigan matn (kichik harflarda):
+- user: telegram_id, username, full_name, phone
+- payment: order_id, payme_transaction_id
+- phone_model: telefon modeli nomi (PricingHistory qatorlari emas, noyob nomlar)
+
+Backend bo'yicha indeks (migratsiya 0016 da yaratiladi):
+- SQLite: FTS5 (trigram tokenizer) external-content jadvali search_documents_fts,
+  triggerlar search_documents bilan sinxron ushlaydi; so'rov MATCH.
+- PostgreSQL: pg_trgm GIN indeksi (body gin_trgm_ops); so'rov LIKE '%...%'.
+Ikkalasida ham so'z ichidagi bo'lak qidiriladi (avvalgi icontains kabi), lekin
+asosiy jadvallar skanerlanmaydi. Trigram sababli har bir so'z kamida
+MIN_TERM_LENGTH belgi - qisqaroq so'rovlar uchun admin prefiks qidiruvda qoladi.
+
+Sinxronlash: signals.py (post_save / post_delete) shu tranzaksiyaning o'zida
+upsert qiladi; bulk_create yo'llari index_phone_models ni o'zi chaqiradi.
+To'liq qayta qurish: manage.py rebuild_search_index.
+"""
+import logging
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import BotUser, Payment, PricingHistory, SearchDocument
+
+logger = logging.getLogger(__name__)
+
+MIN_TERM_LENGTH = 3
+SEARCH_LIMIT = 1000
+BATCH_SIZE = 5000
+
+KIND_USER = SearchDocument.KIND_USER
+KIND_PAYMENT = SearchDocument.KIND_PAYMENT
+KIND_PHONE_MODEL = SearchDocument.KIND_PHONE_MODEL
+KINDS = [KIND_USER, KIND_PAYMENT, KIND_PHONE_MODEL]
+
+# save(update_fields=...) shu maydonlarga tegmasa indeks yangilanmaydi
+USER_FIELDS = frozenset({'telegram_id', 'username', 'full_name', 'phone'})
+PAYMENT_FIELDS = frozenset({'order_id', 'payme_transaction_id'})
+
+FTS_TABLE = 'search_documents_fts'
+
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"body, content='search_documents', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER search_documents_ai AFTER INSERT ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body); END",
+    f"CREATE TRIGGER search_documents_ad AFTER DELETE ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body); END",
+    f"CREATE TRIGGER search_documents_au AFTER UPDATE OF body ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body); "
+    f"INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body); END",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS search_documents_au",
+    "DROP TRIGGER IF EXISTS search_documents_ad",
+    "DROP TRIGGER IF EXISTS search_documents_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+POSTGRES_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX search_documents_body_trgm ON search_documents USING gin (body gin_trgm_ops)",
+]
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS search_documents_body_trgm",
+]
+
+UPSERT = (
+    "INSERT INTO search_documents (kind, ref, body) VALUES (%s, %s, %s) "
+    "ON CONFLICT (kind, ref) DO UPDATE SET body = excluded.body "
+    "WHERE search_documents.body <> excluded.body"
+)
+INSERT_MISSING = "INSERT INTO search_documents (kind, ref, body) VALUES (%s, %s, %s) ON CONFLICT (kind, ref) DO NOTHING"
+
+# Shu jarayonda indeksga yozilgan telefon modellari (use_pricing har safar yozmasligi uchun)
+KNOWN_PHONE_MODELS_LIMIT = 10000
+_known_phone_models = set()
+
+
+def create_backend_index(connection):
+    """Migratsiyadan: backendga mos indeks (SQLite FTS5 + triggerlar, PostgreSQL pg_trgm)"""
+    statements = {'sqlite': SQLITE_SCHEMA, 'postgresql': POSTGRES_SCHEMA}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def drop_backend_index(connection):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+# ============= HUJJATLAR =============
+
+def _body(*parts):
+    return ' '.join(str(part) for part in parts if part not in (None, '')).lower()
+
+
+def user_body(telegram_id, username, full_name, phone):
+    return _body(telegram_id, username and f'@{username}', full_name, phone)
+
+
+def payment_body(order_id, payme_transaction_id):
+    return _body(order_id, payme_transaction_id)
+
+
+def _write(sql, rows):
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+
+def index_user(user):
+    _write(UPSERT, [(KIND_USER, str(user.pk), user_body(user.telegram_id, user.username, user.full_name, user.phone))])
+
+
+def index_payment(payment):
+    _write(UPSERT, [(KIND_PAYMENT, str(payment.pk), payment_body(payment.order_id, payment.payme_transaction_id))])
+
+
+def index_phone_models(names):
+    """Yangi telefon modellari (mavjudlari o'zgarmaydi). Jarayon keshi commit'dan keyin to'ldiriladi"""
+    names = {name for name in names if name} - _known_phone_models
+    if not names:
+        return
+    _write(INSERT_MISSING, [(KIND_PHONE_MODEL, name, _body(name)) for name in sorted(names)])
+
+    def remember():
+        if len(_known_phone_models) + len(names) > KNOWN_PHONE_MODELS_LIMIT:
+            _known_phone_models.clear()
+        _known_phone_models.update(names)
+    transaction.on_commit(remember)
+
+
+def remove(kind, ref):
+    SearchDocument.objects.filter(kind=kind, ref=str(ref)).delete()
+
+
+# ============= QIDIRUV =============
+
+def terms(query):
+    return (query or '').lower().split()
+
+
+def is_searchable(query):
+    """Indeks bu so'rovni bajara oladimi (har bir so'z kamida MIN_TERM_LENGTH belgi)"""
+    words = terms(query)
+    return bool(words) and all(len(word) >= MIN_TERM_LENGTH for word in words)
+
+
+def search(kind, query, limit=SEARCH_LIMIT):
+    """
+    Barcha so'zlar (AND) uchragan hujjatlarning ref lari, yangi indekslanganlari
+    birinchi. So'rov is_searchable bo'lishi kerak.
+    """
+    words = terms(query)
+    if connection.vendor == 'sqlite':
+        match = ' AND '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT d.ref FROM {FTS_TABLE} f JOIN search_documents d ON d.id = f.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s AND d.kind = %s ORDER BY d.id DESC LIMIT %s",
+                [match, kind, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    # PostgreSQL: LIKE '%so'z%' pg_trgm GIN indeksidan foydalanadi
+    documents = SearchDocument.objects.filter(kind=kind)
+    for word in words:
+        documents = documents.filter(body__contains=word)
+    return list(documents.order_by('-id').values_list('ref', flat=True)[:limit])
+
+
+def lookup(kind, query, limit=SEARCH_LIMIT):
+    """Asosiy model queryset'i uchun filtr (admin qidiruvi)"""
+    refs = search(kind, query, limit)
+    if kind == KIND_PHONE_MODEL:
+        return Q(phone_model__in=refs)
+    return Q(pk__in=[int(ref) for ref in refs])
+
+
+# ============= QAYTA QURISH =============
+
+def _documents(kind):
+    """Asosiy jadvaldan (ref, body) oqimi"""
+    if kind == KIND_USER:
+        rows = BotUser.objects.order_by('pk').values_list('pk', 'telegram_id', 'username', 'full_name', 'phone')
+        return ((str(pk), user_body(*fields)) for pk, *fields in rows.iterator(chunk_size=BATCH_SIZE))
+    if kind == KIND_PAYMENT:
+        rows = Payment.objects.order_by('pk').values_list('pk', 'order_id', 'payme_transaction_id')
+        return ((str(pk), payment_body(*fields)) for pk, *fields in rows.iterator(chunk_size=BATCH_SIZE))
+    # Arxivlangan oylardagi modellar indeksga kirmaydi - admin faqat live jadvalni ko'rsatadi
+    names = PricingHistory.objects.order_by('phone_model').values_list('phone_model', flat=True).distinct()
+    return ((name, _body(name)) for name in names.iterator(chunk_size=BATCH_SIZE) if name)
+
+
+def rebuild(kinds=None, batch_size=BATCH_SIZE, progress=None):
+    """
+    Tanlangan turlar indeksini asosiy jadvallardan qaytadan yozadi (har bir tur
+    bitta tranzaksiyada - qidiruv eski yoki yangi holatni ko'radi).
+    Qaytaradi: {tur: hujjatlar soni}
+    """
+    counts = {}
+    for kind in kinds or KINDS:
+        with transaction.atomic():
+            SearchDocument.objects.filter(kind=kind).delete()
+            total = 0
+            batch = []
+            for ref, body in _documents(kind):
+                batch.append((kind, ref, body))
+                if len(batch) >= batch_size:
+                    _write(INSERT_MISSING, batch)
+                    total += len(batch)
+                    batch = []
+                    if progress:
+                        progress(kind, total)
+            _write(INSERT_MISSING, batch)
+            total += len(batch)
+        counts[kind] = total
+        if progress:
+            progress(kind, total)
+        logger.info(f"Qidiruv indeksi qayta qurildi: {kind} - {total} hujjat")
+
+    if KIND_PHONE_MODEL in (kinds or KINDS):
+        _known_phone_models.clear()
+    if connection.vendor == 'sqlite':
+        # FTS jadvalini content jadvalidan to'liq qayta yig'ish va segmentlarni birlashtirish
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return counts
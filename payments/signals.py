@@ -0,0 +1,77 @@
+# payments/signals.py - Model signallari
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import balance_cache, metrics, payment_events, replicas, search_index, tariff_cache
+from .models import BotUser, Payment, PricingHistory, PricingTariff
+
+
+@receiver(post_save, sender=PricingTariff)
+@receiver(post_delete, sender=PricingTariff)
+def pricing_tariff_changed(sender, instance, **kwargs):
+    """Tarif o'zgarsa katalog versiyasini commit'dan keyin oshirish (katalog primary dan quriladi)"""
+    replicas.mark_written_on_commit(replicas.TARIFFS)
+    transaction.on_commit(tariff_cache.bump_version)
+
+
+@receiver(post_save, sender=BotUser)
+@receiver(post_delete, sender=BotUser)
+def bot_user_changed(sender, instance, **kwargs):
+    """save() orqali o'zgarishlar (admin, cancel_transaction, create_user) - balans keshini yangilash"""
+    balance_cache.invalidate_on_commit(instance.telegram_id)
+
+
+@receiver(post_init, sender=Payment)
+def payment_loaded(sender, instance, **kwargs):
+    """Holat o'tishlarini sanash uchun boshlang'ich holatni eslab qolish"""
+    instance._loaded_state = instance.state
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Holat o'zgargan bo'lishi mumkin - long-poll / SSE kutuvchilarini uyg'otish"""
+    replicas.mark_written_on_commit(replicas.order_scope(instance.order_id))
+    if update_fields is None or 'state' in update_fields:
+        payment_events.notify_on_commit(str(instance.order_id), instance.state)
+
+        old_state = 'new' if created else instance._loaded_state
+        if old_state != instance.state:
+            new_state = instance.state
+            transaction.on_commit(lambda: metrics.payment_transition(old_state, new_state))
+            instance._loaded_state = new_state
+
+
+# ============= QIDIRUV INDEKSI =============
+# Shu tranzaksiya ichida: rollback bo'lsa hujjat ham qaytadi
+
+def _touches(update_fields, fields):
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+
+@receiver(post_save, sender=BotUser)
+def bot_user_indexed(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, search_index.USER_FIELDS):
+        search_index.index_user(instance)
+
+
+@receiver(post_save, sender=Payment)
+def payment_indexed(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, search_index.PAYMENT_FIELDS):
+        search_index.index_payment(instance)
+
+
+@receiver(post_save, sender=PricingHistory)
+def pricing_history_indexed(sender, instance, created, **kwargs):
+    if created:
+        search_index.index_phone_models([instance.phone_model])
+
+
+@receiver(post_delete, sender=BotUser)
+def bot_user_unindexed(sender, instance, **kwargs):
+    search_index.remove(search_index.KIND_USER, instance.pk)
+
+
+@receiver(post_delete, sender=Payment)
+def payment_unindexed(sender, instance, **kwargs):
+    search_index.remove(search_index.KIND_PAYMENT, instance.pk)
@@ -0,0 +1,110 @@
+# payments/tariff_cache.py - Tariflar katalogi keshi (get_tariffs uchun)
+import hashlib
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics, replicas
+from .models import PricingTariff
+
+VERSION_KEY = 'payments:tariffs:version'
+
+_lock = threading.Lock()
+_catalog = None  # (version, body, etag)
+
+
+def version_timeout():
+    """
+    Umumiy cache'da versiya muddatsiz (bump hamma workerga ko'rinadi). Process
+    ichidagi cache'da (LocMem) boshqa worker bump'ini ko'rmaydi - versiya
+    TARIFF_VERSION_TTL dan keyin eskiradi va katalog DB dan qayta quriladi.
+    """
+    return None if settings.SHARED_CACHE else settings.TARIFF_VERSION_TTL
+
+
+def get_version():
+    """
+    Katalog versiyasi (cache'da saqlanadi).
+    Kalit yo'qolsa (eviction, restart, muddat) yangi noyob qiymat bilan tiklanadi.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=version_timeout())
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """Tariflar o'zgarganda chaqiriladi - barcha workerlar katalogni qayta quradi"""
+    cache.set(VERSION_KEY, time.time_ns(), timeout=version_timeout())
+
+
+def build_catalog():
+    """DB (replika) dan faol tariflarni o'qib, tayyor JSON body va ETag qaytaradi"""
+    with replicas.reading(replicas.TARIFFS):
+        tariffs = list(PricingTariff.objects.filter(is_active=True).order_by('count').only(
+            'id', 'name', 'count', 'price'
+        ))
+    data = [
+        {
+            'id': t.id,
+            'name': t.name,
+            'count': t.count,
+            'price': float(t.price),
+            'price_per_one': float(t.price_per_one),
+        }
+        for t in tariffs
+    ]
+    body = json.dumps(
+        {'success': True, 'tariffs': data},
+        ensure_ascii=False,
+        separators=(',', ':'),
+    ).encode('utf-8')
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()
+    return body, etag
+
+
+def get_catalog():
+    """
+    (body, etag) qaytaradi.
+    Versiya o'zgarmagan bo'lsa DB ga umuman murojaat qilinmaydi.
+    """
+    global _catalog
+
+    version = get_version()
+    catalog = _catalog
+    if catalog is not None and catalog[0] == version:
+        metrics.inc('cache_requests_total', cache='tariffs', result='hits')
+        return catalog[1], catalog[2]
+
+    metrics.inc('cache_requests_total', cache='tariffs', result='misses')
+    with _lock:
+        catalog = _catalog
+        if catalog is None or catalog[0] != version:
+            # Versiya qurishdan OLDIN o'qilgan - qurish paytida bump bo'lsa,
+            # keyingi so'rov katalogni yana yangilaydi
+            body, etag = build_catalog()
+            catalog = (version, body, etag)
+            _catalog = catalog
+
+    return catalog[1], catalog[2]
+
+
+async def aget_catalog():
+    """get_catalog ning async varianti - tez yo'lda thread pool ishlatilmaydi"""
+    version = await cache.aget(VERSION_KEY)
+    catalog = _catalog
+    if version is not None and catalog is not None and catalog[0] == version:
+        metrics.inc('cache_requests_total', cache='tariffs', result='hits')
+        return catalog[1], catalog[2]
+    return await sync_to_async(get_catalog)()
+
+
+def invalidate_local():
+    """Joriy processdagi katalogni tozalash"""
+    global _catalog
+    _catalog = None
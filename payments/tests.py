@@ -1,13 +1,334 @@
-import base64
-import time
+import os
+import subprocess
+import sys
+import tempfile
+import uuid
+from io import StringIO
+from datetime import timedelta
 
-MERCHANT_ID = "694d35331922c3549c145482"
-amount_sum = 5000
-amount_tiyin = amount_sum * 100
-order_id = f"TEST-{int(time.time())}"
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import router, transaction
+from django.http import HttpResponse
+from django.utils.connection import ConnectionDoesNotExist
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 
-params = f"m={MERCHANT_ID};ac.order_id={order_id};a={amount_tiyin}"
-encoded = base64.b64encode(params.encode()).decode()
-payme_url = f"https://checkout.paycom.uz/{encoded}?test=true"
+from . import balance_cache, idempotency, metrics, replicas
+from .bench import SEED_SPAN, in_process_settings, seed_volume
+from .middleware import MetricsMiddleware
+from .models import BotUser, IdempotencyKey, OutboxEvent, Payment, PricingHistory, PricingTariff
+from .payme_emulator import REASON_REFUND, PaymeEmulator, now_ms
+from .payme_utils import sum_to_tiyin
 
-print(payme_url)
+
+class PaymeRaceTests(TransactionTestCase):
+    """
+    Bir xil tranzaksiyaga parallel Payme callbacklari (har biri o'z ulanishida):
+    Payment.transition() shartli UPDATE i balansni va outbox ni aynan bir marta o'zgartiradi.
+    """
+    ROUNDS = 5
+    COUNT = 10
+
+    def setUp(self):
+        self.tariff = PricingTariff.objects.create(name='Test', count=self.COUNT, price=10000)
+        self.user = BotUser.objects.create(telegram_id=700001, full_name='race', balance=0)
+        self.emulator = PaymeEmulator()
+        settings_override = in_process_settings()
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _created_transaction(self, n):
+        payment = Payment.objects.create(user=self.user, tariff=self.tariff, amount=self.tariff.price,
+                                         pricing_count=self.COUNT, order_id=f'race-{n}')
+        transaction_id = uuid.uuid4().hex[:24]
+        result, error = self.emulator.call('CreateTransaction', {
+            'id': transaction_id, 'time': now_ms(), 'amount': sum_to_tiyin(self.tariff.price),
+            'account': {'order_id': payment.order_id},
+        })
+        self.assertIsNone(error)
+        self.assertEqual(result['state'], Payment.STATE_CREATED)
+        return payment, transaction_id
+
+    def _events(self, payment, event_type):
+        return OutboxEvent.objects.filter(event_type=event_type, payload__order_id=payment.order_id).count()
+
+    def _balance(self):
+        return BotUser.objects.values_list('balance', flat=True).get(pk=self.user.pk)
+
+    def test_parallel_perform_credits_once(self):
+        for n in range(self.ROUNDS):
+            payment, transaction_id = self._created_transaction(n)
+            before = self._balance()
+
+            replies = self.emulator.call_parallel([('PerformTransaction', {'id': transaction_id})] * 3)
+
+            for result, error in replies:
+                self.assertIsNone(error)
+                self.assertEqual(result['state'], Payment.STATE_COMPLETED)
+            self.assertEqual(self._balance(), before + self.COUNT)
+            self.assertEqual(self._events(payment, OutboxEvent.PAYMENT_COMPLETED), 1)
+            self.assertEqual(self._events(payment, OutboxEvent.PAYMENT_CANCELLED), 0)
+
+    def test_parallel_perform_cancel_perform(self):
+        for n in range(self.ROUNDS):
+            payment, transaction_id = self._created_transaction(n)
+            before = self._balance()
+
+            (_, first_error), (cancelled, cancel_error), (_, second_error) = self.emulator.call_parallel([
+                ('PerformTransaction', {'id': transaction_id}),
+                ('CancelTransaction', {'id': transaction_id, 'reason': REASON_REFUND}),
+                ('PerformTransaction', {'id': transaction_id}),
+            ])
+
+            self.assertIsNone(cancel_error)
+            payment.refresh_from_db()
+            self.assertEqual(cancelled['state'], payment.state)
+            completed = self._events(payment, OutboxEvent.PAYMENT_COMPLETED)
+            self.assertEqual(self._events(payment, OutboxEvent.PAYMENT_CANCELLED), 1)
+            if payment.state == Payment.STATE_CANCELLED_AFTER_COMPLETE:
+                # Perform yutdi: bitta kredit, keyin Cancel uni qaytardi
+                self.assertEqual(completed, 1)
+            else:
+                # Cancel yutdi: ikkala Perform ham -31008, kredit yo'q
+                self.assertEqual(payment.state, Payment.STATE_CANCELLED)
+                self.assertEqual(completed, 0)
+                self.assertEqual([first_error['code'], second_error['code']], [-31008, -31008])
+            self.assertEqual(self._balance(), before)
+
+
+REPLICAS = ['replica1', 'replica2']
+
+
+@override_settings(
+    DATABASES={**settings.DATABASES, **{alias: dict(settings.DATABASES['default'], TEST={'MIRROR': 'default'})
+                                        for alias in REPLICAS}},
+    DATABASE_REPLICAS=REPLICAS,
+    DATABASE_ROUTERS=['payments.replicas.ReplicaRouter'],
+    REPLICA_STICKY_SECONDS=10,
+    SHARED_CACHE=True,
+)
+class ReplicaRouterTests(TransactionTestCase):
+    """
+    ReplicaRouter va sticky scope'lar. Replika ulanishlari ochilmaydi - alias
+    QuerySet.db (router.db_for_read) orqali tekshiriladi.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def _read_alias(self, *scopes):
+        with replicas.reading(*scopes) as reads:
+            alias = BotUser.objects.all().db
+            self.assertEqual(BotUser.objects.all().db, alias)  # blok ichida bitta alias
+        self.assertEqual(reads.used_replica, alias in REPLICAS)
+        return alias
+
+    def test_reads_outside_block_use_default(self):
+        self.assertEqual(BotUser.objects.all().db, 'default')
+        self.assertEqual(router.db_for_read(BotUser), 'default')
+
+    def test_reads_inside_block_use_replica(self):
+        self.assertIn(self._read_alias(replicas.user_scope(1)), REPLICAS)
+
+    def test_reads_inside_transaction_use_default(self):
+        with transaction.atomic():
+            self.assertEqual(self._read_alias(replicas.user_scope(1)), 'default')
+
+    def test_writes_and_migrations_use_default(self):
+        with replicas.reading(replicas.user_scope(1)):
+            self.assertEqual(router.db_for_write(BotUser), 'default')
+        self.assertTrue(router.allow_migrate('default', 'payments'))
+        self.assertFalse(router.allow_migrate('replica1', 'payments'))
+
+    def test_sticky_after_write(self):
+        user = BotUser.objects.create(telegram_id=700002, full_name='sticky', balance=0)
+        scope = replicas.user_scope(user.telegram_id)
+        cache.clear()  # create() ham belgilaydi
+
+        with transaction.atomic():
+            BotUser.objects.change_balance(5, pk=user.pk)
+            # Commit'gacha belgi yo'q - oyna commit'dan boshlanadi
+            self.assertFalse(replicas.is_sticky(scope))
+
+        self.assertEqual(self._read_alias(scope), 'default')
+        self.assertIn(self._read_alias(replicas.user_scope(user.telegram_id + 1)), REPLICAS)
+
+    def test_sticky_rolled_back_write(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            replicas.mark_written_on_commit(replicas.order_scope('rolled-back'))
+            raise RuntimeError
+        self.assertIn(self._read_alias(replicas.order_scope('rolled-back')), REPLICAS)
+
+    def test_sticky_any_scope(self):
+        replicas.mark_written(replicas.TARIFFS)
+        self.assertEqual(self._read_alias(replicas.user_scope(1), replicas.TARIFFS), 'default')
+
+    def test_pick_newest(self):
+        now = timezone.now()
+        self.assertEqual(replicas.pick(newest=now), 'default')
+        self.assertEqual(replicas.pick(newest=now - timedelta(seconds=5)), 'default')
+        self.assertIn(replicas.pick(newest=now - timedelta(seconds=60)), REPLICAS)
+        self.assertIn(replicas.pick(), REPLICAS)
+
+    def test_pick_newest_and_sticky_scope(self):
+        replicas.mark_written(replicas.user_scope(1))
+        self.assertEqual(replicas.pick(replicas.user_scope(1), newest=timezone.now() - timedelta(seconds=60)),
+                         'default')
+
+    @override_settings(SHARED_CACHE=False, GUNICORN_WORKERS=2)
+    def test_process_local_sticky_marks_disable_replicas(self):
+        self.assertEqual(self._read_alias(replicas.user_scope(1)), 'default')
+        self.assertEqual(replicas.pick(newest=timezone.now() - timedelta(seconds=60)), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(replicas.pick(), 'default')
+
+
+class BalanceCacheTests(TestCase):
+    """Balans o'zgarishi tokenni yozuvdan oldin va commit'dan keyin yangilaydi"""
+
+    def setUp(self):
+        self.user = BotUser.objects.create(telegram_id=700003, full_name='cache', balance=3)
+
+    def _cached(self, loaded):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return loaded
+
+        return balance_cache.get_or_load(self.user.telegram_id, loader), bool(calls)
+
+    def test_write_invalidates_before_and_after_commit(self):
+        self.assertEqual(self._cached(3), (3, True))
+        self.assertEqual(self._cached(3), (3, False))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BotUser.objects.change_balance(2, telegram_id=self.user.telegram_id)
+            # Commit'gacha eski qiymat keshdan berilmaydi; poygadagi o'quvchi
+            # (replika yoki commit'dan oldingi snapshot) eski qiymatni yozadi
+            self.assertEqual(self._cached(3), (3, True))
+
+        self.assertEqual(self._cached(5), (5, True))
+
+    def test_invalidate_many_before_and_after_commit(self):
+        self._cached(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            balance_cache.invalidate_many_on_commit([self.user.telegram_id])
+            self.assertEqual(self._cached(3), (3, True))
+        self.assertEqual(self._cached(4), (4, True))
+
+
+class ChangeBalanceTests(TestCase):
+
+    def setUp(self):
+        self.user = BotUser.objects.create(telegram_id=700004, full_name='balance', balance=1)
+
+    def test_conditional_decrement(self):
+        self.assertEqual(BotUser.objects.change_balance(-1, telegram_id=self.user.telegram_id), (self.user.pk, 0))
+        self.assertIsNone(BotUser.objects.change_balance(-1, pk=self.user.pk))
+
+    def test_uses_manager_database(self):
+        self.assertEqual(BotUser.objects.db_manager('default').change_balance(2, pk=self.user.pk), (self.user.pk, 3))
+        with self.assertRaises(ConnectionDoesNotExist):
+            BotUser.objects.db_manager('missing').change_balance(2, pk=self.user.pk)
+
+
+class IdempotencyTests(TransactionTestCase):
+
+    def _request(self, **headers):
+        return Request(RequestFactory().post('/', {}, content_type='application/json', headers=headers),
+                       parsers=[JSONParser()])
+
+    def test_build_key_normalizes_ids(self):
+        request = self._request(idempotency_key='abc')
+        self.assertEqual(idempotency.build_key(request, '123', 7), idempotency.build_key(request, 123, ' 7'))
+        self.assertEqual(idempotency.build_key(request, 123, 7), '123:7:abc')
+        self.assertIsNone(idempotency.build_key(self._request(), 123, 7))
+
+    def test_rollups_loop_purges_expired_keys(self):
+        now = timezone.now()
+        IdempotencyKey.objects.create(key='old', expires_at=now - timedelta(seconds=1))
+        IdempotencyKey.objects.create(key='live', expires_at=now + timedelta(hours=1))
+
+        call_command('update_rollups', stdout=StringIO())
+
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['live'])
+
+
+class BenchSeedTests(TestCase):
+
+    def test_seed_spreads_created_at(self):
+        started = timezone.now()
+        seed_volume(users=20, history=50, payments=30, batch_size=7)
+
+        for model in (BotUser, PricingHistory, Payment):
+            stamps = list(model.objects.order_by('id').values_list('created_at', flat=True))
+            self.assertEqual(stamps, sorted(stamps))
+            self.assertGreaterEqual(stamps[0], started - SEED_SPAN)
+            self.assertGreater(stamps[-1] - stamps[0], SEED_SPAN / 2)
+        for created_at, performed_at in Payment.objects.filter(state=Payment.STATE_COMPLETED).values_list(
+                'created_at', 'performed_at'):
+            self.assertGreater(performed_at, created_at)
+
+    def test_url_mode_refuses_to_seed_without_debug(self):
+        with self.assertRaisesMessage(CommandError, '--allow-seed'):
+            call_command('bench_api', url='http://localhost:9', scale=0.0001, stderr=StringIO())
+        self.assertFalse(BotUser.objects.exists())
+
+
+class MetricsTests(TransactionTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(METRICS_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _write(self, pid, value):
+        with open(os.path.join(settings.METRICS_DIR, f'{pid}.json'), 'w') as f:
+            f.write(f'{{"counters": [["test_total", [], {value}]], "histograms": []}}')
+
+    def test_collect_prunes_dead_processes(self):
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        self._write(dead.pid, 5)
+        self._write(os.getppid(), 2)
+
+        counters, _ = metrics.collect()
+
+        self.assertEqual(counters[('test_total', ())], 2)
+        self.assertFalse(os.path.exists(os.path.join(settings.METRICS_DIR, f'{dead.pid}.json')))
+
+    def _queries_observed(self):
+        data = metrics._histograms.get(('db_queries_per_request', (('view', 'unmatched'),)))
+        return data[-2] if data else 0
+
+    def test_counts_queries_of_sync_views(self):
+        def view(request):
+            BotUser.objects.count()
+            PricingTariff.objects.count()
+            return HttpResponse()
+
+        before = self._queries_observed()
+        MetricsMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(self._queries_observed() - before, 2)
+
+    def test_counts_queries_of_async_views_on_other_threads(self):
+        async def view(request):
+            await BotUser.objects.acount()
+            # Boshqa thread - boshqa ulanish obyekti (replika aliaslari kabi alohida)
+            await sync_to_async(PricingTariff.objects.count, thread_sensitive=False)()
+            return HttpResponse()
+
+        before = self._queries_observed()
+        async_to_sync(MetricsMiddleware(view).__acall__)(RequestFactory().get('/'))
+        self.assertEqual(self._queries_observed() - before, 2)
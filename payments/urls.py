@@ -1,28 +1,53 @@
 # payments/urls.py - TO'LIQ KONFIGURATSIYA
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'payments'
 
+# API_ASYNC=True (ASGI rejimi) bo'lsa qaynoq endpointlar async variantda
+if settings.API_ASYNC:
+    from . import async_views as hot_views
+else:
+    hot_views = views
+
 urlpatterns = [
     # ============= BOT API ENDPOINTLAR =============
 
     # Tariflar
-    path('tariffs/', views.get_tariffs, name='get_tariffs'),
+    path('tariffs/', hot_views.get_tariffs, name='get_tariffs'),
 
     # Foydalanuvchi
-    path('user/create/', views.create_user, name='create_user'),
-    path('user/<int:telegram_id>/balance/', views.get_balance, name='get_balance'),
+    path('user/create/', hot_views.create_user, name='create_user'),
+    path('user/<int:telegram_id>/balance/', hot_views.get_balance, name='get_balance'),
     path('user/update-phone/', views.update_phone, name='update_phone'),
+    path('user/<int:telegram_id>/payments/', views.user_payments, name='user_payments'),
+    path('user/<int:telegram_id>/pricing-history/', views.user_pricing_history, name='user_pricing_history'),
 
     # Narxlash
     path('pricing/use/', views.use_pricing, name='use_pricing'),
+    path('pricing/use-batch/', views.use_pricing_batch, name='use_pricing_batch'),
 
     # To'lov yaratish va tekshirish
     path('payment/create/', views.create_payment, name='create_payment'),
     # payments/urls.py
-    path('payment/status/<str:order_id>/', views.check_payment_status, name='check_payment_status'),
+    path('payment/status/<str:order_id>/', hot_views.check_payment_status, name='check_payment_status'),
+    path('payment/status/<str:order_id>/wait/', hot_views.wait_payment_status, name='wait_payment_status'),
+    path('payment/status/<str:order_id>/events/', hot_views.payment_status_events, name='payment_status_events'),
 
     # ============= PAYME MERCHANT API =============
-    path('payme/callback/', views.payme_callback, name='payme_callback'),
-]
\ No newline at end of file
+    path('payme/callback/', hot_views.payme_callback, name='payme_callback'),
+
+    # ============= ICHKI STATISTIKA =============
+    path('stats/cache/', views.cache_stats, name='cache_stats'),
+    path('stats/usage/', views.usage_stats, name='usage_stats'),
+    path('stats/revenue/', views.revenue_stats, name='revenue_stats'),
+    path('metrics/', views.metrics_view, name='metrics'),
+
+    # ============= QIDIRUV (admin) =============
+    path('search/', views.search, name='search'),
+
+    # ============= EKSPORT (admin) =============
+    path('export/payments/', views.export_payments, name='export_payments'),
+    path('export/pricing-history/', views.export_pricing_history, name='export_pricing_history'),
+]
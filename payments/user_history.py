@@ -0,0 +1,134 @@
+# payments/user_history.py - Bot uchun foydalanuvchi to'lovlari va narxlash tarixi (keyset sahifalash)
+"""
+GET /api/payments/user/<telegram_id>/payments/ va .../pricing-history/.
+
+Sahifalar (-created_at, -id) tartibida, kursor - sahifadagi oxirgi qatorning
+(created_at, id) jufti (ochiq bo'lmagan base64 satr). So'rov
+(user, created_at) indeksida diapazon: WHERE user_id = ? AND created_at <= ?
+... ORDER BY created_at DESC, id DESC LIMIT n - OFFSET yo'q, 1000-sahifa
+birinchisi kabi tez.
+
+?fields=a,b - faqat shu maydonlar (tarif nomi so'ralmasa JOIN ham yo'q).
+Narxlash tarixiga arxivlangan oylar ham kiradi (history_archive.iter_history):
+live qatorlar tugagach, arxivdan faqat shu foydalanuvchi segmentlari o'qiladi
+(sahifa to'lganda to'xtaydi). Segmentsiz eski arxivlar o'tkazib yuboriladi -
+birinchi va chuqur sahifalar ham butun arxivni skanerlamaydi.
+"""
+import base64
+import itertools
+from datetime import datetime
+
+from django.db.models import Q
+
+from . import history_archive
+from .models import Payment
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# javob maydoni -> queryset maydoni
+PAYMENT_FIELDS = {
+    'id': 'id',
+    'order_id': 'order_id',
+    'state': 'state',
+    'amount': 'amount',
+    'count': 'pricing_count',
+    'tariff_name': 'tariff__name',
+    'payme_transaction_id': 'payme_transaction_id',
+    'created_at': 'created_at',
+    'performed_at': 'performed_at',
+    'cancelled_at': 'cancelled_at',
+}
+HISTORY_FIELDS = ['id', 'phone_model', 'price', 'created_at', 'archived']
+
+
+class PageError(ValueError):
+    """Noto'g'ri cursor / limit / fields (400)"""
+
+
+# ============= PARAMETRLAR =============
+
+def encode_cursor(created_at, pk):
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{pk}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Kursor -> (created_at, id) yoki None"""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        created_at, pk = datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise PageError("cursor noto'g'ri")
+    if created_at.tzinfo is None:
+        raise PageError("cursor noto'g'ri")
+    return created_at, pk
+
+
+def parse_limit(value):
+    if not value:
+        return PAGE_SIZE
+    try:
+        return min(max(int(value), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise PageError("limit butun son bo'lishi kerak")
+
+
+def parse_fields(value, allowed):
+    """'a,b' -> ['a', 'b'] (bo'sh - hammasi)"""
+    if not value:
+        return list(allowed)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise PageError(f"fields: {', '.join(allowed)}")
+    return fields
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _page(rows, limit, fields):
+    """limit + 1 ta qator -> javob qismi (results, next_cursor)"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return {
+        'results': [{field: _plain(row[field]) for field in fields} for row in rows],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    }
+
+
+# ============= SAHIFALAR =============
+
+def payments_page(user_id, before=None, limit=PAGE_SIZE, fields=None):
+    fields = fields or list(PAYMENT_FIELDS)
+    columns = list(dict.fromkeys(['id', 'created_at', *fields]))
+    queryset = Payment.objects.filter(user_id=user_id)
+    if before is not None:
+        created_at, pk = before
+        queryset = queryset.filter(Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=pk)))
+    rows = queryset.order_by('-created_at', '-id').values_list(*[PAYMENT_FIELDS[name] for name in columns])
+
+    results = []
+    for values in rows[:limit + 1]:
+        row = dict(zip(columns, values))
+        if 'amount' in row:
+            row['amount'] = float(row['amount'])
+        results.append(row)
+    return _page(results, limit, fields)
+
+
+def history_page(user_id, before=None, limit=PAGE_SIZE, fields=None):
+    fields = fields or HISTORY_FIELDS
+    rows = history_archive.iter_history(user_id=user_id, before=before, chunk_size=limit + 1,
+                                        indexed_only=True)
+    rows = [dict(row, price=float(row['price'])) for row in itertools.islice(rows, limit + 1)]
+    return _page(rows, limit, fields)
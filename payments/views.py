@@ -1,41 +1,107 @@
 # payments/views.py - TO'LIQ TUZATILGAN (Payme response format fixed)
 import base64
 import json
+import hmac
+import ipaddress
 import logging
-from decimal import Decimal
-from django.http import JsonResponse
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import ROUND_HALF_UP, Decimal
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
+from django.utils.http import parse_etags
+from django.urls import reverse
 from django.db import transaction as db_transaction
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
 from .models import BotUser, Payment, PricingTariff, PricingHistory
-from .payme_utils import create_payme_link, check_payme_auth, tiyin_to_sum, sum_to_tiyin
+from . import (
+    balance_cache, exports, history_archive, idempotency, metrics, payme_dispatch, rollups,
+    replicas, search_index, tariff_cache, user_history,
+)
+from .payme_dispatch import INTEGER, NUMBER, OBJECT, STRING, payme_method
+from .payme_utils import create_payme_link, check_payme_auth, tiyin_to_sum, sum_to_tiyin, stream_jsonrpc_result
 from django.db import models
 logger = logging.getLogger(__name__)
 
 
 # ============= BOT UCHUN API ENDPOINTLAR =============
 
+def _tariffs_response(request, body, etag):
+    """Tayyor katalog body'si yoki If-None-Match mos kelsa 304"""
+    client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in client_etags or '*' in client_etags:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _user_data(user, created):
+    return {
+        'success': True,
+        'telegram_id': user.telegram_id,
+        'balance': user.balance,
+        'full_name': user.full_name,
+        'username': user.username,
+        'phone': user.phone,  # ✅ PHONE field
+        'is_active': user.is_active,
+        'created': created
+    }
+
+
+def _balance_data(user):
+    return {
+        'success': True,
+        'telegram_id': user.telegram_id,
+        'balance': user.balance,
+        'full_name': user.full_name,
+        'username': user.username
+    }
+
+
+def _load_balance_data(telegram_id):
+    """Balans keshi uchun loader (replikadan, yozuvdan keyin primary): user yo'q bo'lsa None"""
+    with replicas.reading(replicas.user_scope(telegram_id)):
+        user = BotUser.objects.filter(telegram_id=telegram_id).only(
+            'telegram_id', 'balance', 'full_name', 'username'
+        ).first()
+    return _balance_data(user) if user else None
+
+
+def _payment_status_data(payment):
+    """payment.user va payment.tariff oldindan yuklangan (select_related) bo'lishi kerak"""
+    return {
+        'success': True,
+        'has_payment': True,
+        'payment_id': payment.id,
+        'order_id': str(payment.order_id),
+        'state': payment.state,
+        'state_display': payment.get_state_display(),
+        'amount': float(payment.amount),
+        'count': payment.pricing_count,
+        'balance': payment.user.balance if payment.user else None,
+        'created_at': payment.created_at.isoformat(),
+        'performed_at': payment.performed_at.isoformat() if payment.performed_at else None,
+        'cancelled_at': payment.cancelled_at.isoformat() if payment.cancelled_at else None,
+        'tariff_name': payment.tariff.name if payment.tariff else None,
+        'payme_transaction_id': payment.payme_transaction_id or None
+    }
+
+
 @api_view(['GET'])
 def get_tariffs(request):
-    """Barcha faol tariflarni olish"""
+    """Barcha faol tariflarni olish (keshdan, ETag / 304 bilan)"""
     try:
-        tariffs = PricingTariff.objects.filter(is_active=True).order_by('count')
-        data = []
-        for t in tariffs:
-            price_per_one = float(t.price_per_one) if hasattr(t, 'price_per_one') else float(t.price) / t.count
-            data.append({
-                'id': t.id,
-                'name': t.name,
-                'count': t.count,
-                'price': float(t.price),
-                'price_per_one': price_per_one
-            })
-        return Response({'success': True, 'tariffs': data})
+        body, etag = tariff_cache.get_catalog()
+        return _tariffs_response(request, body, etag)
     except Exception as e:
         logger.error(f"Get tariffs error: {e}", exc_info=True)
         return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -65,16 +131,7 @@ def create_user(request):
                 user.username = username
             user.save()
 
-        return Response({
-            'success': True,
-            'telegram_id': user.telegram_id,
-            'balance': user.balance,
-            'full_name': user.full_name,
-            'username': user.username,
-            'phone': user.phone,  # ✅ PHONE field
-            'is_active': user.is_active,
-            'created': created
-        })
+        return Response(_user_data(user, created))
     except Exception as e:
         logger.error(f"Create user error: {e}", exc_info=True)
         return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -122,14 +179,10 @@ def update_phone(request):
 def get_balance(request, telegram_id):
     """Foydalanuvchi balansini olish"""
     try:
-        user = BotUser.objects.get(telegram_id=telegram_id)
-        return Response({
-            'success': True,
-            'telegram_id': user.telegram_id,
-            'balance': user.balance,
-            'full_name': user.full_name,
-            'username': user.username
-        })
+        data = balance_cache.get_or_load(telegram_id, lambda: _load_balance_data(telegram_id))
+        if data is None:
+            raise BotUser.DoesNotExist
+        return Response(data)
     except BotUser.DoesNotExist:
         return Response({'success': False, 'error': 'Foydalanuvchi topilmadi'}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
@@ -148,22 +201,122 @@ def use_pricing(request):
         return Response({'success': False, 'error': 'telegram_id majburiy'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        user = BotUser.objects.get(telegram_id=telegram_id)
-
-        if user.balance <= 0:
+        with db_transaction.atomic():
+            result = BotUser.objects.change_balance(-1, telegram_id=telegram_id)
+            if result is not None:
+                user_id, balance = result
+                PricingHistory.objects.create(user_id=user_id, phone_model=phone_model, price=price)
+
+        if result is None:
+            if not BotUser.objects.filter(telegram_id=telegram_id).exists():
+                raise BotUser.DoesNotExist
             return Response({'success': False, 'error': 'Balans yetarli emas', 'balance': 0},
                             status=status.HTTP_400_BAD_REQUEST)
 
+        return Response({'success': True, 'balance': balance, 'message': 'Narxlash muvaffaqiyatli'})
+    except BotUser.DoesNotExist:
+        return Response({'success': False, 'error': 'Foydalanuvchi topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        logger.error(f"Use pricing error: {e}", exc_info=True)
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+PRICING_BATCH_MAX_ITEMS = 500
+PRICING_BATCH_POLICIES = ('all', 'partial')
+
+
+def _batch_price(value):
+    """
+    PricingHistory.price ga sig'adigan narx: chekli (NaN/Infinity emas), manfiy
+    emas, numeric(max_digits, decimal_places) ichida; kasr qismi DB kabi yaxlitlanadi.
+    Aks holda ValueError / ArithmeticError (400).
+    """
+    field = PricingHistory._meta.get_field('price')
+    price = Decimal(str(value))
+    if not price.is_finite() or price < 0:
+        raise ValueError
+    price = price.quantize(Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP)
+    if price.adjusted() >= field.max_digits - field.decimal_places:
+        raise ValueError
+    return price
+
+
+@api_view(['POST'])
+def use_pricing_batch(request):
+    """
+    Bir nechta telefonni bitta so'rovda narxlash.
+    policy='all' - yoki hammasi, yoki hech biri (default)
+    policy='partial' - balans yetgancha (ro'yxat tartibida)
+    """
+    telegram_id = request.data.get('telegram_id')
+    items = request.data.get('items')
+    policy = request.data.get('policy', 'all')
+
+    if not telegram_id:
+        return Response({'success': False, 'error': 'telegram_id majburiy'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not isinstance(items, list) or not items:
+        return Response({'success': False, 'error': 'items bo\'sh bo\'lmagan ro\'yxat bo\'lishi kerak'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    if len(items) > PRICING_BATCH_MAX_ITEMS:
+        return Response({'success': False, 'error': f'items {PRICING_BATCH_MAX_ITEMS} tadan oshmasligi kerak'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    if policy not in PRICING_BATCH_POLICIES:
+        return Response({'success': False, 'error': 'policy: all yoki partial'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        rows = []
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError
+            rows.append((str(item.get('phone_model', ''))[:255], _batch_price(item.get('price', 0))))
+    except (ValueError, ArithmeticError):
+        return Response({'success': False, 'error': 'items formati noto\'g\'ri'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
         with db_transaction.atomic():
-            user.balance -= 1
-            user.save()
-            PricingHistory.objects.create(user=user, phone_model=phone_model, price=price)
+            consumed = len(rows)
+            result = BotUser.objects.change_balance(-consumed, telegram_id=telegram_id)
+
+            while result is None and policy == 'partial':
+                # Balans yetmadi - borini olamiz (parallel o'zgarsa guard qayta urinadi)
+                available = BotUser.objects.filter(telegram_id=telegram_id).values_list('balance', flat=True).first()
+                if available is None or available <= 0:
+                    break
+                consumed = min(available, len(rows))
+                result = BotUser.objects.change_balance(-consumed, telegram_id=telegram_id)
+
+            if result is not None:
+                user_id, balance = result
+                PricingHistory.objects.bulk_create([
+                    PricingHistory(user_id=user_id, phone_model=phone_model, price=price)
+                    for phone_model, price in rows[:consumed]
+                ])
+                # bulk_create signal yubormaydi
+                search_index.index_phone_models(phone_model for phone_model, _ in rows[:consumed])
+
+        if result is None:
+            balance = BotUser.objects.filter(telegram_id=telegram_id).values_list('balance', flat=True).first()
+            if balance is None:
+                raise BotUser.DoesNotExist
+            return Response({'success': False, 'error': 'Balans yetarli emas', 'balance': balance,
+                             'requested': len(rows)},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({'success': True, 'balance': user.balance, 'message': 'Narxlash muvaffaqiyatli'})
+        return Response({
+            'success': True,
+            'requested': len(rows),
+            'consumed': consumed,
+            'skipped': len(rows) - consumed,
+            'balance': balance,
+            'message': 'Narxlash muvaffaqiyatli'
+        })
     except BotUser.DoesNotExist:
         return Response({'success': False, 'error': 'Foydalanuvchi topilmadi'}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
-        logger.error(f"Use pricing error: {e}", exc_info=True)
+        logger.error(f"Use pricing batch error: {e}", exc_info=True)
         return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
@@ -177,43 +330,64 @@ def create_payment(request):
         return Response({'success': False, 'error': 'telegram_id va tariff_id majburiy'},
                         status=status.HTTP_400_BAD_REQUEST)
 
-    try:
-        user = BotUser.objects.get(telegram_id=telegram_id)
-        tariff = PricingTariff.objects.get(id=tariff_id, is_active=True)
-
-        payment = Payment.objects.create(
-            user=user,
-            tariff=tariff,
-            amount=tariff.price,
-            pricing_count=tariff.count,
-            state=Payment.STATE_CREATED
-        )
-
-        logger.info(
-            f"✅ Payment created: #{payment.id} (order_id: {payment.order_id}), user: {telegram_id}, tariff: {tariff.name}")
+    idem_key = idempotency.build_key(request, telegram_id, tariff_id)
+    if idem_key:
+        replay = idempotency.lookup(idem_key)
+        if replay is not None:
+            return Response(replay)
 
-        # ✅ FAQAT order_id va amount yuboriladi
-        payme_url = create_payme_link(
-            order_id=str(payment.order_id),
-            amount=float(tariff.price)
-        )
-
-        if not payme_url:
-            logger.error(f"❌ Failed to create Payme URL for payment #{payment.id}")
-            return Response({'success': False, 'error': 'Payme havolasini yaratishda xatolik'},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        logger.info(f"✅ Payme URL created: {payme_url}")
+    try:
+        with db_transaction.atomic():
+            if idem_key:
+                replay = idempotency.claim(idem_key)
+                if replay is idempotency.IN_PROGRESS:
+                    return Response({'success': False, 'error': 'So\'rov hali bajarilmoqda'},
+                                    status=status.HTTP_409_CONFLICT)
+                if replay is not None:
+                    return Response(replay)
+
+            user = BotUser.objects.get(telegram_id=telegram_id)
+            tariff = PricingTariff.objects.get(id=tariff_id, is_active=True)
+
+            payment = Payment.objects.create(
+                user=user,
+                tariff=tariff,
+                amount=tariff.price,
+                pricing_count=tariff.count,
+                state=Payment.STATE_CREATED
+            )
+
+            logger.info(
+                f"✅ Payment created: #{payment.id} (order_id: {payment.order_id}), user: {telegram_id}, tariff: {tariff.name}")
+
+            # ✅ FAQAT order_id va amount yuboriladi
+            payme_url = create_payme_link(
+                order_id=str(payment.order_id),
+                amount=float(tariff.price)
+            )
+
+            if not payme_url:
+                logger.error(f"❌ Failed to create Payme URL for payment #{payment.id}")
+                # Kalit (va to'lov) saqlanmaydi - qayta urinish yangidan bajariladi
+                db_transaction.set_rollback(True)
+                return Response({'success': False, 'error': 'Payme havolasini yaratishda xatolik'},
+                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            logger.info(f"✅ Payme URL created: {payme_url}")
+
+            data = {
+                'success': True,
+                'payment_id': payment.id,
+                'order_id': str(payment.order_id),
+                'payment_url': payme_url,
+                'amount': float(tariff.price),
+                'count': tariff.count,
+                'tariff_name': tariff.name
+            }
+            if idem_key:
+                idempotency.store(idem_key, data)
 
-        return Response({
-            'success': True,
-            'payment_id': payment.id,
-            'order_id': str(payment.order_id),
-            'payment_url': payme_url,
-            'amount': float(tariff.price),
-            'count': tariff.count,
-            'tariff_name': tariff.name
-        })
+        return Response(data)
     except BotUser.DoesNotExist:
         return Response({'success': False, 'error': 'Foydalanuvchi topilmadi'}, status=status.HTTP_404_NOT_FOUND)
     except PricingTariff.DoesNotExist:
@@ -228,115 +402,89 @@ def create_payment(request):
 logger = logging.getLogger("payme")
 
 
-@csrf_exempt
-@require_http_methods(["POST"])
-def payme_callback(request):
+def _jsonrpc_response(request_id, result):
+    """JSON-RPC javobi: handler natijasi o'zgartirilmasdan envelope ga qo'yiladi"""
+    if isinstance(result, dict) and "error" in result:
+        envelope = {"jsonrpc": "2.0", "error": result["error"], "id": request_id}
+    else:
+        envelope = {"jsonrpc": "2.0", "result": result, "id": request_id}
+    return HttpResponse(
+        json.dumps(envelope, ensure_ascii=False, separators=(",", ":")),
+        content_type="application/json",
+        status=200
+    )
+
+
+def _parse_payme_request(request):
     """
-    Payme Merchant API callback handler
-    ⚠️ Payme talabiga ko‘ra HAR DOIM HTTP 200
+    Body ni parse qilish va auth tekshirish (sync va async callback uchun umumiy).
+    Qaytaradi: (request_id, method, params, error_response | None)
     """
-    request_id = None
-
+    # ==============================
+    # 1. JSON PARSE (bytes dan bir marta)
+    # ==============================
     try:
-        # ==============================
-        # 0. RAW DEBUG
-        # ==============================
-        raw_auth = request.META.get("HTTP_AUTHORIZATION", "")
-        raw_body = request.body.decode("utf-8", errors="ignore")
-
-        logger.warning("===== PAYME RAW REQUEST =====")
-        logger.warning(f"AUTH HEADER: {raw_auth}")
-        logger.warning(f"RAW BODY: {raw_body}")
-        logger.warning("=============================")
-
-        # ==============================
-        # 1. JSON PARSE
-        # ==============================
-        try:
-            body = json.loads(raw_body)
-        except json.JSONDecodeError:
-            return JsonResponse({
-                "jsonrpc": "2.0",
-                "error": {"code": -32700, "message": "Parse error"},
-                "id": None
-            }, status=200)
-
+        body = json.loads(request.body)
         method = body.get("method")
         params = body.get("params") or {}
         request_id = body.get("id")
+    except (ValueError, AttributeError):
+        return None, None, None, _jsonrpc_response(
+            None, payme_dispatch.error(payme_dispatch.ERROR_PARSE, "Parse error")
+        )
 
-        logger.info(f"📥 Payme METHOD: {method}")
-        logger.info(f"📥 Payme PARAMS: {params}")
-
-        # ==============================
-        # 2. AUTH CHECK (YAGONA MANBA)
-        # ==============================
-        if not check_payme_auth(request):
-            return JsonResponse({
-                "jsonrpc": "2.0",
-                "error": {
-                    "code": -32504,
-                    "message": "Insufficient privileges"
-                },
-                "id": request_id
-            }, status=200)
-
-        # ==============================
-        # 3. METHOD ROUTING
-        # ==============================
-        if method == "CheckPerformTransaction":
-            result = check_perform_transaction(params)
-
-        elif method == "CreateTransaction":
-            result = create_transaction(params)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"📥 Payme METHOD: {method} PARAMS: {params}")
 
-        elif method == "PerformTransaction":
-            result = perform_transaction(params)
+    # ==============================
+    # 2. AUTH CHECK (YAGONA MANBA)
+    # ==============================
+    if not check_payme_auth(request):
+        return request_id, method, params, _jsonrpc_response(request_id, payme_dispatch.error(
+            payme_dispatch.ERROR_INSUFFICIENT_PRIVILEGES, "Insufficient privileges"
+        ))
 
-        elif method == "CancelTransaction":
-            result = cancel_transaction(params)
+    return request_id, method, params, None
 
-        elif method == "CheckTransaction":
-            result = check_transaction(params)
 
-        elif method == "GetStatement":
-            result = get_statement(params)
+@csrf_exempt
+@require_http_methods(["POST"])
+def payme_callback(request):
+    """
+    Payme Merchant API callback handler
+    ⚠️ Payme talabiga ko‘ra HAR DOIM HTTP 200
+    """
+    request_id = None
 
-        elif method == "ChangePassword":
-            result = change_password(params)
+    try:
+        request_id, method, params, error_response = _parse_payme_request(request)
+        if error_response is not None:
+            return error_response
 
-        else:
-            return JsonResponse({
-                "jsonrpc": "2.0",
-                "error": {"code": -32601, "message": "Method not found"},
-                "id": request_id
-            }, status=200)
+        # ==============================
+        # 3. METHOD DISPATCH (payme_dispatch.METHODS jadvali)
+        # ==============================
+        result = payme_dispatch.dispatch(method, params)
 
         # ==============================
         # 4. FINAL RESPONSE
         # ==============================
-        if "error" in result:
-            return JsonResponse({
-                "jsonrpc": "2.0",
-                "error": result["error"],
-                "id": request_id
-            }, status=200)
-
-        return JsonResponse({
-            "jsonrpc": "2.0",
-            "result": result,
-            "id": request_id
-        }, status=200)
+        if method == "GetStatement" and "error" not in result:
+            # Birinchi batch (DB so'rovi) javobdan oldin o'qiladi - xato bo'lsa pastda -32400
+            return StreamingHttpResponse(
+                stream_jsonrpc_result(request_id, "transactions", result["transactions"]),
+                content_type="application/json",
+                status=200
+            )
+
+        return _jsonrpc_response(request_id, result)
 
     except Exception:
         logger.exception("❌ PAYME CALLBACK FATAL ERROR")
-        return JsonResponse({
-            "jsonrpc": "2.0",
-            "error": {"code": -32400, "message": "Internal error"},
-            "id": request_id
-        }, status=200)
+        return _jsonrpc_response(request_id, payme_dispatch.error(payme_dispatch.ERROR_INTERNAL, "Internal error"))
 
 
+@payme_method("CheckPerformTransaction", amount=NUMBER, account=OBJECT)
 def check_perform_transaction(params):
     """
     CheckPerformTransaction - To'lov ruxsatini tekshirish.
@@ -366,6 +514,7 @@ def check_perform_transaction(params):
         return {"error": {"code": -31050, "message": "Order not found"}}
 
 
+@payme_method("CreateTransaction", id=STRING, time=INTEGER, amount=NUMBER, account=OBJECT)
 def create_transaction(params):
     """
     CreateTransaction - Tranzaksiyani yaratish yoki mavjudini qaytarish.
@@ -403,11 +552,22 @@ def create_transaction(params):
     if sum_to_tiyin(payment.amount) != int(amount_tiyin):
         return {"error": {"code": -31001, "message": "Incorrect amount"}}
 
-    # 5. Hammasi to'g'ri bo'lsa, tranzaksiya ma'lumotlarini saqlaymiz
+    # 5. Tranzaksiyani biriktirish - shartli UPDATE: faqat buyurtma hali CREATED va
+    # bo'sh (yoki shu tranzaksiyaniki) bo'lsa. Parallel CreateTransaction (boshqa id)
+    # yoki reaper/CancelTransaction ulgurgan bo'lsa - hech narsa yozilmaydi.
+    attached = Payment.objects.filter(
+        models.Q(payme_transaction_id__isnull=True) | models.Q(payme_transaction_id=transaction_id),
+        pk=payment.pk, state=Payment.STATE_CREATED,
+    ).update(payme_transaction_id=transaction_id, payme_create_time=transaction_time)
+    if not attached:
+        payment.refresh_from_db(fields=['payme_transaction_id', *Payment.TRANSITION_FIELDS])
+        if payment.payme_transaction_id and payment.payme_transaction_id != transaction_id:
+            return {"error": {"code": -31099, "message": "Order has another transaction"}}
+        return {"error": {"code": -31008, "message": "Order is not available for payment"}}
+
     payment.payme_transaction_id = transaction_id
     payment.payme_create_time = transaction_time
-    payment.state = Payment.STATE_CREATED
-    payment.save()
+    payment.send_saved(['payme_transaction_id', 'payme_create_time'])
 
     return {
         "create_time": payment.payme_create_time,
@@ -419,47 +579,46 @@ def create_transaction(params):
     }
 
 
+@payme_method("PerformTransaction", id=STRING)
 def perform_transaction(params):
+    """
+    PerformTransaction - CREATED -> COMPLETED (Payment.transition, qator qulfisiz).
+    Parallel Perform/Cancel dan faqat bittasi o'tadi; yutqazgan so'rov DB dagi
+    holat bo'yicha javob beradi.
+    """
     payme_id = params.get('id')
-    print(f"--- PAYME_CALLBACK: PerformTransaction chaqirildi. ID: {payme_id} ---")
 
     try:
-        with db_transaction.atomic():
-            # select_for_update orqali qulflash
-            payment = Payment.objects.select_for_update().get(payme_transaction_id=payme_id)
-            print(f"--- DEBUG: To'lov topildi. OrderID: {payment.order_id}, Hozirgi holati: {payment.state} ---")
-
-            if payment.state == Payment.STATE_CREATED:
-                print(f"--- DEBUG: perform() metodi chaqirilmoqda... ---")
-                success = payment.perform()
-                print(f"--- DEBUG: perform() yakunlandi. Natija: {success} ---")
-
-                if not success:
-                    return {"error": {"code": -31008, "message": "Cannot perform transaction"}}
-
-            if payment.state == Payment.STATE_COMPLETED:
-                print(f"--- DEBUG: To'lov muvaffaqiyatli yakunlangan. Javob yuborilmoqda. ---")
-                return {
-                    "transaction": payment.payme_transaction_id,
-                    "perform_time": int(payment.performed_at.timestamp() * 1000),
-                    "state": payment.state
-                }
-            else:
-                print(f"--- DEBUG: To'lov holati COMPLETED emas: {payment.state} ---")
-                return {"error": {"code": -31008, "message": "Transaction state is invalid"}}
+        payment = Payment.objects.get(payme_transaction_id=payme_id)
+
+        if payment.state == Payment.STATE_CREATED:
+            # Balans va outbox hodisasi shu UPDATE tranzaksiyasida; bot xabarnomasi
+            # dispatch_outbox orqali - Payme javobi uni kutmaydi
+            payment.perform()
+
+        if payment.state == Payment.STATE_COMPLETED:
+            return {
+                "transaction": payment.payme_transaction_id,
+                "perform_time": int(payment.performed_at.timestamp() * 1000),
+                "state": payment.state
+            }
+        else:
+            logger.debug(f"To'lov holati COMPLETED emas: {payment.state}")
+            return {"error": {"code": -31008, "message": "Transaction state is invalid"}}
 
     except Payment.DoesNotExist:
-        print(f"--- DEBUG: XATO! Tranzaksiya ID topilmadi: {payme_id} ---")
         return {"error": {"code": -31003, "message": "Transaction not found"}}
     except Exception as e:
-        print(f"--- DEBUG: FATAL ERROR: {str(e)} ---")
         logger.error(f"PerformTransaction Error: {e}", exc_info=True)
         return {"error": {"code": -32400, "message": "Internal error during perform"}}
 
 
+@payme_method("CancelTransaction", id=STRING, reason=INTEGER)
 def cancel_transaction(params):
     """
     CancelTransaction - Tranzaksiyani bekor qilish.
+    CREATED -> CANCELLED, COMPLETED -> CANCELLED_AFTER_COMPLETE (balansdan qaytarish
+    bilan). Parallel PerformTransaction ulgurgan bo'lsa, yangi holatdan qayta urinadi.
     """
     payme_id = params.get('id')
     reason = params.get('reason')
@@ -467,28 +626,12 @@ def cancel_transaction(params):
     try:
         payment = Payment.objects.get(payme_transaction_id=payme_id)
 
-        # 1. Allaqachon bekor qilingan bo'lsa (Idempotent)
-        if payment.state in [Payment.STATE_CANCELLED, Payment.STATE_CANCELLED_AFTER_COMPLETE]:
-            return {
-                "transaction": payment.payme_transaction_id,
-                "cancel_time": int(payment.cancelled_at.timestamp() * 1000),
-                "state": payment.state
-            }
-
-        # 2. Bekor qilish mantiqi
-        if payment.state == Payment.STATE_CREATED:
-            payment.state = Payment.STATE_CANCELLED
-        elif payment.state == Payment.STATE_COMPLETED:
-            # To'lov bajarilgandan keyin bekor bo'lsa, balansdan ayiramiz
-            payment.state = Payment.STATE_CANCELLED_AFTER_COMPLETE
-            if payment.user.balance >= payment.pricing_count:
-                payment.user.balance -= payment.pricing_count
-                payment.user.save()
-
-        payment.cancelled_at = timezone.now()
-        payment.reason = reason
-        payment.save()
+        # Har urinish holatni bir qadam oldinga siljitadi - sikl cheklangan
+        while payment.state in (Payment.STATE_CREATED, Payment.STATE_COMPLETED):
+            if payment.cancel(reason):
+                break
 
+        # Bekor qilingan (shu yoki oldingi so'rovda) - idempotent javob
         return {
             "transaction": payment.payme_transaction_id,
             "cancel_time": int(payment.cancelled_at.timestamp() * 1000),
@@ -499,6 +642,7 @@ def cancel_transaction(params):
         return {"error": {"code": -31003, "message": "Transaction not found"}}
 
 
+@payme_method("CheckTransaction", id=STRING)
 def check_transaction(params):
     """
     CheckTransaction - Tranzaksiya holatini tekshirish.
@@ -520,45 +664,59 @@ def check_transaction(params):
         return {"error": {"code": -31003, "message": "Transaction not found"}}
 
 
+STATEMENT_CHUNK_SIZE = 2000
+
+
+@payme_method("GetStatement", **{"from": INTEGER, "to": INTEGER})
 def get_statement(params):
-    """GetStatement - To'lovlar hisoboti"""
-    try:
-        from_time = params.get('from')
-        to_time = params.get('to')
+    """
+    GetStatement - To'lovlar hisoboti.
+    transactions - lazy iterator: payme_callback uni oqim (stream) qilib yuboradi.
+    """
+    from_time = params['from']
+    to_time = params['to']
 
-        logger.info(f"📊 GetStatement: from={from_time}, to={to_time}")
+    logger.info(f"📊 GetStatement: from={from_time}, to={to_time}")
 
-        from_datetime = timezone.datetime.fromtimestamp(from_time / 1000)
-        to_datetime = timezone.datetime.fromtimestamp(to_time / 1000)
+    from_datetime = datetime.fromtimestamp(from_time / 1000, tz=dt_timezone.utc)
+    to_datetime = datetime.fromtimestamp(to_time / 1000, tz=dt_timezone.utc)
 
-        payments = Payment.objects.filter(
-            created_at__gte=from_datetime,
-            created_at__lte=to_datetime,
-            payme_transaction_id__isnull=False
-        )
+    return {'transactions': _statement_rows(from_datetime, to_datetime)}
 
-        transactions = []
-        for payment in payments:
-            transactions.append({
-                'id': payment.payme_transaction_id,
-                'time': int(payment.created_at.timestamp() * 1000),
-                'amount': sum_to_tiyin(payment.amount),
-                'account': {'order_id': str(payment.order_id), 'telegram_id': payment.user.telegram_id},
-                'create_time': int(payment.created_at.timestamp() * 1000),
-                'perform_time': int(payment.performed_at.timestamp() * 1000) if payment.performed_at else 0,
-                'cancel_time': int(payment.cancelled_at.timestamp() * 1000) if payment.cancelled_at else 0,
-                'transaction': str(payment.id),
-                'state': payment.state,
-                'reason': payment.reason
-            })
-
-        return {'transactions': transactions}
 
-    except Exception as e:
-        logger.error(f"❌ GetStatement error: {e}", exc_info=True)
-        return {'error': {'code': -32400, 'message': str(e)[:100]}}
+def _statement_rows(from_datetime, to_datetime):
+    """
+    payments_statement_idx bo'yicha, user JOIN bilan, bo'laklab o'qish.
+    Replikadan - davr oxiri sticky oynasidan eski bo'lsa (generator javob
+    oqimida o'qiladi, shuning uchun reading() emas, aniq using())
+    """
+    rows = Payment.objects.using(replicas.pick(newest=to_datetime)).filter(
+        created_at__gte=from_datetime,
+        created_at__lte=to_datetime,
+        payme_transaction_id__isnull=False
+    ).order_by('created_at', 'id').values_list(
+        'id', 'payme_transaction_id', 'order_id', 'amount', 'state', 'reason',
+        'created_at', 'performed_at', 'cancelled_at', 'user__telegram_id',
+    )
+
+    for (pk, payme_id, order_id, amount, state, reason,
+         created_at, performed_at, cancelled_at, telegram_id) in rows.iterator(chunk_size=STATEMENT_CHUNK_SIZE):
+        create_time = int(created_at.timestamp() * 1000)
+        yield {
+            'id': payme_id,
+            'time': create_time,
+            'amount': sum_to_tiyin(amount),
+            'account': {'order_id': str(order_id), 'telegram_id': telegram_id},
+            'create_time': create_time,
+            'perform_time': int(performed_at.timestamp() * 1000) if performed_at else 0,
+            'cancel_time': int(cancelled_at.timestamp() * 1000) if cancelled_at else 0,
+            'transaction': str(pk),
+            'state': state,
+            'reason': reason
+        }
 
 
+@payme_method("ChangePassword", password=STRING)
 def change_password(params):
     global PAYME_RUNTIME_SECRET
 
@@ -618,37 +776,342 @@ def check_last_payment_status(request, telegram_id):
         return Response({'success': False, 'error': str(e)}, status=500)
 
 
+def _user_page(request, telegram_id, page, allowed_fields):
+    """?cursor=&limit=&fields= -> sahifa javobi (user_history)"""
+    params = request.query_params
+    try:
+        before = user_history.decode_cursor(params.get('cursor'))
+        limit = user_history.parse_limit(params.get('limit'))
+        fields = user_history.parse_fields(params.get('fields'), allowed_fields)
+    except user_history.PageError as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    user_id = BotUser.objects.filter(telegram_id=telegram_id).values_list('id', flat=True).first()
+    if user_id is None:
+        return Response({'success': False, 'error': 'Foydalanuvchi topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'success': True, 'telegram_id': telegram_id, **page(user_id, before, limit, fields)})
+
+
+@api_view(['GET'])
+def user_payments(request, telegram_id):
+    """Foydalanuvchi to'lovlari, yangisi birinchi: ?cursor=&limit=20&fields=order_id,state,..."""
+    return _user_page(request, telegram_id, user_history.payments_page, user_history.PAYMENT_FIELDS)
+
+
+@api_view(['GET'])
+def user_pricing_history(request, telegram_id):
+    """Foydalanuvchi narxlagan telefonlar (arxivlangan oylar bilan), yangisi birinchi"""
+    return _user_page(request, telegram_id, user_history.history_page, user_history.HISTORY_FIELDS)
+
+
 @api_view(['GET'])
 def check_payment_status(request, order_id):
-    """To'lov holatini tekshirish ORDER_ID orqali"""
+    """To'lov holatini tekshirish ORDER_ID orqali (replikadan)"""
     try:
-        payment = Payment.objects.filter(order_id=order_id).first()
+        with replicas.reading(replicas.order_scope(order_id)) as reads:
+            payment = _fetch_payment(order_id)
+        if not payment and reads.used_replica:
+            # Boshqa workerda hozirgina yaratilgan buyurtma replikaga yetib kelmagan bo'lishi mumkin
+            payment = _fetch_payment(order_id)
 
         if not payment:
             return Response({'success': False, 'error': 'Payment not found', 'has_payment': False},
                             status=status.HTTP_404_NOT_FOUND)
 
-        user = payment.user
-
-        return Response({
-            'success': True,
-            'has_payment': True,
-            'payment_id': payment.id,
-            'order_id': str(payment.order_id),
-            'state': payment.state,
-            'state_display': payment.get_state_display(),
-            'amount': float(payment.amount),
-            'count': payment.pricing_count,
-            'balance': user.balance,
-            'created_at': payment.created_at.isoformat(),
-            'performed_at': payment.performed_at.isoformat() if payment.performed_at else None,
-            'cancelled_at': payment.cancelled_at.isoformat() if payment.cancelled_at else None,
-            'tariff_name': payment.tariff.name if payment.tariff else None,
-            'payme_transaction_id': payment.payme_transaction_id or None
-        })
+        return Response(_payment_status_data(payment))
 
     except Exception as e:
         logger.error(f"Check payment status error: {e}", exc_info=True)
         return Response({'success': False, 'error': str(e), 'has_payment': False},
                         status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+SSE_KEEPALIVE = 15
+
+
+def _fetch_payment(order_id):
+    return Payment.objects.select_related('user', 'tariff').filter(order_id=order_id).first()
+
+
+def _wait_params(request, payment, max_timeout):
+    """
+    Query params: state (mijoz bilgan holat, default - joriy), timeout (sekund).
+    Qaytaradi: (known_state, timeout). Noto'g'ri qiymatda ValueError.
+    """
+    known_state = int(request.GET['state']) if 'state' in request.GET else payment.state
+    timeout = float(request.GET.get('timeout', max_timeout))
+    if not 0 <= timeout <= max_timeout:
+        timeout = max_timeout
+    return known_state, timeout
+
+
+def _sse_event(data):
+    return f"event: state\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+
+
+def _sse_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx buferlamasin
+    return response
+
+
+@api_view(['GET'])
+def wait_payment_status(request, order_id):
+    """
+    Long-poll WSGI da yo'q: sync workerni 25 s band qilish uni uyg'otadigan Payme
+    callbacklarini navbatda qoldiradi. Joriy holat darhol qaytariladi, `retry_after`
+    (va Retry-After) - qayta so'rash oralig'i. Haqiqiy long-poll - API_ASYNC=True.
+    """
+    try:
+        payment = _fetch_payment(order_id)
+        if not payment:
+            return Response({'success': False, 'error': 'Payment not found', 'has_payment': False},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            known_state, _ = _wait_params(request, payment, settings.PAYMENT_WAIT_TIMEOUT)
+        except ValueError:
+            return Response({'success': False, 'error': 'state/timeout noto\'g\'ri'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        retry_after = settings.PAYMENT_POLL_INTERVAL
+        response = Response(dict(
+            _payment_status_data(payment), changed=payment.state != known_state, retry_after=retry_after,
+        ))
+        response['Retry-After'] = str(retry_after)
+        return response
+
+    except Exception as e:
+        logger.error(f"Wait payment status error: {e}", exc_info=True)
+        return Response({'success': False, 'error': str(e), 'has_payment': False},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_http_methods(["GET"])
+def payment_status_events(request, order_id):
+    """SSE faqat API_ASYNC=True da - WSGI da oqim butun workerni 300 s gacha band qiladi"""
+    retry_after = settings.PAYMENT_POLL_INTERVAL
+    response = JsonResponse({
+        'success': False,
+        'error': "SSE faqat API_ASYNC=True (ASGI) rejimida - holatni so'rab turing",
+        'poll_url': reverse('payments:wait_payment_status', args=[order_id]),
+        'retry_after': retry_after,
+    }, status=501)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+# ============= ICHKI STATISTIKA =============
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """Keshlar statistikasi (faqat admin)"""
+    return Response({'success': True, 'balance_cache': balance_cache.stats()})
+
+
+def _report_range(request):
+    """?from=YYYY-MM-DD&to=YYYY-MM-DD (default oxirgi 30 kun). Xato bo'lsa ValueError"""
+    start = request.query_params.get('from')
+    end = request.query_params.get('to')
+    start, end = rollups.report_range(
+        date.fromisoformat(start) if start else None,
+        date.fromisoformat(end) if end else None,
+    )
+    if start > end or (end - start).days > 366:
+        raise ValueError
+    return start, end
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def usage_stats(request):
+    """Kunlik narxlash statistikasi (rollup jadvalidan). ?telegram_id= - bitta foydalanuvchi"""
+    try:
+        start, end = _report_range(request)
+    except ValueError:
+        return Response({'success': False, 'error': "from/to: YYYY-MM-DD, oraliq 366 kundan oshmasin"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    user_id = None
+    telegram_id = request.query_params.get('telegram_id')
+    if telegram_id:
+        user_id = BotUser.objects.filter(telegram_id=telegram_id).values_list('id', flat=True).first()
+        if user_id is None:
+            return Response({'success': False, 'error': 'Foydalanuvchi topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+
+    days, total = rollups.usage_report(start, end, user_id)
+    return Response({
+        'success': True,
+        'from': start,
+        'to': end,
+        'days': days,
+        'total': total,
+        'updated_at': rollups.freshness().get(rollups.PRICING),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def revenue_stats(request):
+    """Kunlik tushum tariflar bo'yicha (rollup jadvalidan)"""
+    try:
+        start, end = _report_range(request)
+    except ValueError:
+        return Response({'success': False, 'error': "from/to: YYYY-MM-DD, oraliq 366 kundan oshmasin"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    days, totals = rollups.revenue_report(start, end)
+    return Response({
+        'success': True,
+        'from': start,
+        'to': end,
+        'days': days,
+        'tariffs': totals,
+        'updated_at': rollups.freshness().get(rollups.PAYMENT_EVENTS),
+    })
+
+
+SEARCH_API_LIMIT = 100
+
+
+def _search_results(kind, refs):
+    """Indeks ref lari -> javob qatorlari (indeks tartibida)"""
+    if kind == search_index.KIND_PHONE_MODEL:
+        return [{'phone_model': ref} for ref in refs]
+
+    ids = [int(ref) for ref in refs]
+    if kind == search_index.KIND_USER:
+        rows = BotUser.objects.filter(pk__in=ids).values(
+            'id', 'telegram_id', 'full_name', 'username', 'phone', 'balance', 'is_active')
+    else:
+        rows = Payment.objects.filter(pk__in=ids).values(
+            'id', 'order_id', 'payme_transaction_id', 'user__telegram_id', 'amount', 'state', 'created_at')
+    by_id = {row.pop('id'): row for row in rows}
+    results = []
+    for pk in ids:
+        row = by_id.get(pk)
+        if row is None:
+            continue
+        if kind == search_index.KIND_PAYMENT:
+            row['telegram_id'] = row.pop('user__telegram_id')
+            row['amount'] = str(row['amount'])
+        results.append(row)
+    return results
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def search(request):
+    """Qidiruv indeksi bo'yicha: ?q=...&kind=user|payment|phone_model&limit= (default 20)"""
+    query = request.query_params.get('q', '')
+    kind = request.query_params.get('kind', search_index.KIND_USER)
+    if kind not in search_index.KINDS:
+        return Response({'success': False, 'error': f"kind: {', '.join(search_index.KINDS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not search_index.is_searchable(query):
+        return Response({'success': False,
+                         'error': f"q: har bir so'z kamida {search_index.MIN_TERM_LENGTH} belgi"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), SEARCH_API_LIMIT)
+    except ValueError:
+        return Response({'success': False, 'error': 'limit butun son bo\'lishi kerak'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    refs = search_index.search(kind, query, limit)
+    results = _search_results(kind, refs)
+    return Response({'success': True, 'kind': kind, 'query': query, 'count': len(results), 'results': results})
+
+
+# ============= EKSPORT (admin) =============
+
+def _export_params(request):
+    """
+    ?fmt=csv|jsonl&gzip=1 va oraliq: ?month=YYYY-MM yoki ?from=YYYY-MM-DD&to=YYYY-MM-DD
+    (ikkala kun ham kiradi). Oraliqsiz - hammasi. Qaytaradi: (fmt, gzip, start, end, nom).
+    Xato bo'lsa ValueError
+    """
+    params = request.query_params
+    fmt = params.get('fmt', exports.CSV)
+    if fmt not in exports.FORMATS:
+        raise ValueError(f"fmt: {', '.join(exports.FORMATS)}")
+    compress = params.get('gzip', '') in ('1', 'true')
+
+    month, start_day, end_day = params.get('month'), params.get('from'), params.get('to')
+    try:
+        if month:
+            start = history_archive.month_start(datetime.strptime(month, '%Y-%m'))
+            return fmt, compress, start, history_archive.add_months(start, 1), month
+        start = timezone.make_aware(datetime.fromisoformat(start_day)) if start_day else None
+        end = timezone.make_aware(datetime.fromisoformat(end_day)) + timedelta(days=1) if end_day else None
+    except ValueError:
+        raise ValueError("month: YYYY-MM, from/to: YYYY-MM-DD")
+    if start and end and start >= end:
+        raise ValueError("from, to dan keyin bo'lmasin")
+    return fmt, compress, start, end, f"{start_day or 'start'}_{end_day or 'now'}"
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_payments(request):
+    """To'lovlar eksporti (oqim). ?state= - faqat shu holatdagilar"""
+    try:
+        fmt, compress, start, end, label = _export_params(request)
+        queryset = Payment.objects.all()
+        state = request.query_params.get('state')
+        if state:
+            queryset = queryset.filter(state=int(state))
+    except ValueError as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = exports.payment_rows(queryset, start, end)
+    return exports.streaming_response(rows, exports.PAYMENT_COLUMNS, fmt, compress, f'payments-{label}')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_pricing_history(request):
+    """Narxlash tarixi eksporti (oqim), arxivlangan oylar bilan. ?telegram_id= - bitta foydalanuvchi"""
+    try:
+        fmt, compress, start, end, label = _export_params(request)
+    except ValueError as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    user_id = None
+    telegram_id = request.query_params.get('telegram_id')
+    if telegram_id:
+        user_id = BotUser.objects.filter(telegram_id=telegram_id if telegram_id.isdigit() else 0) \
+            .values_list('id', flat=True).first()
+        if user_id is None:
+            return Response({'success': False, 'error': 'Foydalanuvchi topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+
+    rows = exports.history_rows(start=start, end=end, user_id=user_id, include_archive=True)
+    return exports.streaming_response(rows, exports.HISTORY_COLUMNS, fmt, compress, f'pricing-history-{label}')
+
+
+def _internal_request(request):
+    """To'g'ridan-to'g'ri ichki tarmoqdan (proxy orqali emas) kelgan so'rov"""
+    if 'HTTP_X_FORWARDED_FOR' in request.META or 'HTTP_X_REAL_IP' in request.META:
+        return False
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private
+
+
+def metrics_view(request):
+    """
+    Prometheus metrikalari (barcha workerlar yig'indisi).
+    METRICS_TOKEN bo'lsa - Bearer token; bo'lmasa faqat ichki tarmoqdan
+    to'g'ridan-to'g'ri (nginx orqali emas) so'rovlar, qolganiga 403.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not _internal_request(request):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')